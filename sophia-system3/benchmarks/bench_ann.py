@@ -0,0 +1,80 @@
+"""
+bench_ann.py - IVF approximate search vs. brute force: latency and recall@k
+
+Builds a vector sidecar of N synthetic embeddings (a mixture of Gaussian
+clusters, like topic-clustered episode embeddings), trains the IVF index
+and times held-out queries at several nprobe settings. Recall@k is the
+fraction of the exact top k that the approximate search returns.
+
+Usage:
+    python benchmarks/bench_ann.py [--rows 100000] [--dim 384] [--queries 200]
+        [--k 10] [--nprobe 1,2,4,8,16,32,64] [--clusters 200] [--noise 1.5]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from lib.vector_store import VectorStore
+
+
+def synthetic(rows: int, dim: int, clusters: int, noise: float, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim))
+    labels = rng.integers(0, clusters, rows)
+    return (centers[labels] + noise * rng.standard_normal((rows, dim))).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.5,
+                        help="Spread within a topic cluster (centers have unit variance)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = synthetic(args.rows + args.queries, args.dim, args.clusters, args.noise, rng)
+    matrix, queries = data[:args.rows], data[args.rows:]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(Path(tmp) / "vectors")
+        store.rebuild((f"ep_{i}", row) for i, row in enumerate(matrix.tolist()))
+
+        start = time.perf_counter()
+        nlist = store.train_ann()
+        train = time.perf_counter() - start
+        print(f"N={args.rows} d={args.dim} nlist={nlist} train={train:.1f}s")
+
+        store.search(queries[0], args.k, exact=True)  # Warm up norms
+        start = time.perf_counter()
+        exact = [{i for i, _ in store.search(q, args.k, exact=True)} for q in queries]
+        brute = (time.perf_counter() - start) / len(queries) * 1000
+        print(f"{'brute force':<12} {brute:>8.2f} ms  recall@{args.k} 1.000")
+
+        with patch.dict('lib.vector_store.ANN_CONFIG', {"min_vectors": 1}):
+            store.search(queries[0], args.k)  # Warm up cluster lists
+            for nprobe in (int(n) for n in args.nprobe.split(",")):
+                start = time.perf_counter()
+                found = [store.search(q, args.k, nprobe=nprobe) for q in queries]
+                ms = (time.perf_counter() - start) / len(queries) * 1000
+                recall = np.mean([
+                    len(truth & {i for i, _ in hits}) / args.k
+                    for truth, hits in zip(exact, found)
+                ])
+                print(f"nprobe={nprobe:<5} {ms:>8.2f} ms  recall@{args.k} {recall:.3f}  "
+                      f"{brute / ms:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+bench_codec.py - Compare JSON codecs on episode and index payloads
+
+Usage:
+    python benchmarks/bench_codec.py [--episodes N]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib.codec import available_codecs
+from payloads import make_corpus, make_index_entry
+
+
+def bench(func, number: int) -> float:
+    """Best-of-3 milliseconds per call."""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--episodes", type=int, default=1000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.episodes)
+    payloads = {
+        "episode (100 actions)": (corpus[0], 200),
+        f"index ({args.episodes} entries)": (
+            {"last_updated": "", "total_episodes": len(corpus),
+             "entries": [make_index_entry(e) for e in reversed(corpus)]},
+            5,
+        ),
+    }
+
+    print(f"{'payload':<24} {'codec':<8} {'format':<8} {'bytes':>9} "
+          f"{'dump ms':>9} {'load ms':>9}")
+    for label, (data, number) in payloads.items():
+        for codec in available_codecs():
+            for pretty in (True, False):
+                raw = codec.dumps(data, pretty=pretty)
+                dump_ms = bench(lambda: codec.dumps(data, pretty=pretty), number)
+                load_ms = bench(lambda: codec.loads(raw), number)
+                fmt = "pretty" if pretty else "compact"
+                print(f"{label:<24} {codec.name:<8} {fmt:<8} {len(raw):>9} "
+                      f"{dump_ms:>9.3f} {load_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
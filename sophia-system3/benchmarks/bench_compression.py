@@ -0,0 +1,69 @@
+"""
+bench_compression.py - On-disk size and read latency per compression method
+
+Writes a synthetic corpus through storage.write_episode (and one archive
+segment) under a temporary ~/.sophia for each method, then times reads.
+
+Usage:
+    python benchmarks/bench_compression.py [--episodes N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import compression, storage
+from lib.models import Episode
+from payloads import make_corpus, make_index_entry
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--episodes", type=int, default=1000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.episodes)
+    episodes = [Episode.model_validate(e) for e in corpus]
+    ids = [e.id for e in episodes]
+    segment = [make_index_entry(e) for e in reversed(corpus[:500])]
+
+    methods = ["none", "gzip"] + (["zstd"] if compression.zstd_available() else [])
+
+    print(f"{'method':<6} {'episode MB':>11} {'ratio':>6} {'archive KB':>11} "
+          f"{'read_json ms':>13} {'read_episodes s':>16}")
+    baseline = None
+    for method in methods:
+        with tempfile.TemporaryDirectory() as home:
+            os.environ["HOME"] = home
+            storage.clear_read_cache()
+            storage.save_config({"compression": method})
+            for episode in episodes:
+                storage.write_episode(episode)
+            archive_path = Path(home) / ".sophia" / "episodes" / "archive" / "seg_000001.json"
+            storage.write_json(archive_path, segment, file_type="archive")
+
+            episodes_dir = Path(home) / ".sophia" / "episodes"
+            paths = [episodes_dir / f"{i}.json" for i in ids]
+            size = sum(p.stat().st_size for p in paths)
+            baseline = baseline or size
+
+            start = time.perf_counter()
+            for path in paths:
+                storage.read_json(path)
+            per_read = (time.perf_counter() - start) / len(paths) * 1000
+
+            start = time.perf_counter()
+            storage.read_episodes(ids, use_processes=False)
+            bulk = time.perf_counter() - start
+
+            print(f"{method:<6} {size / 1e6:>11.2f} {baseline / size:>6.1f} "
+                  f"{archive_path.stat().st_size / 1e3:>11.1f} {per_read:>13.3f} {bulk:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+bench_durability.py - write_json latency per durability mode, with and
+without batch_writes()
+
+Simulates a reflection pass: the self model, the rule set and a handful of
+agent results written back to back. batch_writes() only defers the
+directory fsyncs of "fsync-file+dir"; the batched rows of the other modes
+show it makes no difference there.
+
+Usage:
+    python benchmarks/bench_durability.py [--passes N] [--dir PATH]
+
+Pass --dir on the filesystem that holds ~/.sophia; fsync cost depends on it.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import storage
+from lib.models import SelfModel, SemanticRule
+
+
+def reflection_pass(i: int, model: SelfModel, rules) -> None:
+    storage.save_self_model(model)
+    storage.save_semantic_rules(rules)
+    for j in range(4):
+        storage.save_agent_result(f"task_{i}_{j}", {"status": "ok", "pass": i})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--passes", type=int, default=50)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    model = SelfModel()
+    rules = [
+        SemanticRule(trigger_concept=f"concept {i}", rule_content="Check the logs first " * 5)
+        for i in range(50)
+    ]
+
+    print(f"{'mode':<16} {'batched':<8} {'ms/pass':>9} {'ms/file':>9}")
+    for mode in storage.DURABILITY_MODES:
+        for batched in (False, True):
+            with tempfile.TemporaryDirectory(dir=args.dir) as home:
+                os.environ["HOME"] = home
+                storage.clear_read_cache()
+                storage.ensure_sophia_dir()
+                storage.save_config({"durability": mode})
+
+                start = time.perf_counter()
+                for i in range(args.passes):
+                    if batched:
+                        with storage.batch_writes():
+                            reflection_pass(i, model, rules)
+                    else:
+                        reflection_pass(i, model, rules)
+                per_pass = (time.perf_counter() - start) / args.passes * 1000
+
+                print(f"{mode:<16} {str(batched):<8} {per_pass:>9.2f} {per_pass / 6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+bench_embedding_cache.py - Re-embedding with and without the embedding
+cache
+
+A simulated provider stands in for a real one: each call costs a fixed
+latency plus a per-text cost (defaults roughly match a remote API). Runs
+an "index" pass over N texts, then a re-index of the same texts with a
+share of new ones mixed in, and reports time per pass, provider calls
+and the cache hit rate. Also compares the float32 blob size with the
+same vector as JSON.
+
+Usage:
+    python benchmarks/bench_embedding_cache.py [--texts 2000] [--dimension 1536]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import embedding_cache, storage
+from lib.embeddings import EmbeddingManager, EmbeddingProvider
+from lib.vector_store import pack_vector
+
+
+class SimulatedProvider(EmbeddingProvider):
+    name = "simulated"
+
+    def __init__(self, dimension: int, call_ms: float, text_ms: float):
+        self.dimension_ = dimension
+        self.call_ms = call_ms
+        self.text_ms = text_ms
+        self.calls = 0
+        self.texts = 0
+
+    @property
+    def model_id(self) -> str:
+        return f"sim-{self.dimension_}"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def embed(self, text):
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep((self.call_ms + self.text_ms * len(texts)) / 1000)
+        rng = random.Random(hash(tuple(texts)))
+        return [[rng.random() for _ in range(self.dimension_)] for _ in texts]
+
+
+def embed_all(manager, texts, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        manager.embed_batch(texts[i:i + batch_size])
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--new", type=float, default=0.1, help="Share of new texts on re-index")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--call-ms", type=float, default=20.0)
+    parser.add_argument("--text-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    texts = [f"Episode {i}: deploy service {i % 97} and fix flaky test {i % 13}" for i in range(args.texts)]
+    new_count = int(args.texts * args.new)
+    reindex = texts[new_count:] + [f"New episode {i}" for i in range(new_count)]
+
+    provider = SimulatedProvider(args.dimension, args.call_ms, args.text_ms)
+    rows = []
+    with tempfile.TemporaryDirectory() as home, \
+            patch.object(EmbeddingManager, 'get_provider', return_value=provider):
+        os.environ["HOME"] = home
+        storage.ensure_sophia_dir()
+        manager = EmbeddingManager()
+
+        for label, enabled in [("no cache", False), ("cache", True)]:
+            with patch.dict(embedding_cache.EMBEDDING_CONFIG, {"cache": enabled}):
+                for phase, batch in [("index", texts), ("re-index", reindex)]:
+                    provider.calls = provider.texts = 0
+                    elapsed = embed_all(manager, batch, args.batch_size)
+                    rows.append((label, phase, elapsed, provider.calls, provider.texts))
+                stats = embedding_cache.embedding_cache_stats() if enabled else None
+
+    print(f"{args.texts} texts, dimension {args.dimension}, batches of {args.batch_size}, "
+          f"{args.call_ms:g} ms/call + {args.text_ms:g} ms/text")
+    print(f"{'':>9} {'pass':>9} {'ms':>9} {'calls':>6} {'texts sent':>11}")
+    for label, phase, elapsed, calls, sent in rows:
+        print(f"{label:>9} {phase:>9} {elapsed:>9.0f} {calls:>6} {sent:>11}")
+    print(f"hit rate {stats['hit_rate']:.2f} ({stats['hits']} hits, {stats['misses']} misses), "
+          f"{stats['entries']} entries")
+
+    vector = [random.random() for _ in range(args.dimension)]
+    print(f"vector: float32 blob {len(pack_vector(vector))} bytes, JSON {len(json.dumps(vector))} bytes")
+
+
+if __name__ == "__main__":
+    main()
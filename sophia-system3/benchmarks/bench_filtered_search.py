@@ -0,0 +1,105 @@
+"""
+bench_filtered_search.py - Filtered recall: search then filter vs. the
+secondary indexes
+
+Builds a live index of N entries spread over a year, with random outcomes
+and tools, and runs "FAILURE episodes in the last 30 days that used Bash"
+style queries. The baseline scores every match and drops the ones failing
+the filter afterwards (what agents did with the results); the filtered
+search intersects the secondary indexes first and scores only the
+selected entries. Also times listing the matching entries without a
+query against a scan of the index.
+
+Usage:
+    python benchmarks/bench_filtered_search.py [--entries 20000] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import query_cache, retrieval, storage
+from lib.secondary_index import EpisodeFilter
+
+WORDS = (
+    "deploy docker nginx postgres redis kubernetes helm terraform ssl cert "
+    "pytest flaky ci migration schema index cache latency memory leak "
+    "auth token oauth webhook queue worker retry timeout backup restore"
+).split()
+TOOLS = ["Bash", "Read", "Edit", "Write", "Grep", "Glob", "WebFetch"]
+
+
+def timed_ms(fn, queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(WORDS, 2)) for _ in range(args.queries)]
+    query_cache.set_query_cache_enabled(False)
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        storage.ensure_sophia_dir()
+        now = datetime.now()
+        with patch.dict(storage.MEMORY_CONFIG, {"max_index_entries": args.entries}), \
+                patch.dict(storage.STORAGE_CONFIG, {"index_log_compact_bytes": 1 << 40}):
+            for i in range(args.entries):
+                storage.update_episode_index({
+                    "id": f"ep_{i}",
+                    "goal_summary": " ".join(rng.sample(WORDS, 5)),
+                    "outcome": rng.choice(["SUCCESS", "FAILURE", "PARTIAL"]),
+                    "timestamp": (now - timedelta(days=rng.uniform(0, 365))).isoformat(),
+                    "tools": sorted(rng.sample(TOOLS, rng.randint(1, 3))),
+                    "session_id": f"s_{i}",
+                })
+            storage.compact_episode_index()
+
+            filters = {"outcome": "FAILURE", "since": now - timedelta(days=30), "tools": ["Bash"]}
+            episode_filter = EpisodeFilter.parse(filters)
+            keyword_index = storage.get_keyword_index()
+            selected = keyword_index.filters.select(episode_filter)
+
+            def post_filter(query):
+                matches = retrieval.bm25_search(query, k=len(keyword_index.entries))
+                return [(e, s) for e, s in matches if episode_filter.matches(e)][:args.k]
+
+            def scan(_):
+                return [e for e in storage.get_episode_index()["entries"] if episode_filter.matches(e)]
+
+            for query in queries[:3]:
+                assert post_filter(query) == retrieval.bm25_search(query, args.k, filters=filters)
+            assert scan(None) == retrieval.filter_episodes(filters)
+
+            search_then_filter = timed_ms(post_filter, queries)
+            filtered = timed_ms(lambda q: retrieval.bm25_search(q, args.k, filters=filters), queries)
+            scanned = timed_ms(scan, queries)
+            listed = timed_ms(lambda _: retrieval.filter_episodes(filters), queries)
+
+    print(f"entries {args.entries}, selected by filter {len(selected)}, k={args.k}")
+    print(f"{'operation':>20} {'ms/query':>9}")
+    print(f"{'search then filter':>20} {search_then_filter:>9.2f}")
+    print(f"{'filtered search':>20} {filtered:>9.2f}")
+    print(f"{'scan index':>20} {scanned:>9.2f}")
+    print(f"{'filter_episodes':>20} {listed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
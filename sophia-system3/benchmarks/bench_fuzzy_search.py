@@ -0,0 +1,114 @@
+"""
+bench_fuzzy_search.py - Typo candidates: edit-distance scan of the
+vocabulary vs. trigram posting lookups
+
+Builds a vocabulary of V pseudo-words and misspells sampled words with
+one random edit (substitution, insertion, deletion or transposition).
+The baseline computes the Levenshtein distance to every vocabulary token
+and keeps those within 2 edits; the trigram index counts shared
+trigrams over the postings of the typo's trigrams. Recall is the share
+of typos whose original word is among the (at most 3) candidates. Also
+times building the index and indexing a few new tokens incrementally.
+
+Usage:
+    python benchmarks/bench_fuzzy_search.py [--vocabulary 20000] [--queries N]
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib.config import RETRIEVAL_CONFIG
+from lib.trigram_index import TrigramIndex
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12)))
+
+
+def misspell(token: str, rng: random.Random) -> str:
+    i = rng.randrange(len(token) - 1)
+    edit = rng.choice(["substitute", "insert", "delete", "transpose"])
+    if edit == "substitute":
+        return token[:i] + rng.choice(string.ascii_lowercase) + token[i + 1:]
+    if edit == "insert":
+        return token[:i] + rng.choice(string.ascii_lowercase) + token[i:]
+    if edit == "delete":
+        return token[:i] + token[i + 1:]
+    return token[:i] + token[i + 1] + token[i] + token[i + 2:]
+
+
+def levenshtein(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def scan(typo: str, vocabulary, limit: int):
+    distances = [
+        (levenshtein(typo, token), token) for token in vocabulary
+        if abs(len(token) - len(typo)) <= 2
+    ]
+    return [token for distance, token in sorted(distances)[:limit] if distance <= 2]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = set()
+    while len(vocabulary) < args.vocabulary:
+        vocabulary.add(word(rng))
+    originals = rng.sample(sorted(vocabulary), args.queries)
+    typos = [misspell(token, rng) for token in originals]
+
+    threshold = RETRIEVAL_CONFIG["fuzzy_threshold"]
+    limit = RETRIEVAL_CONFIG["fuzzy_max_expansions"]
+
+    index = TrigramIndex()
+    start = time.perf_counter()
+    index.sync(vocabulary)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    new_tokens = {word(rng) for _ in range(100)} - vocabulary
+    start = time.perf_counter()
+    for token in new_tokens:
+        index.add(token)
+    update_ms = (time.perf_counter() - start) * 1000
+    for token in new_tokens:
+        index.discard(token)
+
+    start = time.perf_counter()
+    trigram_hits = [
+        [token for token, _ in index.similar(typo, threshold, limit)] for typo in typos
+    ]
+    trigram_ms = (time.perf_counter() - start) / len(typos) * 1000
+
+    start = time.perf_counter()
+    scan_hits = [scan(typo, vocabulary, limit) for typo in typos]
+    scan_ms = (time.perf_counter() - start) / len(typos) * 1000
+
+    def recall(hits):
+        return sum(original in found for original, found in zip(originals, hits)) / len(typos)
+
+    print(f"vocabulary {args.vocabulary}, {args.queries} typos, threshold {threshold}")
+    print(f"{'method':>16} {'ms/query':>9} {'recall':>7}")
+    print(f"{'edit distance':>16} {scan_ms:>9.2f} {recall(scan_hits):>7.2f}")
+    print(f"{'trigram index':>16} {trigram_ms:>9.2f} {recall(trigram_hits):>7.2f}")
+    print(f"index build {build_ms:.1f} ms, +100 tokens {update_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+bench_keyword_search.py - keyword_search and bm25_search latency vs. a
+full scan
+
+Builds a live index of N synthetic entries and times warm queries (the
+keyword index cached, as in a long-running session) against scoring
+every entry the way keyword_search used to.
+
+Usage:
+    python benchmarks/bench_keyword_search.py [--sizes 1000,10000] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import query_cache, retrieval, storage
+from lib.text import tokenize
+
+COMMON = (
+    "deploy docker nginx postgres redis kubernetes helm terraform ssl cert "
+    "pytest flaky ci migration schema index cache latency memory leak"
+).split()
+
+
+def vocabulary(rng: random.Random, size: int = 5000):
+    # Project-specific names make up most of a real index's vocabulary
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return COMMON + ["".join(rng.choices(letters, k=7)) for _ in range(size)]
+
+
+def linear_scan(query: str, entries):
+    # keyword_search before the inverted index
+    query_keywords = set(tokenize(query))
+    scored = []
+    for entry in entries:
+        text = " ".join([entry.get("goal_summary", "").lower()] +
+                        [k.lower() for k in entry.get("keywords", [])])
+        matches = sum(1 for kw in query_keywords if kw in text)
+        if matches:
+            scored.append((entry, matches / len(query_keywords)))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:10]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = vocabulary(rng)
+    queries = [
+        f"{rng.choice(COMMON)} {rng.choice(words)} {rng.choice(words)}"
+        for _ in range(args.queries)
+    ]
+
+    # Measure the searches themselves, not result caching
+    query_cache.set_query_cache_enabled(False)
+
+    print(f"{'entries':>8} {'scan ms':>9} {'postings ms':>12} {'bm25 ms':>9} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as home:
+            os.environ["HOME"] = home
+            storage.clear_read_cache()
+            storage.ensure_sophia_dir()
+            storage.MEMORY_CONFIG["max_index_entries"] = size
+
+            for i in range(size):
+                storage.update_episode_index({
+                    "id": f"ep_{i}",
+                    "goal_summary": " ".join([rng.choice(COMMON)] + rng.sample(words, 5)),
+                    "keywords": rng.sample(words, 3),
+                })
+            storage.compact_episode_index()
+            entries = storage.get_episode_index()["entries"]
+            retrieval.keyword_search("warm up")
+
+            start = time.perf_counter()
+            for query in queries:
+                linear_scan(query, entries)
+            scan = (time.perf_counter() - start) / len(queries) * 1000
+
+            start = time.perf_counter()
+            for query in queries:
+                retrieval.keyword_search(query)
+            postings = (time.perf_counter() - start) / len(queries) * 1000
+
+            start = time.perf_counter()
+            for query in queries:
+                retrieval.bm25_search(query)
+            bm25 = (time.perf_counter() - start) / len(queries) * 1000
+
+            print(f"{size:>8} {scan:>9.2f} {postings:>12.2f} {bm25:>9.2f} {scan / postings:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
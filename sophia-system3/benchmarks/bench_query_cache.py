@@ -0,0 +1,81 @@
+"""
+bench_query_cache.py - search_episodes latency with and without the
+query result cache
+
+Times, per index size, a cold search (cache disabled), a repeated query
+served from memory, one served from the shared file (as a second process
+would see it) and the extra cost a miss pays to store its result.
+
+Usage:
+    python benchmarks/bench_query_cache.py [--sizes 1000,10000] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import query_cache, retrieval, storage
+
+WORDS = (
+    "deploy docker nginx postgres redis kubernetes helm terraform ssl cert "
+    "pytest flaky ci migration schema index cache latency memory leak "
+    "auth token oauth webhook queue worker retry timeout backup restore"
+).split()
+
+
+def per_query_ms(queries, **kwargs) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        retrieval.search_episodes(query, mode="keyword", **kwargs)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(args.queries)]
+
+    print(f"{'entries':>8} {'cold ms':>9} {'miss ms':>9} {'memory ms':>10} {'file ms':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as home:
+            os.environ["HOME"] = home
+            storage.clear_read_cache()
+            storage.ensure_sophia_dir()
+            storage.MEMORY_CONFIG["max_index_entries"] = size
+
+            for i in range(size):
+                storage.update_episode_index({
+                    "id": f"ep_{i}",
+                    "goal_summary": " ".join(rng.sample(WORDS, 6)),
+                    "keywords": rng.sample(WORDS, 3),
+                    "outcome": "SUCCESS",
+                })
+            storage.compact_episode_index()
+            storage.get_keyword_index()
+
+            query_cache.set_query_cache_enabled(False)
+            cold = per_query_ms(queries)
+
+            query_cache.set_query_cache_enabled(True)
+            miss = per_query_ms(queries)
+            memory = per_query_ms(queries)
+
+            # Another process: empty memory, results in the shared file
+            query_cache.clear_query_cache()
+            file_hit = per_query_ms(queries[:1])
+
+            print(f"{size:>8} {cold:>9.3f} {miss:>9.3f} {memory:>10.3f} {file_hit:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+bench_rerank.py - Re-ranking cost: compute_retrieval_score per candidate
+vs. one ScoreColumns pass
+
+Columns are built once (as with the cached keyword index); each round
+re-scores a random candidate set of the given size.
+
+Usage:
+    python benchmarks/bench_rerank.py [--sizes 10,100,1000,10000] [--rounds N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import score_columns
+from lib.retrieval import compute_retrieval_score
+from lib.score_columns import ScoreColumns
+
+
+def timed_ms(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = datetime.now()
+    entries = [
+        {
+            "id": f"ep_{i}",
+            "timestamp": (now - timedelta(days=rng.randint(0, 90))).isoformat(),
+            "outcome": rng.choice(["SUCCESS", "FAILURE", "PARTIAL"]),
+            "heuristics_count": rng.randint(0, 4),
+            "consolidated": rng.random() < 0.3,
+        }
+        for i in range(max(int(s) for s in args.sizes.split(",")))
+    ]
+    columns = ScoreColumns.from_entries(entries)
+    columns.score([0] * 100, [0.5] * 100)  # Import numpy, build its views
+
+    print(f"{'candidates':>10} {'per-entry ms':>13} {'arrays ms':>10} {'numpy ms':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        rows = rng.sample(range(len(entries)), size)
+        similarities = [rng.random() for _ in rows]
+
+        per_entry = timed_ms(
+            lambda: [compute_retrieval_score(entries[r], s) for r, s in zip(rows, similarities)],
+            args.rounds
+        )
+        with patch.object(score_columns, '_numpy', lambda: None):
+            arrays = timed_ms(lambda: columns.score(rows, similarities), args.rounds)
+        with patch.object(score_columns, '_NUMPY_MIN_ROWS', 0):
+            vectorized = timed_ms(lambda: columns.score(rows, similarities), args.rounds)
+
+        print(f"{size:>10} {per_entry:>13.3f} {arrays:>10.3f} {vectorized:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
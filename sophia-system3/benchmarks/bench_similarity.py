@@ -0,0 +1,67 @@
+"""
+bench_similarity.py - top-k cosine similarity, numpy vs. pure Python
+
+Scores one query against N random embeddings with top_k_similar() on raw
+rows (norms computed per query), with cached row norms (what VectorStore
+does), on pre-normalized rows, and with the pure-Python fallback.
+
+Usage:
+    python benchmarks/bench_similarity.py [--sizes 1000,10000,100000] [--dim 1536]
+        [--python-max 10000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from lib.embeddings import normalize_rows, row_norms, top_k_similar
+
+
+def timed(fn, repeat: int) -> float:
+    fn()  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--python-max", type=int, default=10000,
+                        help="Largest N for the (slow) pure-Python run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>8} {'python ms':>10} {'raw ms':>8} {'norms ms':>9} {'unit ms':>8} {'speedup':>8}")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        matrix = rng.standard_normal((size, args.dim)).astype(np.float32)
+        ids = [f"ep_{i}" for i in range(size)]
+        query = rng.standard_normal(args.dim).astype(np.float32)
+        norms = row_norms(matrix)
+        unit = normalize_rows(matrix)
+        repeat = max(3, 200_000 // size)
+
+        raw = timed(lambda: top_k_similar(query, matrix, ids, args.k), repeat)
+        cached = timed(lambda: top_k_similar(query, matrix, ids, args.k, norms=norms), repeat)
+        normalized = timed(lambda: top_k_similar(query, unit, ids, args.k, normalized=True), repeat)
+
+        if size <= args.python_max:
+            rows, q = matrix.tolist(), query.tolist()
+            python = timed(lambda: top_k_similar(q, rows, ids, args.k), 1)
+            print(f"{size:>8} {python:>10.1f} {raw:>8.2f} {cached:>9.2f} {normalized:>8.2f} "
+                  f"{python / normalized:>7.0f}x")
+        else:
+            print(f"{size:>8} {'-':>10} {raw:>8.2f} {cached:>9.2f} {normalized:>8.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
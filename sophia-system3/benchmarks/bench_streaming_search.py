@@ -0,0 +1,123 @@
+"""
+bench_streaming_search.py - Archive search: materialize-and-sort vs. the
+streaming top-k pipeline
+
+Builds a live index plus an archive of N entries whose vocabulary drifts
+over time (older entries share fewer tokens with current queries and
+rarely carry boosts) and times include_archive searches. The
+baseline scores every matching archived entry into one list and sorts it,
+as search used to; the streaming search keeps k results and skips
+segments whose bound can't beat them. Peak Python allocations come from
+tracemalloc.
+
+Usage:
+    python benchmarks/bench_streaming_search.py [--archived 20000] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import query_cache, retrieval, storage
+from lib.text import tokenize
+
+WORDS = (
+    "deploy docker nginx postgres redis kubernetes helm terraform ssl cert "
+    "pytest flaky ci migration schema index cache latency memory leak "
+    "auth token oauth webhook queue worker retry timeout backup restore "
+    "react webpack eslint typescript graphql grpc kafka spark airflow dbt "
+    "s3 lambda iam vpc dns cdn cors csrf jwt saml "
+    "rust cargo wasm llvm cmake bazel gradle maven npm pip"
+).split()
+WINDOW = 12  # Words in use at any one time; the window drifts with history
+
+
+def topic(position: float):
+    start = int(position * (len(WORDS) - WINDOW))
+    return WORDS[start:start + WINDOW]
+
+
+def materialized(query: str, k: int):
+    # Score every match, live and archived, then sort
+    query_keywords = set(tokenize(query))
+    live, archived, _ = retrieval._bm25_scorers(retrieval._expand_query(query_keywords))
+    keyword_index = storage.get_keyword_index()
+    matches = [(keyword_index.entries[i], s) for i, s in live(keyword_index, None).items()]
+    entries = [
+        e for e in storage.iter_archived_entries()
+        if e.get("id") not in keyword_index.positions
+    ]
+    matches.extend((e, s) for e, s in zip(entries, archived(entries)) if s is not None)
+    scores = retrieval.score_candidates(matches)
+    return sorted(zip((e for e, _ in matches), scores), key=lambda x: x[1], reverse=True)[:k]
+
+
+def measure(fn, queries):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    elapsed = (time.perf_counter() - start) / len(queries) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--live", type=int, default=1000)
+    parser.add_argument("--archived", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(topic(1.0), 2)) for _ in range(args.queries)]
+    query_cache.set_query_cache_enabled(False)
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        storage.ensure_sophia_dir()
+        total = args.live + args.archived
+        now = datetime.now()
+        with patch.dict(storage.MEMORY_CONFIG, {"max_index_entries": args.live}), \
+                patch.dict(storage.STORAGE_CONFIG, {"index_log_compact_bytes": 1 << 40}):
+            for i in range(total):
+                recent = i >= args.archived
+                storage.update_episode_index({
+                    "id": f"ep_{i}",
+                    "goal_summary": " ".join(rng.sample(topic(i / total), 5)),
+                    "outcome": "SUCCESS" if rng.random() < (0.3 if recent else 0.02) else "FAILURE",
+                    "heuristics_count": rng.choice([0, 0, 0, 1]) if recent else 0,
+                    "timestamp": (now - timedelta(days=(total - i) / 20)).isoformat(),
+                })
+            storage.compact_episode_index()
+
+            storage.get_keyword_index()
+            for query in queries[:3]:
+                streamed = retrieval.ranked_keyword_search(query, args.k, include_archive=True)
+                # Same scores (ties may order differently)
+                assert [s for _, s in streamed] == [s for _, s in materialized(query, args.k)]
+
+            base_ms, base_kb = measure(lambda q: materialized(q, args.k), queries)
+            stream_ms, stream_kb = measure(
+                lambda q: retrieval.ranked_keyword_search(q, args.k, include_archive=True), queries
+            )
+
+    print(f"live {args.live}, archived {args.archived}, k={args.k}")
+    print(f"{'search':>14} {'ms/query':>9} {'peak KiB':>9}")
+    print(f"{'materialize':>14} {base_ms:>9.1f} {base_kb:>9.0f}")
+    print(f"{'streaming':>14} {stream_ms:>9.1f} {stream_kb:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
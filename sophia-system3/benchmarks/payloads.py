@@ -0,0 +1,72 @@
+"""
+payloads.py - Synthetic episode and index data for benchmarks
+"""
+
+import hashlib
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+TOOLS = ["Bash", "Read", "Edit", "Write", "Grep", "Glob"]
+WORDS = (
+    "deploy docker container kubernetes fix bug test pytest config nginx "
+    "database migration schema api endpoint auth token refactor module "
+    "cache index search query logging metrics build release pipeline"
+).split()
+
+
+def make_episode(i: int, rng: random.Random, n_actions: int = 100,
+                 embedding_dim: int = 0) -> Dict[str, Any]:
+    """Episode dict shaped like session_end.sh output after reflection."""
+    start = datetime(2024, 1, 1) + timedelta(hours=i)
+    actions = []
+    for j in range(n_actions):
+        args = f"{i}-{j}-{rng.random()}"
+        actions.append({
+            "ts": (start + timedelta(seconds=j * 7)).isoformat(),
+            "tool": rng.choice(TOOLS),
+            "exit_code": rng.choice([0, 0, 0, 1]),
+            "args_hash": hashlib.sha256(args.encode()).hexdigest()[:16],
+            "output_size": rng.randint(0, 20000),
+        })
+    summary = " ".join(rng.sample(WORDS, 5))
+    return {
+        "id": f"ep_{i:06d}",
+        "session_id": f"session_{i:06d}",
+        "started_at": start.isoformat(),
+        "ended_at": (start + timedelta(minutes=12)).isoformat(),
+        "end_trigger": "stop_hook",
+        "goal": summary,
+        "goal_summary": summary,
+        "chain_of_thought": [f"Step {k}: {' '.join(rng.sample(WORDS, 8))}" for k in range(5)],
+        "actions": actions,
+        "tool_call_count": n_actions,
+        "outcome": rng.choice(["SUCCESS", "FAILURE", "PARTIAL", "UNKNOWN"]),
+        "error_analysis": None,
+        "heuristics": [" ".join(rng.sample(WORDS, 6)) for _ in range(rng.randint(0, 3))],
+        "keywords": rng.sample(WORDS, 4),
+        "embedding": [rng.uniform(-1, 1) for _ in range(embedding_dim)] or None,
+        "trivial": False,
+        "consolidated": rng.random() < 0.3,
+    }
+
+
+def make_index_entry(episode: Dict[str, Any]) -> Dict[str, Any]:
+    """Index entry for an episode dict."""
+    return {
+        "id": episode["id"],
+        "timestamp": episode["ended_at"],
+        "goal_summary": episode["goal_summary"],
+        "outcome": episode["outcome"],
+        "tool_call_count": episode["tool_call_count"],
+        "heuristics_count": len(episode["heuristics"]),
+        "keywords": episode["keywords"],
+        "trivial": episode["trivial"],
+        "consolidated": episode["consolidated"],
+    }
+
+
+def make_corpus(n: int, seed: int = 0, **kwargs: Any) -> List[Dict[str, Any]]:
+    """n synthetic episodes, oldest first."""
+    rng = random.Random(seed)
+    return [make_episode(i, rng, **kwargs) for i in range(n)]
@@ -53,50 +53,125 @@ $(echo "$ACTIONS" | sed 's/^/    /' | paste -sd ',' -)
 }
 EOF
 
-# Update index.json with file locking
-INDEX_FILE="$SOPHIA_DIR/episodes/index.json"
-LOCK_FILE="${INDEX_FILE}.lock"
-
-# Acquire lock (timeout 5s)
-LOCK_ACQUIRED=0
-for i in {1..50}; do
-    if mkdir "$LOCK_FILE" 2>/dev/null; then
-        LOCK_ACQUIRED=1
-        break
+# Distinct tool names, for tool filters in recall (secondary_index.py)
+TOOLS_JSON=$(jq -sc '[.[].tool // empty] | unique' "$BUFFER_FILE" 2>/dev/null)
+if [[ -z "$TOOLS_JSON" ]]; then
+    TOOLS_JSON="[$(grep -o '"tool": *"[^"]*"' "$BUFFER_FILE" | sed 's/.*: *//' | sort -u | paste -sd ',' -)]"
+fi
+
+NEW_ENTRY="{\"id\":\"$EPISODE_ID\",\"timestamp\":\"$TIMESTAMP\",\"session_id\":\"$SESSION_ID\",\"tools\":$TOOLS_JSON,\"tool_call_count\":$TOOL_COUNT,\"trivial\":false,\"consolidated\":false}"
+CONFIG_FILE="$SOPHIA_DIR/config.json"
+
+# SQLite backend: insert the episode and index entry and bump the self
+# model's stats directly in the database. Without the sqlite3 CLI (or
+# before sophia.db exists) the episode file and index.log.jsonl below are
+# written instead; the library moves them into the database, stats
+# included, the next time it reads the index or self model.
+INDEXED=0
+DB_FILE="$SOPHIA_DIR/sophia.db"
+BACKEND="json"
+if [[ -f "$CONFIG_FILE" ]] && command -v jq &>/dev/null; then
+    BACKEND=$(jq -r '.storage_backend // "json"' "$CONFIG_FILE")
+fi
+
+# Quote a value as an SQL string literal (single quotes doubled), since a
+# session id or path may contain one
+sql_quote() {
+    local quote="'"
+    printf "'%s'" "${1//$quote/$quote$quote}"
+}
+
+if [[ "$BACKEND" == "sqlite" ]] && [[ -f "$DB_FILE" ]] && command -v sqlite3 &>/dev/null; then
+    if sqlite3 -cmd ".timeout 5000" "$DB_FILE" <<SQL
+BEGIN;
+INSERT OR REPLACE INTO episodes (id, data) VALUES ($(sql_quote "$EPISODE_ID"), CAST(readfile($(sql_quote "$EPISODE_FILE")) AS TEXT));
+INSERT OR REPLACE INTO episode_index (id, timestamp, data) VALUES ($(sql_quote "$EPISODE_ID"), $(sql_quote "$TIMESTAMP"), $(sql_quote "$NEW_ENTRY"));
+UPDATE documents SET data = json_set(data,
+    '\$.total_sessions', COALESCE(json_extract(data, '\$.total_sessions'), 0) + 1,
+    '\$.total_episodes', COALESCE(json_extract(data, '\$.total_episodes'), 0) + 1,
+    '\$.last_session', strftime('%Y-%m-%dT%H:%M:%SZ', 'now'),
+    '\$.version', COALESCE(json_extract(data, '\$.version'), 0) + 1)
+WHERE name = 'self_model';
+COMMIT;
+SQL
+    then
+        rm -f "$EPISODE_FILE"
+        INDEXED=1
     fi
-    sleep 0.1
-done
+fi
 
-if [[ "$LOCK_ACQUIRED" -eq 1 ]]; then
-    # Initialize index if needed
-    if [[ ! -f "$INDEX_FILE" ]]; then
-        echo '{"last_updated":"","total_episodes":0,"entries":[]}' > "$INDEX_FILE"
+# Take the lock lib/locking.py uses for a file ({file}.lock) on fd 9:
+# flock(1) blocks in the kernel for up to 5s; without it (e.g. macOS)
+# python3's fcntl locks the same open file. Returns non-zero on timeout.
+flock_fd9() {
+    if command -v flock &>/dev/null; then
+        flock -x -w 5 9
+    else
+        python3 -c "import fcntl, signal; signal.alarm(5); fcntl.flock(9, fcntl.LOCK_EX)" 2>/dev/null
     fi
+}
 
-    # Add entry to index (using jq if available, else simple append)
-    if command -v jq &>/dev/null; then
-        NEW_ENTRY="{\"id\":\"$EPISODE_ID\",\"timestamp\":\"$TIMESTAMP\",\"tool_call_count\":$TOOL_COUNT,\"trivial\":false,\"consolidated\":false}"
-        jq --argjson entry "$NEW_ENTRY" \
-           '.entries = [$entry] + .entries | .total_episodes += 1 | .last_updated = now | todate' \
-           "$INDEX_FILE" > "${INDEX_FILE}.tmp" && mv "${INDEX_FILE}.tmp" "$INDEX_FILE"
+# Run a command while holding the lock for file $1. Falls back to a lock
+# directory with an owner record (so waiters can break it at once if we
+# die) for SOPHIA_LOCK_BACKEND=dir (NFS), systems without flock or
+# python3, or while a lock directory exists.
+run_locked() {
+    local lock_file="$1.lock"
+    shift
+    if [[ "${SOPHIA_LOCK_BACKEND:-auto}" != "dir" ]] && [[ ! -d "$lock_file" ]] && \
+            { command -v flock &>/dev/null || python3 -c "import fcntl" 2>/dev/null; }; then
+        { flock_fd9 && "$@"; } 9>>"$lock_file"
+        return
     fi
 
-    # Release lock
-    rmdir "$LOCK_FILE"
+    local i status
+    for i in {1..50}; do
+        if mkdir "$lock_file" 2>/dev/null; then
+            echo "{\"pid\":$$,\"host\":\"$(hostname)\",\"token\":\"hook-$$\",\"heartbeat\":$(date +%s)}" \
+                > "$lock_file/owner.json" 2>/dev/null || true
+            status=0
+            "$@" || status=$?
+            rm -rf "$lock_file"
+            return $status
+        fi
+        sleep 0.1
+    done
+    return 1
+}
+
+# Append entry to the episode index log. The library folds
+# index.log.jsonl into index.json (capping and archiving old entries) the
+# next time it reads the index after the log has grown past a threshold.
+INDEX_FILE="$SOPHIA_DIR/episodes/index.json"
+INDEX_LOG="$SOPHIA_DIR/episodes/index.log.jsonl"
+
+append_index_entry() {
+    echo "$NEW_ENTRY" >> "$INDEX_LOG"
+}
+
+if [[ "$INDEXED" -eq 0 ]]; then
+    run_locked "$INDEX_FILE" append_index_entry || true
 fi
 
-# Update self_model stats
+# Update self_model stats. Bumping "version" makes concurrent
+# update_self_model() calls retry instead of overwriting these counts.
 SELF_MODEL="$SOPHIA_DIR/self_model.json"
-if [[ -f "$SELF_MODEL" ]] && command -v jq &>/dev/null; then
-    jq '.total_sessions += 1 | .total_episodes += 1 | .last_session = now | todate' \
+
+update_self_model_stats() {
+    jq '.total_sessions += 1 | .total_episodes += 1 | .last_session = (now | todate) | .version = ((.version // 0) + 1)' \
        "$SELF_MODEL" > "${SELF_MODEL}.tmp" && mv "${SELF_MODEL}.tmp" "$SELF_MODEL"
+}
+
+# Under sqlite the stats were bumped with the insert above, or will be
+# when the library imports the logged entry
+if [[ "$BACKEND" != "sqlite" ]] && [[ -f "$SELF_MODEL" ]] && command -v jq &>/dev/null; then
+    run_locked "$SELF_MODEL" update_self_model_stats || rm -f "${SELF_MODEL}.tmp"
 fi
 
 # Clean up buffer
 rm -f "$BUFFER_FILE"
 
 # Optionally trigger reflection (check config)
-CONFIG_FILE="$SOPHIA_DIR/config.json"
 if [[ -f "$CONFIG_FILE" ]]; then
     TRIGGER=$(jq -r '.reflection_trigger // "manual"' "$CONFIG_FILE")
     if [[ "$TRIGGER" == "on_session_end" ]]; then
@@ -0,0 +1,320 @@
+"""
+ann_index.py - Inverted-file (IVF) approximate nearest-neighbour index
+
+Brute-force cosine search over the vector sidecar reads every row, which
+dominates semantic recall once there are 100k+ embedded episodes. The IVF
+index clusters the rows around `nlist` k-means centroids (spherical, i.e.
+on unit vectors) and a query only scores the rows of its `nprobe` nearest
+clusters. nprobe is the recall/latency knob: more probes, more rows
+scored, higher recall.
+
+Files, next to the sidecar in episodes/vectors/:
+- ivf_centroids.f32: (nlist, d) little-endian float32 unit centroids
+- ivf_assign.i32: little-endian int32 cluster of each matrix row, in row
+  order; -1 for a row not assigned yet
+- ivf_meta.json: {"nlist": n, "dimension": d, "trained_rows": N}
+
+Training is explicit (VectorStore.train_ann / storage.build_ann_index) as
+k-means over 100k rows takes seconds. Afterwards the index is kept current
+incrementally: VectorStore.add assigns each new or overwritten row to its
+nearest centroid under the store lock. Rows added by something that
+didn't (or before training finished) are assigned in memory at query
+time.
+
+Requires numpy; without it the store stays on brute force.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import ANN_CONFIG
+from .embeddings import normalize_rows, top_k_similar
+
+CENTROIDS_FILE = "ivf_centroids.f32"
+ASSIGN_FILE = "ivf_assign.i32"
+META_FILE = "ivf_meta.json"
+
+ASSIGN_DTYPE = "<i4"
+DTYPE = "<f4"
+
+# Rows per matrix product during assignment, bounding temporary memory
+_CHUNK_ROWS = 8192
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def default_nlist(rows: int) -> int:
+    """Cluster count for a matrix size: about 4 * sqrt(rows), at least 1."""
+    return max(1, min(rows, int(4 * rows ** 0.5)))
+
+
+def assign_rows(matrix: Any, centroids: Any) -> Any:
+    """
+    Nearest centroid (by inner product) of each row.
+
+    Args:
+        matrix: (N, d) array; rows need not be normalized
+        centroids: (nlist, d) unit centroids
+
+    Returns:
+        (N,) int32 array of cluster numbers
+    """
+    np = _numpy()
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + _CHUNK_ROWS], dtype=np.float32)
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(
+    matrix: Any,
+    nlist: int,
+    iterations: int,
+    sample_size: int,
+    seed: int = 0
+) -> Any:
+    """
+    Spherical k-means on a sample of the rows.
+
+    Args:
+        matrix: (N, d) array
+        nlist: Number of clusters
+        iterations: Lloyd iterations
+        sample_size: Rows sampled for training (all rows if fewer)
+        seed: Random seed for sampling and initialization
+
+    Returns:
+        (nlist, d) float32 unit centroids
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+
+    rows = len(matrix)
+    sample = np.sort(rng.choice(rows, size=min(rows, sample_size), replace=False))
+    data = normalize_rows(matrix[sample])
+    nlist = min(nlist, len(data))
+
+    centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_rows(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=nlist)
+
+        # An empty cluster restarts at a random sample row
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = data[rng.choice(len(data), size=len(empty))]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """IVF index over a VectorStore's matrix (see module docstring)."""
+
+    def __init__(self, directory: Path):
+        """
+        Initialize the index.
+
+        Args:
+            directory: Sidecar directory (episodes/vectors)
+        """
+        self.directory = Path(directory)
+        self.centroids_path = self.directory / CENTROIDS_FILE
+        self.assign_path = self.directory / ASSIGN_FILE
+        self.meta_path = self.directory / META_FILE
+
+        self._centroids: Optional[Tuple[Any, Any]] = None  # (signature, array)
+        self._lists: Optional[Tuple[Any, Any, Any]] = None  # (signature, order, bounds)
+
+    def _signature(self, path: Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def meta(self) -> Optional[Dict[str, Any]]:
+        """Training metadata, or None if the index isn't trained."""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if isinstance(meta, dict) and meta.get("nlist") else None
+
+    def centroids(self, dimension: int) -> Optional[Any]:
+        """Trained centroids for vectors of this dimension, else None."""
+        np = _numpy()
+        meta = self.meta()
+        if np is None or meta is None or meta.get("dimension") != dimension:
+            return None
+
+        signature = self._signature(self.centroids_path)
+        if self._centroids is None or self._centroids[0] != signature:
+            try:
+                centroids = np.fromfile(self.centroids_path, dtype=DTYPE)
+                centroids = centroids.reshape(meta["nlist"], dimension).astype(np.float32)
+            except (OSError, ValueError):
+                return None
+            self._centroids = (signature, centroids)
+        return self._centroids[1]
+
+    @property
+    def trained(self) -> bool:
+        return self.meta() is not None
+
+    def train(self, matrix: Any, nlist: Optional[int] = None) -> int:
+        """
+        Cluster the matrix and assign every row. Callers hold the store lock.
+
+        Args:
+            matrix: (N, d) array of all stored vectors
+            nlist: Number of clusters (default ANN_CONFIG["nlist"], or
+                default_nlist(N))
+
+        Returns:
+            Number of clusters
+        """
+        rows, dimension = matrix.shape
+        nlist = nlist or ANN_CONFIG["nlist"] or default_nlist(rows)
+        nlist = min(nlist, rows)
+
+        centroids = train_centroids(
+            matrix, nlist, ANN_CONFIG["train_iterations"],
+            ANN_CONFIG["train_sample_per_list"] * nlist
+        )
+        assignments = assign_rows(matrix, centroids)
+
+        # Meta last: until it's written the old index (or none) is in use
+        self.meta_path.unlink(missing_ok=True)
+        centroids.astype(DTYPE).tofile(self.centroids_path)
+        assignments.astype(ASSIGN_DTYPE).tofile(self.assign_path)
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"nlist": len(centroids), "dimension": dimension, "trained_rows": rows}, f)
+
+        self._centroids = None
+        self._lists = None
+        return len(centroids)
+
+    def clear(self) -> None:
+        """Delete the index files (meta first, so it reads as untrained)."""
+        for path in (self.meta_path, self.assign_path, self.centroids_path):
+            path.unlink(missing_ok=True)
+        self._centroids = None
+        self._lists = None
+
+    def assign(self, row: int, vector: Sequence[float]) -> None:
+        """
+        Record the cluster of a new or overwritten row. Callers hold the
+        store lock.
+
+        Rows between the end of the assignment file and `row` (added while
+        untrained, or by an older version) are marked -1 and assigned at
+        query time.
+
+        Args:
+            row: Matrix row
+            vector: The row's vector
+        """
+        np = _numpy()
+        centroids = self.centroids(len(vector))
+        if centroids is None:
+            return
+
+        cluster = int(np.argmax(centroids @ np.asarray(vector, dtype=np.float32)))
+        entry = np.array([cluster], dtype=ASSIGN_DTYPE).tobytes()
+        try:
+            with open(self.assign_path, 'r+b') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell() // 4
+                if row > size:
+                    f.write(np.full(row - size, -1, dtype=ASSIGN_DTYPE).tobytes())
+                f.seek(row * 4)
+                f.write(entry)
+        except OSError:
+            pass  # Assigned at query time instead
+
+    def _cluster_lists(self, matrix: Any, centroids: Any, key: Any) -> Tuple[Any, Any]:
+        """Rows grouped by cluster: (row order, per-cluster bounds)."""
+        np = _numpy()
+        signature = (key, self._signature(self.assign_path))
+        if self._lists is not None and self._lists[0] == signature:
+            return self._lists[1], self._lists[2]
+
+        rows = len(matrix)
+        try:
+            assignments = np.fromfile(self.assign_path, dtype=ASSIGN_DTYPE)[:rows].astype(np.int32)
+        except (OSError, ValueError):
+            assignments = np.empty(0, dtype=np.int32)
+        if len(assignments) < rows:
+            assignments = np.concatenate([
+                assignments, np.full(rows - len(assignments), -1, dtype=np.int32)
+            ])
+
+        missing = np.flatnonzero(assignments < 0)
+        if len(missing):
+            assignments[missing] = assign_rows(matrix[missing], centroids)
+
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self._lists = (signature, order, bounds)
+        return order, bounds
+
+    def search(
+        self,
+        query: Sequence[float],
+        matrix: Any,
+        ids: List[str],
+        norms: Any,
+        k: int,
+        nprobe: Optional[int] = None,
+        key: Any = None
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        Approximate top-k cosine search.
+
+        Args:
+            query: Query vector
+            matrix: (N, d) matrix of the store
+            ids: Episode id per row
+            norms: Row norms of the matrix
+            k: Maximum number of results
+            nprobe: Clusters to scan (default ANN_CONFIG["nprobe"])
+            key: Identifies the matrix contents, for caching cluster lists
+
+        Returns:
+            List of (episode_id, cosine_similarity) tuples, most similar
+            first, or None if the index can't serve this query
+        """
+        np = _numpy()
+        centroids = self.centroids(matrix.shape[1])
+        if centroids is None:
+            return None
+
+        q = np.asarray(query, dtype=np.float32)
+        q_norm = float(np.linalg.norm(q))
+        if q_norm == 0:
+            return []
+
+        order, bounds = self._cluster_lists(matrix, centroids, key)
+
+        nprobe = max(1, min(nprobe or ANN_CONFIG["nprobe"], len(centroids)))
+        closeness = centroids @ (q / q_norm)
+        probe = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+
+        candidates = np.sort(np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probe]))
+        if not len(candidates):
+            return []
+
+        hits = top_k_similar(q, matrix[candidates], candidates, k, norms=norms[candidates])
+        return [(ids[int(row)], score) for row, score in hits]
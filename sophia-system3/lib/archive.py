@@ -0,0 +1,273 @@
+"""
+archive.py - Segmented archive for episode index entries
+
+Entries capped out of the live index go to episodes/archive/:
+- open.json: the newest archived entries, fewer than one segment's worth
+- seg_{n:06d}.json: sealed segments of exactly `segment_size` entries,
+  written once and never rewritten
+- manifest.jsonl: one summary line per sealed segment (entry count, time
+  range, keyword tokens, bounds on the ranking boosts), appended when the
+  segment is sealed
+
+Searches read the manifest and skip segments whose time range or keyword
+set can't match, so archive cost stays bounded no matter how much history
+has accumulated.
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import codec, storage
+from .text import entry_field_tokens
+
+MANIFEST = "manifest.jsonl"
+OPEN_SEGMENT = "open.json"
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    timestamp = _parse_timestamp(value)
+    return timestamp.timestamp() if timestamp else None
+
+
+def summarize_segment(segment_id: int, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build the manifest summary for a segment.
+
+    Args:
+        segment_id: Sequence number of the segment
+        entries: Entries in the segment, newest first
+
+    Returns:
+        Summary dict with file name, count, time range, keyword tokens and
+        whether any entry succeeded / the most heuristics of any entry
+    """
+    timestamps = []
+    tokens: Set[str] = set()
+    max_heuristics = 0
+    for entry in entries:
+        epoch = _epoch(entry.get("timestamp"))
+        if epoch is not None:
+            timestamps.append((epoch, entry["timestamp"]))
+        for field_tokens in entry_field_tokens(entry).values():
+            tokens.update(field_tokens)
+        heuristics = entry.get("heuristics_count", 0)
+        if isinstance(heuristics, (int, float)):
+            max_heuristics = max(max_heuristics, heuristics)
+
+    return {
+        "segment": segment_id,
+        "file": f"seg_{segment_id:06d}.json",
+        "count": len(entries),
+        "start": min(timestamps)[1] if timestamps else None,
+        "end": max(timestamps)[1] if timestamps else None,
+        "keywords": sorted(tokens),
+        # Bounds on the ranking boosts, so searches can skip the segment
+        "success": any(entry.get("outcome") == 'SUCCESS' for entry in entries),
+        "max_heuristics": max_heuristics,
+    }
+
+
+def load_manifest(archive_dir: Path) -> List[Dict[str, Any]]:
+    """
+    Load sealed segment summaries, oldest segment first.
+
+    Args:
+        archive_dir: Path to episodes/archive
+
+    Returns:
+        List of summary dicts
+    """
+    try:
+        with open(Path(archive_dir) / MANIFEST, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except (FileNotFoundError, IOError):
+        return []
+
+    summaries = []
+    for line in lines:
+        try:
+            summaries.append(codec.loads(line))
+        except ValueError:
+            continue  # Torn last line
+    return summaries
+
+
+def _seal(archive_dir: Path, entries: List[Dict[str, Any]], segment_id: int) -> None:
+    summary = summarize_segment(segment_id, entries)
+    storage.write_json(archive_dir / summary["file"], entries, file_type="archive")
+    with open(archive_dir / MANIFEST, 'a', encoding='utf-8') as f:
+        f.write(codec.dumps(summary).decode('utf-8') + "\n")
+
+
+def add_entries(archive_dir: Path, entries: List[Dict[str, Any]], segment_size: int) -> int:
+    """
+    Archive entries that are newer than everything already archived.
+
+    New entries go to the front of the open segment; whenever it holds a
+    full segment's worth, the oldest `segment_size` entries are sealed.
+    Only open.json is rewritten, so the cost is bounded by segment_size.
+
+    Callers hold the episode index lock.
+
+    Args:
+        archive_dir: Path to episodes/archive
+        entries: Entries to archive, newest first
+        segment_size: Entries per sealed segment
+
+    Returns:
+        Number of segments sealed
+    """
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+
+    open_entries = list(entries) + storage.read_json(archive_dir / OPEN_SEGMENT, [])
+    next_id = len(load_manifest(archive_dir)) + 1
+    sealed = 0
+
+    while len(open_entries) >= segment_size:
+        # A crash after sealing but before open.json is rewritten leaves
+        # duplicates, which iter_archived_entries() skips by id
+        _seal(archive_dir, open_entries[-segment_size:], next_id)
+        open_entries = open_entries[:-segment_size]
+        next_id += 1
+        sealed += 1
+
+    storage.write_json(archive_dir / OPEN_SEGMENT, open_entries, file_type="archive")
+    return sealed
+
+
+def import_legacy_archives(episodes_dir: Path, segment_size: int) -> int:
+    """
+    Move index_archive_{year}.json files into the segmented archive.
+
+    Legacy archives hold entries oldest first and are older than anything
+    archived since, so this only runs while the segmented archive is
+    empty. The legacy files are removed once imported.
+
+    Args:
+        episodes_dir: Path to ~/.sophia/episodes
+        segment_size: Entries per sealed segment
+
+    Returns:
+        Number of entries imported
+    """
+    episodes_dir = Path(episodes_dir)
+    archive_dir = episodes_dir / "archive"
+    legacy_paths = sorted(episodes_dir.glob("index_archive_*.json"))
+
+    if not legacy_paths:
+        return 0
+    if load_manifest(archive_dir) or (archive_dir / OPEN_SEGMENT).exists():
+        return 0
+
+    entries = []
+    for path in legacy_paths:
+        entries.extend(storage.read_json(path, []))
+    entries.reverse()
+
+    add_entries(archive_dir, entries, segment_size)
+    for path in legacy_paths:
+        path.unlink()
+
+    return len(entries)
+
+
+def _segment_may_match(
+    summary: Dict[str, Any],
+    query_keywords: Optional[Set[str]],
+    since: Optional[float],
+    until: Optional[float]
+) -> bool:
+    if since is not None:
+        end = _epoch(summary.get("end"))
+        if end is not None and end < since:
+            return False
+    if until is not None:
+        start = _epoch(summary.get("start"))
+        if start is not None and start > until:
+            return False
+    if query_keywords:
+        # Whole-token matching, as in keyword_search
+        return not query_keywords.isdisjoint(summary.get("keywords", []))
+    return True
+
+
+def iter_segment_files(
+    archive_dir: Path,
+    query_keywords: Optional[Set[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Path]]:
+    """
+    Yield segment files newest first, without reading them.
+
+    Sealed segments whose summary shows they can't contain a match are
+    left out; callers can use the summaries to skip more.
+
+    Args:
+        archive_dir: Path to episodes/archive
+        query_keywords: Lowercase query tokens; None to skip no segments
+        since: Skip segments that end before this time
+        until: Skip segments that start after this time
+
+    Yields:
+        (summary, path) tuples; the open segment comes first, with
+        summary None
+    """
+    archive_dir = Path(archive_dir)
+    since_epoch = since.timestamp() if since else None
+    until_epoch = until.timestamp() if until else None
+
+    yield None, archive_dir / OPEN_SEGMENT
+
+    for summary in reversed(load_manifest(archive_dir)):
+        if not _segment_may_match(summary, query_keywords, since_epoch, until_epoch):
+            continue
+        yield summary, archive_dir / summary["file"]
+
+
+def iter_segments(archive_dir: Path, **filters: Any) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield archived entry lists, newest segment first.
+
+    Args:
+        archive_dir: Path to episodes/archive
+        **filters: Passed to iter_segment_files
+
+    Yields:
+        Entries of one segment, newest first
+    """
+    for _, path in iter_segment_files(archive_dir, **filters):
+        yield storage.read_json(path, [])
+
+
+def iter_archived_entries(archive_dir: Path, **filters: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Yield archived entries newest first, skipping duplicate ids.
+
+    Args:
+        archive_dir: Path to episodes/archive
+        **filters: Passed to iter_segments
+
+    Yields:
+        Archived index entries
+    """
+    seen: Set[str] = set()
+    for entries in iter_segments(archive_dir, **filters):
+        for entry in entries:
+            entry_id = entry.get("id")
+            if entry_id in seen:
+                continue
+            if entry_id:
+                seen.add(entry_id)
+            yield entry
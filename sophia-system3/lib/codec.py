@@ -0,0 +1,214 @@
+"""
+codec.py - JSON codecs with optional fast backends
+
+Uses orjson or msgspec when installed and falls back to the stdlib json
+module. All codecs produce output the others can read, so files written
+with one backend (or pretty-printed by older versions) load with any.
+
+Encoding matches json.dump(..., default=str), except that datetimes,
+dates and times are written in ISO 8601 form ("2024-01-01T12:00:00", as
+msgspec always encodes them) by every codec; other values the codec
+can't serialize natively (paths, ...) are written as str(value). Storage
+writes model_dump(mode='json') data, which has no datetime objects left.
+"""
+
+import json
+from datetime import date, time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+
+def _default(value: Any) -> str:
+    """Encoding of values JSON has no type for (see module docstring)."""
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+class JSONCodec:
+    """Base class for JSON codecs."""
+
+    name = "base"
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        """Serialize data to UTF-8 JSON, indented by 2 if pretty."""
+        raise NotImplementedError
+
+    def loads(self, raw: Union[bytes, str]) -> Any:
+        """Parse JSON. Raises ValueError on invalid input."""
+        raise NotImplementedError
+
+    def loads_fields(self, raw: Union[bytes, str], fields: Sequence[str]) -> Dict[str, Any]:
+        """
+        Parse a JSON object keeping only the given top-level fields.
+
+        Fields absent from the document are absent from the result.
+        Raises ValueError on invalid input or a non-object document.
+        """
+        data = self.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        return {f: data[f] for f in fields if f in data}
+
+    @property
+    def available(self) -> bool:
+        """Check if this codec's backend is installed."""
+        return False
+
+
+class StdlibCodec(JSONCodec):
+    """The stdlib json module (always available)."""
+
+    name = "json"
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        if pretty:
+            text = json.dumps(data, indent=2, default=_default)
+        else:
+            text = json.dumps(data, separators=(',', ':'), default=_default)
+        return text.encode('utf-8')
+
+    def loads(self, raw: Union[bytes, str]) -> Any:
+        return json.loads(raw)
+
+    @property
+    def available(self) -> bool:
+        return True
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson codec."""
+
+    name = "orjson"
+
+    def __init__(self):
+        self._orjson = None
+
+    @property
+    def available(self) -> bool:
+        try:
+            import orjson
+            self._orjson = orjson
+            return True
+        except ImportError:
+            return False
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        orjson = self._orjson
+        # Route datetimes and dataclasses through the default like stdlib
+        option = (
+            orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+
+    def loads(self, raw: Union[bytes, str]) -> Any:
+        # orjson.JSONDecodeError subclasses ValueError
+        return self._orjson.loads(raw)
+
+
+class MsgspecCodec(JSONCodec):
+    """msgspec codec."""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._json = None
+        self._projections: Dict[tuple, Any] = {}
+
+    @property
+    def available(self) -> bool:
+        try:
+            import msgspec.json
+            self._json = msgspec.json
+            return True
+        except ImportError:
+            return False
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        raw = self._json.encode(data, enc_hook=_default)
+        if pretty:
+            raw = self._json.format(raw, indent=2)
+        return raw
+
+    def loads(self, raw: Union[bytes, str]) -> Any:
+        try:
+            return self._json.decode(raw)
+        except Exception as e:
+            raise ValueError(str(e)) from e
+
+    def loads_fields(self, raw: Union[bytes, str], fields: Sequence[str]) -> Dict[str, Any]:
+        # Decoding into a struct of just these fields skips the others
+        # without building Python objects for them
+        import msgspec
+
+        key = tuple(fields)
+        struct_type = self._projections.get(key)
+        if struct_type is None:
+            struct_type = msgspec.defstruct(
+                "Projection",
+                [(f, Any, msgspec.UNSET) for f in key]
+            )
+            self._projections[key] = struct_type
+
+        try:
+            decoded = self._json.decode(raw, type=struct_type)
+        except Exception as e:
+            raise ValueError(str(e)) from e
+
+        values = {f: getattr(decoded, f) for f in key}
+        return {f: v for f, v in values.items() if v is not msgspec.UNSET}
+
+
+CODECS = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "json": StdlibCodec,
+}
+
+_default_codec: Optional[JSONCodec] = None
+
+
+def available_codecs() -> List[JSONCodec]:
+    """Instances of every codec whose backend is installed, fastest first."""
+    codecs = [cls() for cls in CODECS.values()]
+    return [c for c in codecs if c.available]
+
+
+def get_codec(name: Optional[str] = None) -> JSONCodec:
+    """
+    Get a codec.
+
+    Args:
+        name: "orjson", "msgspec" or "json"; None picks the fastest
+            installed backend
+
+    Returns:
+        JSONCodec instance (stdlib if the requested one isn't installed)
+    """
+    global _default_codec
+
+    if name is not None:
+        codec = CODECS.get(name, StdlibCodec)()
+        return codec if codec.available else StdlibCodec()
+
+    if _default_codec is None:
+        _default_codec = available_codecs()[0]
+    return _default_codec
+
+
+def dumps(data: Any, pretty: bool = False) -> bytes:
+    """Serialize with the default codec."""
+    return get_codec().dumps(data, pretty=pretty)
+
+
+def loads(raw: Union[bytes, str]) -> Any:
+    """Parse with the default codec."""
+    return get_codec().loads(raw)
+
+
+def loads_fields(raw: Union[bytes, str], fields: Sequence[str]) -> Dict[str, Any]:
+    """Parse selected top-level fields of a JSON object with the default codec."""
+    return get_codec().loads_fields(raw, fields)
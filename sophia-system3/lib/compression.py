@@ -0,0 +1,101 @@
+"""
+compression.py - Transparent compression for stored JSON
+
+Episode files and archive segments can be written zstd- or gzip-compressed
+("compression" in config.json). Readers detect the format from the leading
+magic bytes, so plain, gzip and zstd files can sit side by side and a tree
+can be compressed (or the setting changed) at any time.
+
+zstd needs the optional `zstandard` package; when it isn't installed,
+"zstd" falls back to gzip from the stdlib.
+"""
+
+import gzip
+from typing import Optional
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+METHODS = ("none", "gzip", "zstd")
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def zstd_available() -> bool:
+    """Check if the zstandard package is installed."""
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_method(name: Optional[str]) -> Optional[str]:
+    """
+    Map a configured compression name to the method actually used.
+
+    Args:
+        name: "none", "gzip" or "zstd" (None and unknown names mean none)
+
+    Returns:
+        "gzip", "zstd" or None for uncompressed output
+    """
+    if name == "zstd":
+        return "zstd" if zstd_available() else "gzip"
+    if name == "gzip":
+        return "gzip"
+    return None
+
+
+def detect(raw: bytes) -> Optional[str]:
+    """Return "gzip" or "zstd" for compressed data, None for plain data."""
+    if raw[:2] == GZIP_MAGIC:
+        return "gzip"
+    if raw[:4] == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def compress(raw: bytes, method: Optional[str]) -> bytes:
+    """
+    Compress bytes.
+
+    Args:
+        raw: Uncompressed data
+        method: "gzip", "zstd" or None (returns raw unchanged)
+
+    Returns:
+        Compressed data
+    """
+    if method == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if method == "gzip":
+        # mtime=0 keeps output deterministic for identical input
+        return gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    return raw
+
+
+def decompress(raw: bytes) -> bytes:
+    """
+    Decompress data in any supported format; plain data is returned as is.
+
+    Raises ValueError for corrupt data or zstd data without the zstandard
+    package, so callers can treat it like invalid JSON.
+    """
+    method = detect(raw)
+    if method is None:
+        return raw
+
+    try:
+        if method == "gzip":
+            return gzip.decompress(raw)
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(raw)
+    except ImportError as e:
+        raise ValueError("zstd data requires the zstandard package") from e
+    except Exception as e:
+        # gzip raises OSError/EOFError, zstandard its own ZstdError
+        raise ValueError(f"Corrupt {method} data: {e}") from e
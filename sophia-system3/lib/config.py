@@ -22,6 +22,37 @@ MEMORY_CONFIG = {
     "archive_threshold_days": 365,
 }
 
+# Keyword ranking (BM25F over the episode index)
+RETRIEVAL_CONFIG = {
+    "bm25_k1": 1.2,  # Term frequency saturation
+    # Per-field weight and length normalization (0 = none, 1 = full)
+    "bm25_fields": {
+        "goal_summary": {"weight": 2.0, "b": 0.75},
+        "keywords": {"weight": 1.5, "b": 0.5},
+        "heuristics": {"weight": 1.0, "b": 0.75},
+    },
+    # search_episodes: "keyword" (BM25), "semantic" (embeddings) or
+    # "hybrid" (both, fused with reciprocal rank fusion). None: hybrid when
+    # config.json sets an embedding_provider, keyword otherwise
+    "search_mode": None,
+    "rrf_k": 60,  # Rank offset in 1 / (rrf_k + rank)
+    "hybrid_budget_ms": 300,  # Wait at most this long for the vector side (also its request timeout)
+    # Typo tolerance: query tokens found in no entry also match vocabulary
+    # tokens with this trigram similarity, weighted by it
+    "fuzzy_threshold": 0.3,  # pg_trgm's default; 0 disables fuzzy matching
+    "fuzzy_min_length": 4,  # Shorter tokens are only matched exactly
+    "fuzzy_max_expansions": 3,  # Vocabulary tokens per misspelled token
+}
+
+# Search result cache (query_cache.py), shared through ~/.sophia/query_cache.json
+QUERY_CACHE_CONFIG = {
+    "enabled": True,  # SOPHIA_DISABLE_CACHE=1 also disables it
+    "max_entries": 128,  # LRU size, in memory and in the file
+    "ttl_seconds": 300,  # Recency boosts drift, so entries expire
+    "file": "query_cache.json",
+    "lock_timeout": 0.2,  # Seconds to wait for the file; a busy file skips the write
+}
+
 # Reflection configuration
 REFLECTION_CONFIG = {
     "min_episodes_for_reflection": 1,
@@ -73,6 +104,61 @@ EMBEDDING_CONFIG = {
     "model": "text-embedding-3-small",
     "dimension": 1536,
     "batch_size": 10,
+    # Computed embeddings cached on disk (embedding_cache.py); SOPHIA_DISABLE_CACHE=1
+    # also disables it
+    "cache": True,
+    "cache_file": "embedding_cache.db",
+    "cache_max_entries": 50000,  # Least recently used entries evicted past this
+}
+
+# Approximate nearest-neighbour (IVF) search over the embedding sidecar
+ANN_CONFIG = {
+    "min_vectors": 20000,  # Below this, semantic search scores every vector
+    "nlist": None,  # Clusters; None = about 4 * sqrt(vectors) at training time
+    "nprobe": 16,  # Clusters scanned per query: the recall/latency knob
+    "train_iterations": 10,  # k-means iterations
+    "train_sample_per_list": 64,  # Training sample size per cluster
+    "retrain_growth": 2.0,  # build_ann_index(only_if_stale=True) retrains past this growth
+}
+
+# Storage backend configuration
+STORAGE_CONFIG = {
+    "backend": "json",  # "json" (one file per document) or "sqlite"
+    "sqlite_db": "sophia.db",  # Database file for the sqlite backend
+    "index_log_compact_bytes": 64 * 1024,  # Fold index.log.jsonl past this size
+    "archive_segment_size": 500,  # Entries per sealed archive segment
+    "bulk_read_workers": 8,  # Threads overlapping file reads in read_episodes
+    "bulk_process_threshold": 200,  # Batch size at which validation uses processes
+    # On-disk JSON layout per file type: "pretty" (indent=2) or "compact"
+    "json_formats": {
+        "episode": "compact",
+        "index": "compact",
+        "archive": "compact",
+        "default": "pretty",  # config, self model, rules, user models
+    },
+    # write_json durability (config.json "durability"): "none", "fsync-file"
+    # (data reaches disk before the rename) or "fsync-file+dir" (the rename
+    # too; storage.batch_writes() only defers these directory flushes)
+    "durability": "fsync-file",
+    "update_max_retries": 5,  # Re-runs of update_self_model/update_semantic_rules on conflict
+    "compression": "none",  # "none", "gzip" or "zstd" (config.json "compression")
+    # File types compressed when compression is enabled
+    "compressed_types": {"episode", "archive"},
+}
+
+# Lock configuration
+LOCK_CONFIG = {
+    # "auto" uses flock where fcntl exists; "dir" forces mkdir-based lock
+    # directories (e.g. when ~/.sophia is on NFS shared between hosts).
+    # The SOPHIA_LOCK_BACKEND environment variable overrides this.
+    "backend": "auto",
+    "stale_after": 30.0,  # Seconds without a heartbeat before a lock directory is broken
+    "heartbeat_interval": 2.0,  # Seconds between owner heartbeats while a lock directory is held
+    # Wait/hold metrics in ~/.sophia/logs/lock_metrics.jsonl (SOPHIA_LOCK_METRICS=0 disables)
+    "metrics": True,
+    "metrics_buffer_size": 100,  # Events buffered before an append
+    "metrics_flush_interval": 5.0,  # Seconds before buffered events are appended anyway
+    "metrics_max_bytes": 1024 * 1024,  # Roll over to lock_metrics.1.jsonl past this size
 }
 
 # File paths (relative to ~/.sophia/)
@@ -81,7 +167,11 @@ PATHS = {
     "self_model": "self_model.json",
     "semantic_rules": "semantic_rules.json",
     "episode_index": "episodes/index.json",
+    "episode_index_log": "episodes/index.log.jsonl",
+    "episode_archive": "episodes/archive/",
+    "episode_vectors": "episodes/vectors/",
     "user_models": "user_models/",
     "agent_results": "agent_results/",
     "logs": "logs/",
+    "sqlite_db": "sophia.db",
 }
@@ -0,0 +1,259 @@
+"""
+embedding_cache.py - Content-addressed cache of computed embeddings
+
+Embedding a text costs model CPU time (LocalProvider) or an API round
+trip (OpenAIProvider), and the same texts come back: queries are
+repeated, episodes are re-embedded when the sidecar is rebuilt and
+consolidation re-embeds rules. EmbeddingManager looks texts up here
+first and only sends the misses to the provider.
+
+Entries live in a SQLite database (~/.sophia/embedding_cache.db), keyed
+on the sha256 of (provider, model, normalized text):
+
+    embeddings(key TEXT PRIMARY KEY, vector BLOB, last_used REAL)
+
+Vectors are stored as little-endian float32 blobs, like the vector
+sidecar. The cache is capped at EMBEDDING_CONFIG["cache_max_entries"];
+past that the least recently used entries are evicted. Lookups that fail
+(locked or corrupt database) count as misses.
+
+Disabled by EMBEDDING_CONFIG["cache"] = False or SOPHIA_DISABLE_CACHE=1.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import storage
+from .config import EMBEDDING_CONFIG
+from .vector_store import pack_vector, unpack_vector
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+# Keys per statement, below SQLite's default variable limit
+_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    """Unicode- and whitespace-normalized form of a text, used in keys."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(provider: str, model: str, text: str) -> str:
+    """
+    Cache key of a text for one provider and model.
+
+    Args:
+        provider: Provider name (e.g. "openai")
+        model: Model identifier
+        text: Text to embed
+
+    Returns:
+        sha256 hex digest
+    """
+    data = "\0".join((provider, model, normalize_text(text)))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def round_trip(vector: Sequence[float]) -> List[float]:
+    """A vector as it reads back from the cache (float32 precision)."""
+    return unpack_vector(pack_vector(vector)).tolist()
+
+
+class EmbeddingCache:
+    """
+    LRU-capped embedding store in one SQLite database.
+
+    A connection is opened per operation, as in SQLiteStore, so an
+    instance can be shared between threads.
+    """
+
+    def __init__(self, db_path: Path, max_entries: int, timeout: float = 1.0):
+        """
+        Initialize the cache.
+
+        Args:
+            db_path: Path to the database file (created on first write)
+            max_entries: Entries kept; least recently used ones are evicted
+            timeout: Seconds to wait on a locked database
+        """
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._initialized = False
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=self.timeout)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += misses
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up many keys at once.
+
+        Hits are marked as used (best effort: a busy database leaves the
+        LRU order as it was).
+
+        Args:
+            keys: Cache keys (see cache_key)
+
+        Returns:
+            Vector or None per key, in key order
+        """
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        if unique and self.db_path.exists():
+            try:
+                conn = self._connect()
+                try:
+                    for start in range(0, len(unique), _CHUNK):
+                        chunk = unique[start:start + _CHUNK]
+                        marks = ",".join("?" * len(chunk))
+                        rows = conn.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk
+                        ).fetchall()
+                        found.update((key, unpack_vector(blob).tolist()) for key, blob in rows)
+                    self._touch(conn, list(found))
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                pass
+
+        vectors = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in vectors)
+        self._count(hits, len(vectors) - hits)
+        return vectors
+
+    def _touch(self, conn: sqlite3.Connection, keys: List[str]) -> None:
+        now = time.time()
+        try:
+            with conn:
+                for start in range(0, len(keys), _CHUNK):
+                    chunk = keys[start:start + _CHUNK]
+                    marks = ",".join("?" * len(chunk))
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *chunk]
+                    )
+        except sqlite3.Error:
+            pass
+
+    def put_many(self, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        """
+        Store vectors, then evict past the size cap.
+
+        Args:
+            items: (key, vector) pairs
+        """
+        if not items:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                        [(key, pack_vector(vector), now) for key, vector in items]
+                    )
+                    excess = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+                    if excess > 0:
+                        conn.execute(
+                            "DELETE FROM embeddings WHERE key IN "
+                            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                            (excess,)
+                        )
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def __len__(self) -> int:
+        if not self.db_path.exists():
+            return 0
+        try:
+            conn = self._connect()
+            try:
+                return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return 0
+
+    def clear(self) -> None:
+        """Delete every entry and reset the counters."""
+        if self.db_path.exists():
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.execute("DELETE FROM embeddings")
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            for name in self.stats:
+                self.stats[name] = 0
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the embedding cache of the current System 3 directory.
+
+    Returns:
+        EmbeddingCache, or None if caching is disabled
+    """
+    if not EMBEDDING_CONFIG["cache"] or os.environ.get("SOPHIA_DISABLE_CACHE"):
+        return None
+    path = storage.get_sophia_dir() / EMBEDDING_CONFIG["cache_file"]
+    with _caches_lock:
+        cache = _caches.get(str(path))
+        if cache is None:
+            cache = _caches[str(path)] = EmbeddingCache(path, EMBEDDING_CONFIG["cache_max_entries"])
+        return cache
+
+
+def embedding_cache_stats() -> Dict[str, Any]:
+    """
+    Get embedding cache counters for this process.
+
+    Returns:
+        Dict with hits, misses, entries on disk and hit_rate (0-1)
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"hits": 0, "misses": 0, "entries": 0, "hit_rate": 0.0}
+    with cache._lock:
+        stats = dict(cache.stats)
+    stats["entries"] = len(cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
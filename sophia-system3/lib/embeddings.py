@@ -7,16 +7,27 @@ Implements 3-tier fallback:
 3. Local model (if sentence-transformers installed)
 
 Lazy indexing: Episodes without embeddings use keyword fallback.
+
+EmbeddingManager caches computed embeddings on disk (embedding_cache.py),
+so a text is only sent to a provider once per model.
 """
 
+import heapq
 import os
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from pathlib import Path
 
 
 class EmbeddingProvider:
     """Base class for embedding providers."""
 
+    name = "none"  # Part of embedding cache keys
+
+    @property
+    def model_id(self) -> str:
+        """Model identifier, part of embedding cache keys."""
+        return ""
+
     def embed(self, text: str) -> Optional[List[float]]:
         """Generate embedding for text. Returns None if unavailable."""
         raise NotImplementedError
@@ -39,11 +50,18 @@ class EmbeddingProvider:
 class OpenAIProvider(EmbeddingProvider):
     """OpenAI API embedding provider."""
 
-    def __init__(self, model: str = "text-embedding-3-small"):
+    name = "openai"
+
+    def __init__(self, model: str = "text-embedding-3-small", timeout: Optional[float] = None):
         self.model = model
+        self.timeout = timeout  # Seconds per request; None keeps the client's default
         self._client = None
         self._dimension = 1536
 
+    @property
+    def model_id(self) -> str:
+        return self.model
+
     @property
     def available(self) -> bool:
         return "OPENAI_API_KEY" in os.environ
@@ -56,7 +74,11 @@ class OpenAIProvider(EmbeddingProvider):
         if self._client is None:
             try:
                 from openai import OpenAI
-                self._client = OpenAI()
+                if self.timeout is None:
+                    self._client = OpenAI()
+                else:
+                    # No retries: they couldn't finish within the timeout
+                    self._client = OpenAI(timeout=self.timeout, max_retries=0)
             except ImportError:
                 return None
         return self._client
@@ -99,11 +121,17 @@ class OpenAIProvider(EmbeddingProvider):
 class LocalProvider(EmbeddingProvider):
     """Local sentence-transformers embedding provider."""
 
+    name = "local"
+
     def __init__(self, model: str = "all-MiniLM-L6-v2"):
         self.model_name = model
         self._model = None
         self._dimension = 384
 
+    @property
+    def model_id(self) -> str:
+        return self.model_name
+
     @property
     def available(self) -> bool:
         try:
@@ -154,7 +182,15 @@ class LocalProvider(EmbeddingProvider):
 class EmbeddingManager:
     """Manages embedding generation with fallback providers."""
 
-    def __init__(self, config: Optional[Dict[str, Any]] = None):
+    def __init__(self, config: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None):
+        """
+        Initialize the manager.
+
+        Args:
+            config: System 3 config (embedding_provider, embedding_model)
+            timeout: Seconds a remote provider may take per request
+                (None: the client's default)
+        """
         config = config or {}
         provider_name = config.get("embedding_provider", "none")
 
@@ -163,7 +199,7 @@ class EmbeddingManager:
         # Add providers based on config
         if provider_name == "openai":
             model = config.get("embedding_model", "text-embedding-3-small")
-            self.providers.append(OpenAIProvider(model))
+            self.providers.append(OpenAIProvider(model, timeout=timeout))
         elif provider_name == "local":
             self.providers.append(LocalProvider())
 
@@ -179,18 +215,62 @@ class EmbeddingManager:
         return None
 
     def embed(self, text: str) -> Optional[List[float]]:
-        """Generate embedding using first available provider."""
-        provider = self.get_provider()
-        if provider:
-            return provider.embed(text)
-        return None
+        """Generate embedding using first available provider (cached)."""
+        return self.embed_batch([text])[0]
 
     def embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
-        """Generate embeddings for multiple texts."""
+        """
+        Generate embeddings for multiple texts.
+
+        Texts are looked up in the embedding cache in one query; only the
+        misses (each distinct text once) go to the provider, and what it
+        returns is cached. Results have float32 precision whether or not
+        they were cached.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embedding or None (provider unavailable or failed) per text
+        """
         provider = self.get_provider()
-        if provider:
+        if not provider:
+            return [None] * len(texts)
+        if not texts:
+            return []
+
+        from .embedding_cache import cache_key, get_embedding_cache, round_trip
+        cache = get_embedding_cache()
+        if cache is None:
+            if len(texts) == 1:
+                return [provider.embed(texts[0])]
             return provider.embed_batch(texts)
-        return [None] * len(texts)
+
+        keys = [cache_key(provider.name, provider.model_id, text) for text in texts]
+        vectors = cache.get_many(keys)
+
+        misses: Dict[str, str] = {}  # key -> text, in first-seen order
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                misses.setdefault(key, text)
+        if not misses:
+            return vectors
+
+        miss_texts = list(misses.values())
+        if len(miss_texts) == 1:
+            computed = [provider.embed(miss_texts[0])]
+        else:
+            computed = provider.embed_batch(miss_texts)
+        computed_by_key = {
+            key: round_trip(vector)
+            for key, vector in zip(misses, computed) if vector
+        }
+        cache.put_many(list(computed_by_key.items()))
+
+        return [
+            vector if vector is not None else computed_by_key.get(key)
+            for key, vector in zip(keys, vectors)
+        ]
 
     @property
     def available(self) -> bool:
@@ -204,9 +284,13 @@ def embeddings_available() -> bool:
     return manager.available
 
 
-def embed_text(text: str, config: Optional[Dict[str, Any]] = None) -> Optional[List[float]]:
+def embed_text(
+    text: str,
+    config: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None
+) -> Optional[List[float]]:
     """Generate embedding for text using configured provider."""
-    manager = EmbeddingManager(config)
+    manager = EmbeddingManager(config, timeout=timeout)
     return manager.embed(text)
 
 
@@ -223,3 +307,112 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
         return 0.0
 
     return dot_product / (norm_a * norm_b)
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def normalize_rows(matrix: Any) -> Any:
+    """
+    Scale each row of a matrix to unit length.
+
+    Zero rows stay zero, so they score 0 against any query.
+
+    Args:
+        matrix: (N, d) array-like
+
+    Returns:
+        float32 numpy array, or a list of lists without numpy
+    """
+    np = _numpy()
+    if np is None:
+        normalized = []
+        for row in matrix:
+            norm = sum(x * x for x in row) ** 0.5
+            normalized.append([x / norm for x in row] if norm else list(row))
+        return normalized
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = row_norms(matrix)
+    norms[norms == 0] = 1.0
+    return matrix / norms[:, None]
+
+
+def row_norms(matrix: Any) -> Any:
+    """
+    Euclidean norm of each row (numpy only).
+
+    Args:
+        matrix: (N, d) numpy array or memmap
+
+    Returns:
+        (N,) float32 array
+    """
+    np = _numpy()
+    # einsum avoids materializing matrix * matrix
+    return np.sqrt(np.einsum('ij,ij->i', matrix, matrix)).astype(np.float32)
+
+
+def top_k_similar(
+    query: Sequence[float],
+    matrix: Any,
+    ids: Sequence[str],
+    k: int = 10,
+    normalized: bool = False,
+    norms: Any = None
+) -> List[Tuple[str, float]]:
+    """
+    Find the rows of a matrix most similar to a query by cosine similarity.
+
+    With numpy this is one matrix-vector product plus argpartition, so
+    only the k winners are sorted. Without numpy each row is scored with
+    cosine_similarity().
+
+    Args:
+        query: Query vector (d,)
+        matrix: (N, d) float32 array or memmap; any iterable of rows is
+            scored without numpy
+        ids: Id of each row
+        k: Maximum number of results
+        normalized: Rows already have unit length (see normalize_rows)
+        norms: Precomputed row norms (see row_norms), for matrices that
+            can't be normalized in place, e.g. a read-only memmap
+
+    Returns:
+        List of (id, cosine_similarity) tuples, most similar first. Empty
+        if the query is a zero vector or its dimension doesn't match.
+    """
+    if k <= 0 or not len(ids):
+        return []
+
+    np = _numpy()
+    if np is None or not hasattr(matrix, "shape"):
+        scored = (
+            (row_id, cosine_similarity(list(query), list(row)))
+            for row_id, row in zip(ids, matrix)
+        )
+        return heapq.nlargest(k, scored, key=lambda x: x[1])
+
+    q = np.asarray(query, dtype=np.float32)
+    if q.ndim != 1 or q.shape[0] != matrix.shape[1]:
+        return []
+    q_norm = float(np.linalg.norm(q))
+    if q_norm == 0:
+        return []
+
+    scores = matrix @ (q / q_norm)
+    if not normalized:
+        if norms is None:
+            norms = row_norms(matrix)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(norms > 0, scores / norms, 0.0)
+
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(ids[i], float(scores[i])) for i in top]
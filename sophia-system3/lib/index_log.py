@@ -0,0 +1,125 @@
+"""
+index_log.py - Append-only delta log for the episode index
+
+The JSON episode index is kept as two files:
+- episodes/index.json: compacted snapshot, newest entry first
+- episodes/index.log.jsonl: one entry per line, oldest first
+
+Adding an episode appends a single line, so the cost doesn't grow with the
+index. Readers merge the snapshot with the log tail; compaction folds the
+log into the snapshot once it passes a size threshold.
+
+Entries are keyed by episode id: a log entry whose id is already in the
+snapshot replaces it in place. That makes re-folding a log after a crash
+between the snapshot write and the truncate harmless.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List
+
+from . import codec
+
+
+def append_entry(log_path: Path, entry: Dict[str, Any]) -> int:
+    """
+    Append one entry to the log.
+
+    Callers hold the index lock so compaction can't truncate mid-append.
+
+    Args:
+        log_path: Path to index.log.jsonl
+        entry: Episode index entry
+
+    Returns:
+        Size of the log in bytes after the append
+    """
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    line = codec.dumps(entry) + b"\n"
+    with open(log_path, 'ab') as f:
+        f.write(line)
+        return f.tell()
+
+
+def read_log(log_path: Path, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Read entries from the log, oldest first.
+
+    A torn or corrupt line (e.g. from a crash mid-append) is skipped.
+
+    Args:
+        log_path: Path to index.log.jsonl
+        offset: Byte offset to start at, e.g. a size append_entry returned
+
+    Returns:
+        List of entries in append order
+    """
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            lines = f.read().decode('utf-8', errors='replace').splitlines()
+    except (FileNotFoundError, IOError):
+        return []
+
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = codec.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict):
+            entries.append(entry)
+
+    return entries
+
+
+def merge_entries(
+    snapshot_entries: List[Dict[str, Any]],
+    log_entries: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Merge snapshot entries with log entries.
+
+    Args:
+        snapshot_entries: Entries from index.json, newest first
+        log_entries: Entries from the log, oldest first
+
+    Returns:
+        Merged entries, newest first
+    """
+    if not log_entries:
+        return list(snapshot_entries)
+
+    positions = {
+        e.get("id"): i for i, e in enumerate(snapshot_entries) if e.get("id")
+    }
+    merged = list(snapshot_entries)
+    new_entries = []
+    new_positions: Dict[str, int] = {}
+
+    for entry in log_entries:
+        entry_id = entry.get("id")
+        if entry_id in positions:
+            merged[positions[entry_id]] = entry
+        elif entry_id in new_positions:
+            new_entries[new_positions[entry_id]] = entry
+        else:
+            if entry_id:
+                new_positions[entry_id] = len(new_entries)
+            new_entries.append(entry)
+
+    new_entries.reverse()
+    return new_entries + merged
+
+
+def truncate_log(log_path: Path) -> None:
+    """Empty the log after its entries were folded into the snapshot."""
+    try:
+        with open(log_path, 'r+', encoding='utf-8') as f:
+            f.truncate(0)
+    except FileNotFoundError:
+        pass
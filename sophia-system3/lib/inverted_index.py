@@ -0,0 +1,247 @@
+"""
+inverted_index.py - Token postings for keyword search over the episode index
+
+Maps each token to the episodes containing it, with per-field term
+frequencies, so a query only touches the postings of its own tokens
+instead of scanning every index entry. Fields are those of
+text.entry_field_tokens(): goal_summary, keywords and heuristics (when an
+entry carries them).
+
+Persisted as episodes/index.terms.json for the JSON backend:
+    {
+      "generation": "<last_updated of the index.json it was built from>",
+      "fields": ["goal_summary", "keywords", "heuristics"],
+      "postings": {"docker": {"ep_1": [1, 1, 0]}, ...},
+      "lengths": {"ep_1": [3, 2, 0], ...}
+    }
+
+Corpus statistics for BM25 (document count, document frequency, average
+field length) are maintained as entries are added and removed.
+
+storage also records how much of index.log.jsonl the file covers
+("log_offset", in bytes): appends through the library index their entry
+and advance it, compaction resets it, and readers only add entries past
+it (such as those the session_end hook appended). The sqlite backend
+keeps the same postings in its index_postings and index_lengths tables.
+
+Misspelled query tokens are matched to vocabulary tokens through a
+character trigram index (trigram_index.py). It is not persisted: storage
+attaches one per index location when it loads the postings, and add()
+and remove() keep it in step with the vocabulary after that.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .text import FIELDS, entry_field_tokens
+from .trigram_index import TrigramIndex
+
+
+def entry_terms(entry: Dict[str, Any]) -> Tuple[Dict[str, List[int]], List[int]]:
+    """
+    Per-field term frequencies and field lengths of an index entry.
+
+    Args:
+        entry: Episode index entry
+
+    Returns:
+        Tuple of (token -> per-field term frequencies, per-field token counts)
+    """
+    field_tokens = entry_field_tokens(entry)
+    frequencies: Dict[str, List[int]] = {}
+    for i, field in enumerate(FIELDS):
+        for token in field_tokens[field]:
+            frequencies.setdefault(token, [0] * len(FIELDS))[i] += 1
+    return frequencies, [len(field_tokens[field]) for field in FIELDS]
+
+
+class InvertedIndex:
+    """
+    Token -> {episode id: per-field term frequencies}.
+
+    Adding an entry whose id is already indexed replaces it, matching the
+    episode index's replace-by-id semantics.
+    """
+
+    def __init__(self, generation: Optional[str] = None):
+        self.generation = generation
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        self.lengths: Dict[str, List[int]] = {}
+        self.total_lengths: List[int] = [0] * len(FIELDS)
+        # Episode id -> its tokens, so remove() only touches those postings.
+        # Not persisted: None until needed for an index loaded by from_dict
+        self._doc_tokens: Optional[Dict[str, List[str]]] = {}
+        self.trigrams: Optional[TrigramIndex] = None  # See attach_trigrams
+
+    @classmethod
+    def build(cls, entries: Iterable[Dict[str, Any]], generation: Optional[str] = None) -> 'InvertedIndex':
+        """
+        Index a list of entries from scratch.
+
+        Args:
+            entries: Episode index entries
+            generation: Generation of the source the entries came from
+
+        Returns:
+            InvertedIndex
+        """
+        index = cls(generation)
+        for entry in entries:
+            index.add(entry)
+        return index
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        """
+        Index an entry, replacing any earlier version with the same id.
+
+        Args:
+            entry: Episode index entry
+        """
+        episode_id = entry.get("id")
+        if not episode_id:
+            return
+        self.remove(episode_id)
+
+        frequencies, lengths = entry_terms(entry)
+        for token, tf in frequencies.items():
+            docs = self.postings.get(token)
+            if docs is None:
+                docs = self.postings[token] = {}
+                if self.trigrams is not None:
+                    self.trigrams.add(token)
+            docs[episode_id] = tf
+        if self._doc_tokens is not None:
+            self._doc_tokens[episode_id] = list(frequencies)
+        self.lengths[episode_id] = lengths
+        self.total_lengths = [t + n for t, n in zip(self.total_lengths, lengths)]
+
+    def remove(self, episode_id: str) -> bool:
+        """
+        Drop an entry from the index.
+
+        Args:
+            episode_id: Episode id
+
+        Returns:
+            True if it was indexed
+        """
+        lengths = self.lengths.pop(episode_id, None)
+        if lengths is None:
+            return False
+        self.total_lengths = [t - n for t, n in zip(self.total_lengths, lengths)]
+
+        if self._doc_tokens is None:
+            self._doc_tokens = {}
+            for token, docs in self.postings.items():
+                for doc_id in docs:
+                    self._doc_tokens.setdefault(doc_id, []).append(token)
+
+        for token in self._doc_tokens.pop(episode_id, ()):
+            docs = self.postings[token]
+            del docs[episode_id]
+            if not docs:
+                del self.postings[token]
+                if self.trigrams is not None:
+                    self.trigrams.discard(token)
+        return True
+
+    def lookup(self, token: str) -> Dict[str, List[int]]:
+        """Postings for a token: episode id -> per-field term frequencies."""
+        return self.postings.get(token, {})
+
+    def document_frequency(self, token: str) -> int:
+        """Number of indexed entries containing a token."""
+        return len(self.postings.get(token, ()))
+
+    def attach_trigrams(self, trigrams: TrigramIndex) -> None:
+        """
+        Keep a trigram index of the vocabulary from now on.
+
+        The index is brought in line with the vocabulary once (indexing
+        only tokens it lacks), then add() and remove() index and prune
+        tokens as they enter and leave the vocabulary.
+
+        Args:
+            trigrams: Trigram index, possibly holding an earlier vocabulary
+                of the same episode index
+        """
+        trigrams.sync(self.postings)
+        self.trigrams = trigrams
+
+    def fuzzy_matches(self, token: str, threshold: float, limit: int) -> List[Tuple[str, float]]:
+        """
+        Vocabulary tokens spelled like a token.
+
+        Only the trigram postings of the token are read. An index without
+        a trigram index (see attach_trigrams) builds one first.
+
+        Args:
+            token: Query token
+            threshold: Minimum trigram similarity (0-1)
+            limit: Maximum number of matches
+
+        Returns:
+            List of (token, similarity) tuples, most similar first
+        """
+        if self.trigrams is None:
+            self.attach_trigrams(TrigramIndex())
+        return self.trigrams.similar(token, threshold, limit)
+
+    def average_lengths(self) -> List[float]:
+        """Mean token count per field over indexed entries."""
+        count = len(self.lengths)
+        return [total / count if count else 0.0 for total in self.total_lengths]
+
+    def __contains__(self, episode_id: str) -> bool:
+        return episode_id in self.lengths
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def copy(self) -> 'InvertedIndex':
+        """Copy that can be modified without touching this index."""
+        index = InvertedIndex(self.generation)
+        index.postings = {token: dict(docs) for token, docs in self.postings.items()}
+        index.lengths = dict(self.lengths)
+        index.total_lengths = list(self.total_lengths)
+        if self._doc_tokens is not None:
+            index._doc_tokens = dict(self._doc_tokens)  # Token lists are replaced, never changed
+        else:
+            index._doc_tokens = None
+        if self.trigrams is not None:
+            index.attach_trigrams(self.trigrams.copy())
+        return index
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable form (see module docstring)."""
+        return {
+            "generation": self.generation,
+            "fields": list(FIELDS),
+            "postings": self.postings,
+            "lengths": self.lengths,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Optional['InvertedIndex']:
+        """
+        Load a persisted index.
+
+        Args:
+            data: Parsed inverted_index.json
+
+        Returns:
+            InvertedIndex, or None if the data is missing, malformed or
+            was built with different fields
+        """
+        if not isinstance(data, dict) or data.get("fields") != list(FIELDS):
+            return None
+        postings = data.get("postings")
+        lengths = data.get("lengths")
+        if not isinstance(postings, dict) or not isinstance(lengths, dict):
+            return None
+
+        index = cls(data.get("generation"))
+        index.postings = postings
+        index.lengths = lengths
+        index._doc_tokens = None
+        index.total_lengths = [sum(column) for column in zip(*lengths.values())] or [0] * len(FIELDS)
+        return index
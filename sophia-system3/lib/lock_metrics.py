@@ -0,0 +1,276 @@
+"""
+lock_metrics.py - Wait and hold times for System 3 file locks
+
+FileLock reports every acquisition here: how long it waited, how long the
+lock was held, and whether it timed out or broke a stale lock. Events for
+locks inside ~/.sophia are buffered in memory and appended to
+logs/lock_metrics.jsonl in batches (one write per batch, so hooks and
+concurrent sessions interleave whole lines). Past
+LOCK_CONFIG["metrics_max_bytes"] the file is rolled over to
+lock_metrics.1.jsonl, replacing the previous one.
+
+Each line is one event:
+    {"ts": 1718000000.0, "lock": "episodes/index.json", "event": "acquire",
+     "wait": 0.0012, "hold": 0.0104, "shared": false, "pid": 4242}
+
+where event is "acquire" (wait and hold set), "timeout" (wait set) or
+"stale_break".
+
+Usage:
+    python3 -m lib.lock_metrics    # print a summary
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import LOCK_CONFIG
+
+METRICS_FILE = "lock_metrics.jsonl"
+ROLLED_FILE = "lock_metrics.1.jsonl"
+
+_buffer: Dict[str, List[Dict[str, Any]]] = {}
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def metrics_enabled() -> bool:
+    """Whether lock events are recorded (SOPHIA_LOCK_METRICS=0 disables)."""
+    env = os.environ.get("SOPHIA_LOCK_METRICS")
+    if env is not None:
+        return env not in ("0", "false", "no", "")
+    return bool(LOCK_CONFIG["metrics"])
+
+
+def _sophia_dir() -> str:
+    # Imported here: storage imports locking, which imports this module
+    from . import storage
+    return os.path.abspath(storage.get_sophia_dir())
+
+
+def record(
+    file_path: Path,
+    event: str,
+    wait: Optional[float] = None,
+    hold: Optional[float] = None,
+    shared: bool = False
+) -> None:
+    """
+    Record a lock event.
+
+    Locks on files outside ~/.sophia are ignored. Never raises: metrics
+    must not break the operation being measured.
+
+    Args:
+        file_path: The file the lock protects
+        event: "acquire", "timeout" or "stale_break"
+        wait: Seconds spent acquiring
+        hold: Seconds the lock was held
+        shared: Whether it was a shared lock
+    """
+    if not metrics_enabled():
+        return
+
+    try:
+        # Plain string handling: this runs on every lock release
+        root = _sophia_dir()
+        path = os.path.abspath(file_path)
+        if not path.startswith(root + os.sep):
+            return
+
+        entry: Dict[str, Any] = {
+            "ts": round(time.time(), 3),
+            "lock": path[len(root) + 1:].replace(os.sep, "/"),
+            "event": event,
+        }
+        if wait is not None:
+            entry["wait"] = round(wait, 6)
+        if hold is not None:
+            entry["hold"] = round(hold, 6)
+        if shared:
+            entry["shared"] = True
+        entry["pid"] = os.getpid()
+
+        with _buffer_lock:
+            _buffer.setdefault(os.path.join(root, "logs"), []).append(entry)
+            pending = sum(len(entries) for entries in _buffer.values())
+            due = (
+                pending >= LOCK_CONFIG["metrics_buffer_size"]
+                or time.monotonic() - _last_flush >= LOCK_CONFIG["metrics_flush_interval"]
+                or event != "acquire"  # Rare and worth keeping if we crash
+            )
+        if due:
+            flush()
+    except Exception:
+        pass
+
+
+def flush() -> None:
+    """Append buffered events to the metrics file(s)."""
+    global _last_flush
+
+    with _buffer_lock:
+        batches = list(_buffer.items())
+        _buffer.clear()
+        _last_flush = time.monotonic()
+
+    for logs_dir, entries in batches:
+        try:
+            logs_dir = Path(logs_dir)
+            logs_dir.mkdir(parents=True, exist_ok=True)
+            path = logs_dir / METRICS_FILE
+            _maybe_roll(path)
+            data = "".join(json.dumps(e) + "\n" for e in entries).encode("utf-8")
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass  # Dropped; metrics are best effort
+
+
+def _maybe_roll(path: Path) -> None:
+    try:
+        if path.stat().st_size >= LOCK_CONFIG["metrics_max_bytes"]:
+            # Racing processes both renaming is harmless: one wins, the
+            # other's rename fails or rolls a fresh, tiny file
+            os.replace(path, path.with_name(ROLLED_FILE))
+    except OSError:
+        pass
+
+
+atexit.register(flush)
+
+
+def _read_events(since: Optional[float]) -> List[Dict[str, Any]]:
+    logs_dir = Path(_sophia_dir()) / "logs"
+    events = []
+    for name in (ROLLED_FILE, METRICS_FILE):
+        try:
+            with open(logs_dir / name, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # Torn or partial line
+                    if not isinstance(event, dict) or "lock" not in event:
+                        continue
+                    if since is not None and event.get("ts", 0) < since:
+                        continue
+                    events.append(event)
+        except OSError:
+            continue
+    return events
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    values = sorted(values)
+
+    def rank(p: float) -> float:
+        # Nearest-rank percentile
+        return values[max(0, min(len(values) - 1, int(-(-p * len(values) // 100)) - 1))]
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": values[-1]}
+
+
+def summarize(since: Optional[float] = None, top: int = 5) -> Dict[str, Any]:
+    """
+    Summarize recorded lock events.
+
+    Args:
+        since: Only count events at or after this Unix time
+        top: Number of worst offenders to list
+
+    Returns:
+        Dict with:
+        - locks: per lock path, acquisition count, wait and hold
+          percentiles (p50/p95/p99/max, seconds), total wait, timeouts
+          and stale breaks
+        - worst: the `top` lock paths by total wait time (timeouts count
+          their full wait), each with its p95 wait and timeouts
+        - events: number of events summarized
+    """
+    flush()
+    events = _read_events(since)
+
+    grouped: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        group = grouped.setdefault(event["lock"], {
+            "waits": [], "holds": [], "timeouts": 0, "stale_breaks": 0, "total_wait": 0.0
+        })
+        kind = event.get("event")
+        wait = event.get("wait")
+        if isinstance(wait, (int, float)):
+            group["total_wait"] += wait
+            if kind == "acquire":
+                group["waits"].append(wait)
+        if kind == "acquire" and isinstance(event.get("hold"), (int, float)):
+            group["holds"].append(event["hold"])
+        elif kind == "timeout":
+            group["timeouts"] += 1
+        elif kind == "stale_break":
+            group["stale_breaks"] += 1
+
+    locks = {}
+    for name, group in grouped.items():
+        locks[name] = {
+            "acquisitions": len(group["waits"]),
+            "wait": _percentiles(group["waits"]),
+            "hold": _percentiles(group["holds"]),
+            "total_wait": round(group["total_wait"], 6),
+            "timeouts": group["timeouts"],
+            "stale_breaks": group["stale_breaks"],
+        }
+
+    worst = sorted(locks, key=lambda n: locks[n]["total_wait"], reverse=True)[:top]
+    return {
+        "locks": locks,
+        "worst": [
+            {
+                "lock": name,
+                "total_wait": locks[name]["total_wait"],
+                "p95_wait": locks[name]["wait"]["p95"],
+                "timeouts": locks[name]["timeouts"],
+            }
+            for name in worst
+        ],
+        "events": len(events),
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Render summarize() output as a plain-text table (times in ms)."""
+    if not summary["locks"]:
+        return "No lock events recorded."
+
+    def ms(seconds: float) -> str:
+        return f"{seconds * 1000:.1f}"
+
+    lines = [
+        f"{'lock':<32} {'n':>6} {'wait p50':>9} {'p95':>8} {'p99':>8} "
+        f"{'hold p50':>9} {'p95':>8} {'p99':>8} {'timeouts':>9} {'stale':>6}"
+    ]
+    for entry in summary["worst"] + [
+        {"lock": n} for n in sorted(summary["locks"])
+        if n not in {w["lock"] for w in summary["worst"]}
+    ]:
+        stats = summary["locks"][entry["lock"]]
+        wait, hold = stats["wait"], stats["hold"]
+        lines.append(
+            f"{entry['lock']:<32} {stats['acquisitions']:>6} {ms(wait['p50']):>9} "
+            f"{ms(wait['p95']):>8} {ms(wait['p99']):>8} {ms(hold['p50']):>9} "
+            f"{ms(hold['p95']):>8} {ms(hold['p99']):>8} {stats['timeouts']:>9} "
+            f"{stats['stale_breaks']:>6}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_summary(summarize()))
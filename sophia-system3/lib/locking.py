@@ -1,71 +1,239 @@
 """
-locking.py - File locking utilities using directory-based locks
+locking.py - Cross-process file locking
 
 Protocol:
-1. Acquire `{filename}.lock` (create directory exclusively)
+1. Acquire `{filename}.lock`
 2. Read current state
 3. Modify
 4. Write atomically (write to .tmp, rename)
-5. Release lock (delete .lock directory)
-6. Lock timeout: 5 seconds (stale lock = force acquire)
+5. Release lock
+6. Lock timeout: 5 seconds
+
+Where fcntl is available, `{filename}.lock` is a regular file locked with
+flock(2): waiters block in the kernel and wake as soon as the holder
+releases (or dies, since the kernel drops its locks), and readers can
+share the lock while writers hold it exclusively. The file is left in
+place after release. Hooks take the same lock with flock(1).
+
+Elsewhere, with LOCK_CONFIG["backend"] (or SOPHIA_LOCK_BACKEND) set to
+"dir", or while an old-style lock directory is present, `{filename}.lock`
+is a directory created with mkdir and polled every poll_interval.
+Directory locks are always exclusive. The holder records its pid, host
+and a heartbeat in owner.json and refreshes the heartbeat from a
+background thread, so a long critical section keeps its lock. A waiter
+breaks the lock straight away when the owner process is gone (same
+host), or once the heartbeat is older than LOCK_CONFIG["stale_after"].
+
+Wait and hold times, timeouts and stale breaks of locks inside ~/.sophia
+are recorded by lock_metrics.
 """
 
+import json
 import os
 import time
 import shutil
+import socket
+import threading
+import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 from contextlib import contextmanager
 
+from . import lock_metrics
+from .config import LOCK_CONFIG
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+OWNER_FILE = "owner.json"
+
 
 class LockAcquisitionError(Exception):
     """Raised when lock cannot be acquired within timeout."""
     pass
 
 
+def lock_backend() -> str:
+    """Configured lock backend: "auto" or "dir"."""
+    return os.environ.get("SOPHIA_LOCK_BACKEND") or LOCK_CONFIG["backend"]
+
+
+def _pid_alive(pid: int) -> Optional[bool]:
+    """Whether a local process exists; None if that can't be checked."""
+    if os.name == 'nt':
+        return None  # os.kill(pid, 0) would send CTRL_C_EVENT
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    except OSError:
+        return None
+    return True
+
+
 class FileLock:
     """
-    Directory-based file lock for cross-process synchronization.
+    File lock for cross-process synchronization.
 
-    Uses mkdir for atomic lock acquisition since it's guaranteed to be
-    atomic on all filesystems.
+    Uses flock(2) on a lock file when fcntl is available and falls back
+    to mkdir-based directory locks, since mkdir is atomic on all
+    filesystems.
     """
 
-    def __init__(self, file_path: str, timeout: float = 5.0, poll_interval: float = 0.1):
+    def __init__(
+        self,
+        file_path: str,
+        timeout: float = 5.0,
+        poll_interval: float = 0.1,
+        shared: bool = False
+    ):
         """
         Initialize a file lock.
 
         Args:
             file_path: Path to the file being protected
             timeout: Maximum seconds to wait for lock acquisition
-            poll_interval: Seconds between lock acquisition attempts
+            poll_interval: Seconds between attempts (directory locks only)
+            shared: Take a shared (reader) lock that other shared holders
+                don't block; directory locks are always exclusive
         """
         self.file_path = Path(file_path)
         self.lock_path = Path(f"{file_path}.lock")
         self.timeout = timeout
         self.poll_interval = poll_interval
+        self.shared = shared
         self._acquired = False
+        self._fd: Optional[int] = None
+        self._token: Optional[str] = None
+        self._heartbeat_stop: Optional[threading.Event] = None
+        self._acquired_at: Optional[float] = None
+        self._wait_time = 0.0
+
+    @property
+    def uses_flock(self) -> bool:
+        """Whether this lock is taken with flock (vs. a lock directory)."""
+        return (
+            fcntl is not None
+            and lock_backend() != "dir"
+            and not self.lock_path.is_dir()
+        )
+
+    # Directory lock ownership
+
+    def _read_owner(self, lock_dir: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+        try:
+            with open((lock_dir or self.lock_path) / OWNER_FILE, 'r', encoding='utf-8') as f:
+                owner = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return owner if isinstance(owner, dict) else None
+
+    def _write_owner(self, acquired_at: Optional[float] = None) -> None:
+        owner = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "token": self._token,
+            "acquired_at": acquired_at or time.time(),
+            "heartbeat": time.time(),
+        }
+        temp_path = self.lock_path / f".{OWNER_FILE}.{self._token}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(owner, f)
+        os.replace(temp_path, self.lock_path / OWNER_FILE)
+
+    def heartbeat(self) -> None:
+        """
+        Mark a held directory lock as still in use.
+
+        Called periodically by a background thread while the lock is held;
+        also bumps the directory mtime, which is what lock holders from
+        before owner records were added check.
+        """
+        if not self._acquired or self._fd is not None:
+            return
+        owner = self._read_owner()
+        if owner is None or owner.get("token") != self._token:
+            return  # Broken as stale and taken by someone else
+        try:
+            self._write_owner(owner.get("acquired_at"))
+            os.utime(self.lock_path)
+        except OSError:
+            pass
+
+    def _start_heartbeat(self) -> None:
+        stop = threading.Event()
+        self._heartbeat_stop = stop
+
+        def beat():
+            while not stop.wait(LOCK_CONFIG["heartbeat_interval"]):
+                self.heartbeat()
+
+        threading.Thread(target=beat, name="sophia-lock-heartbeat", daemon=True).start()
 
     def _is_lock_stale(self) -> bool:
-        """Check if existing lock is stale (older than timeout)."""
+        """
+        Check if an existing lock directory is stale.
+
+        Stale means the owner process is gone (same host) or hasn't sent
+        a heartbeat for LOCK_CONFIG["stale_after"] seconds. A lock without
+        an owner record (being created, or taken by a hook or an older
+        version) is judged by the directory mtime instead.
+        """
         if not self.lock_path.exists():
             return False
 
-        try:
-            lock_mtime = self.lock_path.stat().st_mtime
-            return (time.time() - lock_mtime) > self.timeout
-        except OSError:
-            # Lock was removed between exists() and stat()
+        stale_after = LOCK_CONFIG["stale_after"]
+        owner = self._read_owner()
+
+        if owner is None:
+            try:
+                lock_mtime = self.lock_path.stat().st_mtime
+                return (time.time() - lock_mtime) > stale_after
+            except OSError:
+                # Lock was removed between exists() and stat()
+                return True
+
+        if owner.get("host") == socket.gethostname() and isinstance(owner.get("pid"), int):
+            if _pid_alive(owner["pid"]) is False:
+                return True
+
+        heartbeat = owner.get("heartbeat")
+        if not isinstance(heartbeat, (int, float)):
             return True
+        return (time.time() - heartbeat) > stale_after
 
     def _force_remove_stale_lock(self) -> bool:
-        """Remove a stale lock. Returns True if removed."""
+        """
+        Remove a stale lock. Returns True if removed.
+
+        The lock directory is first renamed aside, which only one waiter
+        can do. If the owner record moved with it isn't the one judged
+        stale (another waiter broke the lock and took it meanwhile), it
+        is put back.
+        """
+        judged = self._read_owner()
+        aside = self.lock_path.with_name(f"{self.lock_path.name}.stale.{uuid.uuid4().hex[:8]}")
         try:
-            shutil.rmtree(self.lock_path)
-            return True
+            os.rename(self.lock_path, aside)
         except OSError:
             return False
 
+        moved = self._read_owner(aside)
+        if (moved or {}).get("token") != (judged or {}).get("token"):
+            try:
+                os.rename(aside, self.lock_path)
+                return False
+            except OSError:
+                pass  # Lock re-taken in between; the moved one is lost either way
+
+        shutil.rmtree(aside, ignore_errors=True)
+        lock_metrics.record(self.file_path, "stale_break")
+        return True
+
     def acquire(self) -> bool:
         """
         Acquire the lock.
@@ -76,19 +244,105 @@ class FileLock:
         Raises:
             LockAcquisitionError if timeout exceeded
         """
+        start = time.monotonic()
+        try:
+            if self.uses_flock:
+                self._acquire_flock()
+            else:
+                self._acquire_dir()
+        except LockAcquisitionError:
+            waited = time.monotonic() - start
+            if waited >= self.timeout:  # Not e.g. a missing directory
+                lock_metrics.record(self.file_path, "timeout", wait=waited, shared=self.shared)
+            raise
+
+        self._acquired_at = time.monotonic()
+        self._wait_time = self._acquired_at - start
+        return True
+
+    def _acquire_flock(self) -> bool:
+        try:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except IsADirectoryError:
+            # An old-style lock directory appeared meanwhile
+            return self._acquire_dir()
+        except OSError as e:
+            raise LockAcquisitionError(
+                f"Error acquiring lock for {self.file_path}: {e}"
+            )
+
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Contended: the fd now belongs to the waiter
+            self._wait_flock(fd, operation)
+        except OSError as e:
+            os.close(fd)
+            raise LockAcquisitionError(
+                f"Error acquiring lock for {self.file_path}: {e}"
+            )
+
+        self._fd = fd
+        self._acquired = True
+        return True
+
+    def _wait_flock(self, fd: int, operation: int) -> None:
+        """
+        Block on flock for up to timeout seconds.
+
+        flock itself can't time out, so the blocking call runs in a
+        helper thread. If the wait times out the helper keeps the fd and,
+        should it still get the lock later, closes the fd to hand the lock
+        straight back.
+        """
+        acquired = threading.Event()
+        guard = threading.Lock()
+        state = {"abandoned": False, "error": None}
+
+        def wait():
+            try:
+                fcntl.flock(fd, operation)
+            except OSError as e:
+                state["error"] = e
+            with guard:
+                if state["abandoned"]:
+                    os.close(fd)  # Closing releases the lock
+                else:
+                    acquired.set()
+
+        threading.Thread(target=wait, name="sophia-lock-wait", daemon=True).start()
+        acquired.wait(self.timeout)
+
+        with guard:
+            if not acquired.is_set():
+                state["abandoned"] = True
+                raise LockAcquisitionError(
+                    f"Could not acquire lock for {self.file_path} "
+                    f"after {self.timeout}s"
+                )
+
+        if state["error"] is not None:
+            os.close(fd)
+            raise LockAcquisitionError(
+                f"Error acquiring lock for {self.file_path}: {state['error']}"
+            )
+
+    def _acquire_dir(self) -> bool:
         start_time = time.time()
 
         while True:
             try:
                 # mkdir is atomic - if it succeeds, we have the lock
                 os.mkdir(self.lock_path)
-                self._acquired = True
-                return True
             except FileExistsError:
                 # Lock exists - check if stale
-                if self._is_lock_stale():
-                    if self._force_remove_stale_lock():
+                if self.lock_path.is_dir():
+                    if self._is_lock_stale() and self._force_remove_stale_lock():
                         continue  # Try again immediately
+                elif self.uses_flock:
+                    # The old-style holder released and flock users took over
+                    return self._acquire_flock()
 
                 # Check timeout
                 elapsed = time.time() - start_time
@@ -100,20 +354,56 @@ class FileLock:
 
                 # Wait before retry
                 time.sleep(self.poll_interval)
+                continue
             except OSError as e:
                 raise LockAcquisitionError(
                     f"Error acquiring lock for {self.file_path}: {e}"
                 )
 
+            self._token = uuid.uuid4().hex
+            try:
+                self._write_owner()
+            except OSError:
+                pass  # Judged by mtime until the first heartbeat
+            self._acquired = True
+            self._start_heartbeat()
+            return True
+
     def release(self) -> None:
-        """Release the lock by removing the lock directory."""
-        if self._acquired and self.lock_path.exists():
+        """Release the lock."""
+        if not self._acquired:
+            return
+
+        lock_metrics.record(
+            self.file_path, "acquire", wait=self._wait_time,
+            hold=time.monotonic() - self._acquired_at, shared=self.shared
+        )
+
+        if self._fd is not None:
             try:
-                shutil.rmtree(self.lock_path)
+                # The lock file stays: unlinking it would let a waiter lock
+                # the orphaned inode while a newcomer locks a new file
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
             except OSError:
-                pass  # Best effort removal
+                pass
             finally:
+                os.close(self._fd)
+                self._fd = None
                 self._acquired = False
+            return
+
+        if self._heartbeat_stop is not None:
+            self._heartbeat_stop.set()
+            self._heartbeat_stop = None
+
+        owner = self._read_owner()
+        # Leave the lock alone if it was broken as stale and re-taken
+        if owner is None or owner.get("token") == self._token:
+            try:
+                shutil.rmtree(self.lock_path)
+            except OSError:
+                pass  # Best effort removal
+        self._acquired = False
 
     def __enter__(self) -> 'FileLock':
         """Context manager entry - acquire lock."""
@@ -126,7 +416,7 @@ class FileLock:
 
 
 @contextmanager
-def file_lock(file_path: str, timeout: float = 5.0):
+def file_lock(file_path: str, timeout: float = 5.0, shared: bool = False):
     """
     Context manager for file locking.
 
@@ -138,11 +428,12 @@ def file_lock(file_path: str, timeout: float = 5.0):
     Args:
         file_path: Path to the file to lock
         timeout: Maximum seconds to wait for lock
+        shared: Take a shared (reader) lock instead of an exclusive one
 
     Yields:
         FileLock instance
     """
-    lock = FileLock(file_path, timeout)
+    lock = FileLock(file_path, timeout, shared=shared)
     try:
         lock.acquire()
         yield lock
@@ -52,6 +52,7 @@ class SelfModel(BaseModel):
 
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
+    version: int = 0  # Bumped on every save; see storage.update_self_model
 
 
 class AffectState(BaseModel):
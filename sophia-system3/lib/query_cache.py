@@ -0,0 +1,270 @@
+"""
+query_cache.py - Search result cache keyed on the index generation
+
+Agents and skills repeat recall queries within a session (the goal text is
+re-queried every turn), and each repeat re-scores the index. Results are
+cached under (search, normalized query, k, mode and other options, index
+generation). The generation (storage.index_generation) changes whenever a
+file searches read is written, by any process, so a stale result is never
+served; superseded entries just age out of the LRU.
+
+Entries also expire after QUERY_CACHE_CONFIG["ttl_seconds"]: ranking
+applies a recency boost that depends on the clock.
+
+The cache is shared between processes through ~/.sophia/query_cache.json.
+A miss in memory checks the file (re-read only when it changed), and new
+results are merged into it under its lock. The file is best effort: a
+busy lock skips the write and a corrupt file is ignored.
+
+The cache is disabled by QUERY_CACHE_CONFIG["enabled"] = False or
+SOPHIA_DISABLE_CACHE=1.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import codec, storage
+from .config import QUERY_CACHE_CONFIG
+from .locking import file_lock, LockAcquisitionError
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used in keys."""
+    return " ".join(query.lower().split())
+
+
+def _write_file(path: Path, data: Any) -> None:
+    # Atomic but never fsynced: losing the cache only costs recomputation
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(codec.dumps(data))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class QueryCache:
+    """
+    LRU of search results with a TTL, backed by a shared file.
+
+    Keys embed the index generation; an entry is only served for the
+    generation it was computed at.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Entries kept in memory and in the file
+            ttl_seconds: Age after which an entry is no longer served
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (generation, created, value), least recently used first
+        self._entries: "OrderedDict[str, Tuple[str, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._file_signatures: Dict[str, Any] = {}  # path -> signature last merged
+        self.stats = {"hits": 0, "misses": 0, "file_hits": 0}
+
+    def _fresh(self, created: float) -> bool:
+        return time.time() - created < self.ttl_seconds
+
+    def _lookup(self, key: str) -> Any:
+        """Memory lookup; callers hold self._lock."""
+        item = self._entries.get(key)
+        if item is None:
+            return _MISSING
+        if not self._fresh(item[1]):
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return item[2]
+
+    def _read_file(self, path: Path) -> list:
+        try:
+            with open(path, 'rb') as f:
+                data = codec.loads(f.read())
+        except (OSError, ValueError):
+            return []
+        entries = data.get("entries") if isinstance(data, dict) else None
+        return entries if isinstance(entries, list) else []
+
+    def _merge_file(self, path: Path, generation: str) -> None:
+        """Load entries of this generation from the file, if it changed."""
+        signature = storage.file_signature(path)
+        if signature is None or self._file_signatures.get(str(path)) == signature:
+            return
+        entries = self._read_file(path)
+        with self._lock:
+            self._file_signatures[str(path)] = signature
+            for item in entries:
+                try:
+                    key, entry_generation, created, value = item
+                except (TypeError, ValueError):
+                    continue
+                if entry_generation == generation and key not in self._entries and self._fresh(created):
+                    self._entries[key] = (entry_generation, created, value)
+            self._trim()
+
+    def _trim(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str, generation: str, path: Optional[Path] = None) -> Any:
+        """
+        Cached value for a key, or _MISSING.
+
+        Args:
+            key: Cache key (including the generation)
+            generation: Current index generation
+            path: Shared cache file to consult on a memory miss
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.stats["hits"] += 1
+                return value
+
+        if path is not None:
+            self._merge_file(path, generation)
+            with self._lock:
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    self.stats["hits"] += 1
+                    self.stats["file_hits"] += 1
+                    return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return _MISSING
+
+    def put(self, key: str, generation: str, value: Any, path: Optional[Path] = None) -> None:
+        """
+        Store a value, and merge it into the shared file.
+
+        Args:
+            key: Cache key (including the generation)
+            generation: Index generation the value was computed at
+            value: JSON-serializable value
+            path: Shared cache file
+        """
+        created = time.time()
+        with self._lock:
+            self._entries[key] = (generation, created, value)
+            self._entries.move_to_end(key)
+            self._trim()
+
+        if path is None:
+            return
+
+        try:
+            with file_lock(str(path), timeout=QUERY_CACHE_CONFIG["lock_timeout"]):
+                # Entries of other generations can never be served again
+                entries = [
+                    item for item in self._read_file(path)
+                    if isinstance(item, list) and len(item) == 4
+                    and item[1] == generation and item[0] != key and self._fresh(item[2])
+                ]
+                entries.append([key, generation, created, value])
+                _write_file(path, {"entries": entries[-self.max_entries:]})
+                # Our own write holds nothing new to merge
+                with self._lock:
+                    self._file_signatures[str(path)] = storage.file_signature(path)
+        except (LockAcquisitionError, OSError, TypeError, ValueError):
+            pass
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters (the file is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._file_signatures.clear()
+            for name in self.stats:
+                self.stats[name] = 0
+
+
+_cache = QueryCache(QUERY_CACHE_CONFIG["max_entries"], QUERY_CACHE_CONFIG["ttl_seconds"])
+_enabled = bool(QUERY_CACHE_CONFIG["enabled"]) and not os.environ.get("SOPHIA_DISABLE_CACHE")
+
+
+def cached_search(
+    name: str,
+    params: Tuple,
+    compute: Callable[[], Tuple[Any, bool]]
+) -> Any:
+    """
+    Return a search result from the cache, computing it on a miss.
+
+    Args:
+        name: Search function name
+        params: Normalized query and options; must be JSON-serializable
+        compute: Returns (value, cacheable); results that are incomplete
+            (e.g. a hybrid search whose vector side timed out) pass
+            cacheable=False so they aren't served again
+
+    Returns:
+        The value, as computed or as cached (JSON types: tuples come back
+        as lists). Treat it as read-only.
+    """
+    if not _enabled:
+        return compute()[0]
+
+    generation = storage.index_generation()
+    key = codec.dumps([name, list(params), generation]).decode()
+    path = storage.get_sophia_dir() / QUERY_CACHE_CONFIG["file"]
+
+    value = _cache.get(key, generation, path)
+    if value is not _MISSING:
+        return value
+
+    value, cacheable = compute()
+    if cacheable:
+        # Round-trip through JSON so hits and misses return the same types
+        value = codec.loads(codec.dumps(value))
+        _cache.put(key, generation, value, path)
+    return value
+
+
+def cache_stats() -> Dict[str, Any]:
+    """
+    Get query cache counters for this process.
+
+    Returns:
+        Dict with hits (file_hits of them found in the shared file),
+        misses, entries in memory and hit_rate (0-1)
+    """
+    with _cache._lock:
+        stats = dict(_cache.stats)
+        stats["entries"] = len(_cache._entries)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def clear_query_cache() -> None:
+    """Drop cached results in this process and reset the counters."""
+    _cache.clear()
+
+
+def set_query_cache_enabled(enabled: bool) -> None:
+    """
+    Enable or bypass the query cache (e.g. in tests or benchmarks).
+
+    Args:
+        enabled: Whether searches may return cached results
+    """
+    global _enabled
+    _enabled = enabled
+    if not enabled:
+        clear_query_cache()
@@ -1,64 +1,543 @@
 """
 retrieval.py - Episode search and ranking algorithms
 
-Provides keyword search and scoring functions for episode retrieval.
-Embedding-based search is handled separately in embeddings.py.
+Provides keyword search, BM25F ranking and scoring functions for episode
+retrieval.
+Embeddings are generated in embeddings.py; semantic_search() scores them
+from the vector sidecar (vector_store.py).
 """
 
-import re
+import heapq
+import math
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 from pathlib import Path
 
-from .storage import get_sophia_dir, get_episode_index, read_episode
+from .storage import (
+    KeywordIndex, get_sophia_dir, get_config, get_episode_index, get_keyword_index,
+    get_vector_store, iter_archive_segments, read_episode, read_episodes
+)
+from .config import RETRIEVAL_CONFIG
+from .embeddings import EmbeddingManager, embed_text
 from .models import Episode
+from .query_cache import cached_search, normalize_query
+from .score_columns import ScoreColumns
+from .secondary_index import EpisodeFilter
+from .inverted_index import InvertedIndex
+from .text import FIELDS, entry_field_tokens, tokenize
 
+# Episode fields shown by recall; actions and embeddings aren't parsed
+RECALL_FIELDS = ["heuristics", "keywords", "chain_of_thought", "error_analysis"]
 
-def keyword_search(query: str, k: int = 10) -> List[Tuple[Dict[str, Any], float]]:
+
+# Search token -> (query token it stands for, weight)
+QueryTokens = Dict[str, Tuple[str, float]]
+
+
+def _expand_query(query_keywords: Set[str]) -> QueryTokens:
+    """
+    Query tokens plus vocabulary tokens spelled like the misspelled ones.
+
+    A query token that no live entry contains is also matched, through the
+    trigram index, to up to RETRIEVAL_CONFIG["fuzzy_max_expansions"]
+    vocabulary tokens with at least RETRIEVAL_CONFIG["fuzzy_threshold"]
+    similarity, weighted by that similarity. The token itself is kept
+    (it may still match archived entries).
+    """
+    tokens: QueryTokens = {token: (token, 1.0) for token in query_keywords}
+    threshold = RETRIEVAL_CONFIG["fuzzy_threshold"]
+    if not threshold:
+        return tokens
+
+    terms = get_keyword_index().terms
+    for token in sorted(query_keywords):
+        if len(token) < RETRIEVAL_CONFIG["fuzzy_min_length"] or terms.document_frequency(token):
+            continue
+        for match, similarity in terms.fuzzy_matches(
+            token, threshold, RETRIEVAL_CONFIG["fuzzy_max_expansions"]
+        ):
+            if similarity > tokens.get(match, (None, 0.0))[1]:
+                tokens[match] = (token, similarity)
+    return tokens
+
+
+def _match_credit(tokens: Iterable[str], query_tokens: QueryTokens) -> float:
+    """Sum over query tokens of the best weight among the given tokens."""
+    credit: Dict[str, float] = {}
+    for token in query_tokens.keys() & set(tokens):
+        query_token, weight = query_tokens[token]
+        credit[query_token] = max(credit.get(query_token, 0.0), weight)
+    return sum(credit.values())
+
+
+def _match_score(entry: Dict[str, Any], query_tokens: QueryTokens, count: int) -> float:
+    """Fraction of `count` query keywords among the entry's tokens."""
+    tokens = chain.from_iterable(entry_field_tokens(entry).values())
+    return _match_credit(tokens, query_tokens) / count
+
+
+class _TopK:
+    """The k best results so far, in a min-heap; earlier results win ties."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[float, int, int, Dict[str, Any]]] = []
+        self._ids: Set[str] = set()
+
+    def threshold(self) -> Optional[float]:
+        """Score of the k-th result, or None while fewer than k are held."""
+        return self._heap[0][0] if len(self._heap) >= self.k else None
+
+    def can_improve(self, score: float) -> bool:
+        """Whether a result scoring `score` (after those seen) would be kept."""
+        threshold = self.threshold()
+        return threshold is None or score > threshold
+
+    def push(self, score: float, segment: int, position: int, entry: Dict[str, Any]) -> None:
+        # Entries repeat across archive segments after an interrupted
+        # seal; the copy seen first ranks no lower, so later ones are
+        # dropped
+        episode_id = entry.get("id")
+        if episode_id in self._ids or self.k <= 0:
+            return
+        item = (score, -segment, -position, entry)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:3] > self._heap[0][:3]:
+            self._ids.discard(heapq.heapreplace(self._heap, item)[3].get("id"))
+        else:
+            return
+        self._ids.add(episode_id)
+
+    def results(self) -> List[Tuple[Dict[str, Any], float]]:
+        ranked = sorted(self._heap, key=lambda item: item[:3], reverse=True)
+        return [(entry, score) for score, _, _, entry in ranked]
+
+
+# Archived entries scored per batch (sqlite archives are one long stream)
+_STREAM_BATCH = 500
+
+
+def _stream_search(
+    query_keywords: Set[str],
+    k: int,
+    include_archive: bool,
+    score_live: Callable[[KeywordIndex, Optional[Set[str]]], Dict[str, float]],
+    score_archived: Callable[[List[Dict[str, Any]]], List[Optional[float]]],
+    bound: Callable[[Dict[str, Any]], float],
+    episode_filter: Optional[EpisodeFilter] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Top-k over the live index, then archive segments newest to oldest.
+
+    Results go through a bounded heap and archive segments are read one
+    at a time, so memory doesn't grow with history. A sealed segment is
+    skipped unread when bound(summary), the best score any of its entries
+    could get, can't beat the k-th result; the archive isn't touched at
+    all once the k-th result scores 1.0. Among equal scores live entries
+    come first, newest first, then archived ones in archive order.
+
+    With a filter, live postings are intersected with the entries the
+    secondary indexes select before anything is scored; archive segments
+    outside its date range are skipped and archived entries are checked
+    one by one.
+
+    Args:
+        query_keywords: Tokens to search for, used to skip archive segments
+        k: Maximum number of results
+        include_archive: Also search archived entries
+        score_live: Scores of matching live entries by episode id,
+            restricted to the given ids (None = all)
+        score_archived: Score of each entry in a batch (None = no match)
+        bound: Highest score an entry of a sealed segment can get
+        episode_filter: Conditions results must meet
+
+    Returns:
+        List of (index_entry, score) tuples, best first
+    """
+    keyword_index = get_keyword_index()
+    positions = keyword_index.positions
+    top = _TopK(k)
+
+    allowed = keyword_index.filters.select(episode_filter)
+    if allowed is not None and not allowed and not include_archive:
+        return []
+
+    for episode_id, score in score_live(keyword_index, allowed).items():
+        if episode_id in positions:
+            top.push(score, 0, positions[episode_id], keyword_index.entries[episode_id])
+
+    if not include_archive:
+        return top.results()
+
+    since, until = episode_filter.bounds() if episode_filter else (None, None)
+    segments = iter_archive_segments(query_keywords, since=since, until=until)
+    for segment, (summary, load) in enumerate(segments, start=1):
+        if not top.can_improve(1.0):
+            break  # Nothing scores above 1.0
+        if summary is not None and not top.can_improve(bound(summary)):
+            continue
+
+        entries = (
+            entry for entry in load()
+            if entry.get("id") not in positions
+            and (episode_filter is None or episode_filter.matches(entry))
+        )
+        position = 0
+        while True:
+            batch = list(islice(entries, _STREAM_BATCH))
+            if not batch:
+                break
+            for entry, score in zip(batch, score_archived(batch)):
+                if score is not None:
+                    top.push(score, segment, position, entry)
+                position += 1
+
+    return top.results()
+
+
+def _postings(
+    terms: InvertedIndex,
+    token: str,
+    allowed: Optional[Set[str]]
+) -> Iterable[Tuple[str, List[int]]]:
+    """A token's postings limited to allowed ids (None = all), walking the smaller side."""
+    postings = terms.lookup(token)
+    if allowed is None:
+        return postings.items()
+    if len(allowed) < len(postings):
+        return ((i, postings[i]) for i in allowed if i in postings)
+    return ((i, tfs) for i, tfs in postings.items() if i in allowed)
+
+
+def keyword_search(
+    query: str,
+    k: int = 10,
+    include_archive: bool = False,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Tuple[Dict[str, Any], float]]:
     """
     Search episode index by keywords.
 
+    Query tokens are matched as whole tokens ("log" doesn't match
+    "catalog") via the inverted index, so only entries sharing a token
+    with the query are looked at. A token no entry contains also matches
+    similarly spelled tokens ("kubernets" -> "kubernetes"), which count
+    their trigram similarity instead of 1 (see _expand_query).
+
     Args:
         query: Search query string
         k: Maximum number of results to return
+        include_archive: Also search entries capped out of the live index.
+            Archive segments whose keyword set can't match are skipped.
+        filters: Conditions on outcome, since/until, tools, session_id,
+            consolidated and trivial (see secondary_index.EpisodeFilter)
 
     Returns:
-        List of (index_entry, match_score) tuples, sorted by score descending
+        List of (index_entry, match_score) tuples, sorted by score
+        descending, newest first among equal scores. Results are cached
+        per token set until the index changes (see query_cache.py).
+
+    Raises:
+        ValueError: For unknown filter keys or unparseable dates
     """
     # Tokenize query into keywords
-    query_keywords = set(re.findall(r'\w+', query.lower()))
+    query_keywords = set(tokenize(query))
 
     if not query_keywords:
         return []
+    episode_filter = EpisodeFilter.parse(filters)
+
+    results = cached_search(
+        "keyword_search",
+        (" ".join(sorted(query_keywords)), k, include_archive,
+         episode_filter.key() if episode_filter else None),
+        lambda: (_keyword_search(query_keywords, k, include_archive, episode_filter), True)
+    )
+    # Copies, so callers can't modify the cached entries
+    return [(dict(entry), score) for entry, score in results]
+
+
+def _keyword_search(
+    query_keywords: Set[str],
+    k: int,
+    include_archive: bool,
+    episode_filter: Optional[EpisodeFilter] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    query_tokens = _expand_query(query_keywords)
+    count = len(query_keywords)
+
+    def score_live(keyword_index: KeywordIndex, allowed: Optional[Set[str]]) -> Dict[str, float]:
+        # Best weight per matched query token and episode, from the postings
+        matches: Dict[str, Dict[str, float]] = {}
+        for token, (query_token, weight) in query_tokens.items():
+            for episode_id, _ in _postings(keyword_index.terms, token, allowed):
+                matched = matches.setdefault(episode_id, {})
+                matched[query_token] = max(matched.get(query_token, 0.0), weight)
+        return {episode_id: sum(m.values()) / count for episode_id, m in matches.items()}
+
+    def score_archived(entries: List[Dict[str, Any]]) -> List[Optional[float]]:
+        return [_match_score(entry, query_tokens, count) or None for entry in entries]
+
+    def bound(summary: Dict[str, Any]) -> float:
+        return _match_credit(summary.get("keywords", ()), query_tokens) / count
+
+    return _stream_search(
+        set(query_tokens), k, include_archive, score_live, score_archived, bound, episode_filter
+    )
+
+
+def _bm25_weights(terms: InvertedIndex, query_tokens: QueryTokens) -> Dict[str, float]:
+    """BM25 idf per search token (tokens in no entry get the maximum), times its weight."""
+    count = len(terms)
+    return {
+        token: weight * math.log(1 + (count - df + 0.5) / (df + 0.5))
+        for token, (_, weight) in query_tokens.items()
+        for df in [terms.document_frequency(token)]
+    }
+
+
+def _bm25f_score(
+    frequencies: Dict[str, List[int]],
+    lengths: List[int],
+    idf: Dict[str, float],
+    average_lengths: List[float],
+    query_tokens: QueryTokens
+) -> float:
+    """
+    BM25F score of one entry.
 
-    # Get episode index
-    index = get_episode_index()
-    entries = index.get("entries", [])
+    Field term frequencies are length-normalized and weighted per field,
+    summed into one pseudo-frequency, then saturated with k1. Each query
+    token counts once, with its best-scoring search token (as in
+    _match_credit), so an entry holding a misspelled token and its fuzzy
+    expansions isn't credited for all of them.
+    """
+    k1 = RETRIEVAL_CONFIG["bm25_k1"]
+    fields = RETRIEVAL_CONFIG["bm25_fields"]
+    credit: Dict[str, float] = {}
+
+    for token, tfs in frequencies.items():
+        tf = 0.0
+        for i, field in enumerate(FIELDS):
+            if not tfs[i]:
+                continue
+            params = fields[field]
+            average = average_lengths[i] or 1.0
+            norm = 1 - params["b"] + params["b"] * lengths[i] / average
+            tf += params["weight"] * tfs[i] / norm
+        query_token = query_tokens[token][0]
+        credit[query_token] = max(credit.get(query_token, 0.0), idf[token] * tf / (k1 + tf))
+
+    return sum(credit.values())
+
+
+def bm25_search(
+    query: str,
+    k: int = 10,
+    include_archive: bool = False,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Rank episodes by BM25F over goal summary, keywords and heuristics.
+
+    Rare tokens count for more than common ones, and matches in the goal
+    summary count for more than keyword or heuristic matches
+    (RETRIEVAL_CONFIG["bm25_fields"]). Only entries in the postings of a
+    query token are scored; corpus statistics come from the inverted
+    index, so nothing is recomputed per query.
+
+    Args:
+        query: Search query string
+        k: Maximum number of results to return
+        include_archive: Also score entries capped out of the live index
+            (with the live index's corpus statistics)
+        filters: Conditions results must meet (see keyword_search)
 
-    scored_entries = []
+    Returns:
+        List of (index_entry, score) tuples, best first. Scores are
+        normalized to 0-1 by the query's total idf, so an entry matching
+        every query token many times approaches 1. Fuzzy matches of
+        misspelled tokens (see keyword_search) count their idf times
+        their similarity.
+    """
+    query_keywords = set(tokenize(query))
+    if not query_keywords:
+        return []
+    query_tokens = _expand_query(query_keywords)
+    return _stream_search(
+        set(query_tokens), k, include_archive, *_bm25_scorers(query_tokens),
+        episode_filter=EpisodeFilter.parse(filters)
+    )
+
+
+def _bm25_scorers(query_tokens: QueryTokens) -> Tuple[Callable, Callable, Callable]:
+    """BM25F (score_live, score_archived, bound) for _stream_search."""
+    terms = get_keyword_index().terms
+    idf = _bm25_weights(terms, query_tokens)
+    # Normalized by the query tokens' own idf: fuzzy matches score below exact ones
+    max_score = sum(idf[token] for token, (query_token, _) in query_tokens.items()
+                    if token == query_token)
+    average_lengths = terms.average_lengths()
+
+    def score_live(keyword_index: KeywordIndex, allowed: Optional[Set[str]]) -> Dict[str, float]:
+        # Gather per-entry term frequencies from the postings
+        frequencies: Dict[str, Dict[str, List[int]]] = {}
+        for token in idf:
+            for episode_id, tfs in _postings(keyword_index.terms, token, allowed):
+                frequencies.setdefault(episode_id, {})[token] = tfs
+        return {
+            episode_id: _bm25f_score(
+                matched, keyword_index.terms.lengths[episode_id], idf, average_lengths, query_tokens
+            ) / max_score
+            for episode_id, matched in frequencies.items()
+        }
+
+    def score_archived(entries: List[Dict[str, Any]]) -> List[Optional[float]]:
+        scores: List[Optional[float]] = []
+        for entry in entries:
+            field_tokens = entry_field_tokens(entry)
+            matched = {}
+            for token in idf:
+                tfs = [field_tokens[field].count(token) for field in FIELDS]
+                if any(tfs):
+                    matched[token] = tfs
+            if matched:
+                lengths = [len(field_tokens[field]) for field in FIELDS]
+                scores.append(
+                    _bm25f_score(matched, lengths, idf, average_lengths, query_tokens) / max_score
+                )
+            else:
+                scores.append(None)
+        return scores
+
+    def bound(summary: Dict[str, Any]) -> float:
+        # Each query token contributes less than the idf of its best
+        # search token present (tf / (k1 + tf) < 1)
+        best: Dict[str, float] = {}
+        for token in idf.keys() & set(summary.get("keywords", ())):
+            query_token = query_tokens[token][0]
+            best[query_token] = max(best.get(query_token, 0.0), idf[token])
+        return sum(best.values()) / max_score
+
+    return score_live, score_archived, bound
+
+
+def ranked_keyword_search(
+    query: str,
+    k: int = 5,
+    include_archive: bool = False,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Top-k episodes by final retrieval score (BM25F plus boosts).
+
+    Unlike re-ranking the top BM25 candidates, every match is scored with
+    the compute_retrieval_score boosts, streaming over the live index and
+    then the archive. Archive segments are skipped (unread) when even an
+    entry matching every query token that the segment contains, with the
+    segment's best outcome, heuristics count and newest timestamp, would
+    score below the k-th result.
+
+    Args:
+        query: Search query string
+        k: Maximum number of results to return
+        include_archive: Also search entries capped out of the live index
+        filters: Conditions results must meet (see keyword_search)
+
+    Returns:
+        List of (index_entry, retrieval_score) tuples, best first
+    """
+    query_keywords = set(tokenize(query))
+    if not query_keywords:
+        return []
 
-    for entry in entries:
-        # Build searchable text from entry
-        searchable = []
-        if entry.get("goal_summary"):
-            searchable.append(entry["goal_summary"].lower())
-        if entry.get("keywords"):
-            searchable.extend(k.lower() for k in entry["keywords"])
+    query_tokens = _expand_query(query_keywords)
+    bm25_live, bm25_archived, bm25_bound = _bm25_scorers(query_tokens)
+
+    def score_live(keyword_index: KeywordIndex, allowed: Optional[Set[str]]) -> Dict[str, float]:
+        scores = bm25_live(keyword_index, allowed)
+        rows = [keyword_index.positions.get(episode_id) for episode_id in scores]
+        if None in rows:
+            # Postings of entries replaced since (see get_keyword_index)
+            scores = {i: score for i, score in scores.items() if i in keyword_index.positions}
+            rows = [keyword_index.positions[episode_id] for episode_id in scores]
+        return dict(zip(scores, keyword_index.columns.score(rows, list(scores.values()))))
+
+    def score_archived(entries: List[Dict[str, Any]]) -> List[Optional[float]]:
+        matches = bm25_archived(entries)
+        hits = [i for i, score in enumerate(matches) if score is not None]
+        columns = ScoreColumns.from_entries(entries[i] for i in hits)
+        for i, score in zip(hits, columns.score(range(len(hits)), [matches[i] for i in hits])):
+            matches[i] = score
+        return matches
+
+    def bound(summary: Dict[str, Any]) -> float:
+        if "max_heuristics" not in summary:
+            return 1.0  # Sealed before the manifest recorded boost bounds
+        best_case = ScoreColumns.from_entries([{
+            "timestamp": summary.get("end"),
+            "outcome": 'SUCCESS' if summary.get("success", True) else None,
+            "heuristics_count": summary["max_heuristics"],
+        }])
+        return best_case.score([0], [bm25_bound(summary)])[0]
+
+    return _stream_search(
+        set(query_tokens), k, include_archive, score_live, score_archived, bound,
+        EpisodeFilter.parse(filters)
+    )
+
+
+def semantic_search(
+    query: str,
+    k: int = 10,
+    query_embedding: Optional[List[float]] = None,
+    nprobe: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Search episodes by embedding similarity.
 
-        text = " ".join(searchable)
+    Scores the vectors in the sidecar matrix (all of them, or the nearest
+    IVF clusters once the ANN index is trained); no episode files are read.
 
-        # Count keyword matches
-        matches = sum(1 for kw in query_keywords if kw in text)
+    Args:
+        query: Search query string
+        k: Maximum number of results to return
+        query_embedding: Precomputed query embedding (skips the provider)
+        nprobe: IVF clusters to scan; trades latency for recall
+        filters: Conditions results must meet (see keyword_search). Only
+            the live entries passing them are scored, exactly
+        timeout: Seconds the provider may take to embed the query
 
-        if matches > 0:
-            # Normalize score by number of query keywords
-            match_score = matches / len(query_keywords)
-            scored_entries.append((entry, match_score))
+    Returns:
+        List of (index_entry, cosine_similarity) tuples, most similar
+        first. Empty when no embedding provider is available. Episodes no
+        longer in the live index get a minimal {"id": ...} entry.
+    """
+    allowed = get_keyword_index().filters.select(EpisodeFilter.parse(filters))
+    if allowed is not None and not allowed:
+        return []
 
-    # Sort by score descending
-    scored_entries.sort(key=lambda x: x[1], reverse=True)
+    if query_embedding is None:
+        query_embedding = embed_text(query, get_config(), timeout=timeout)
+    if not query_embedding:
+        return []
 
-    return scored_entries[:k]
+    hits = get_vector_store().search(query_embedding, k, nprobe=nprobe, only=allowed)
+    if not hits:
+        return []
+
+    entries = {e.get("id"): e for e in get_episode_index().get("entries", [])}
+    return [
+        (entries.get(episode_id, {"id": episode_id}), similarity)
+        for episode_id, similarity in hits
+    ]
 
 
 def compute_retrieval_score(
@@ -112,6 +591,33 @@ def compute_retrieval_score(
     return min(1.0, base_score)
 
 
+def score_candidates(matches: List[Tuple[Dict[str, Any], float]]) -> List[float]:
+    """
+    compute_retrieval_score for a whole candidate list in one pass.
+
+    Uses the ranking columns precomputed with the keyword index; entries
+    outside the live index (archived, or dropped since they were
+    embedded) get columns computed on the spot.
+
+    Args:
+        matches: List of (index_entry, similarity) tuples
+
+    Returns:
+        Composite scores, in candidate order
+    """
+    if not matches:
+        return []
+
+    keyword_index = get_keyword_index()
+    rows = [keyword_index.positions.get(entry.get("id")) for entry, _ in matches]
+    similarities = [similarity for _, similarity in matches]
+    if None not in rows:
+        return keyword_index.columns.score(rows, similarities)
+
+    columns = ScoreColumns.from_entries(entry for entry, _ in matches)
+    return columns.score(range(len(matches)), similarities)
+
+
 def get_recent_episodes(n: int = 5) -> List[Dict[str, Any]]:
     """
     Get the N most recent episodes from the index.
@@ -129,32 +635,217 @@ def get_recent_episodes(n: int = 5) -> List[Dict[str, Any]]:
     return entries[:n]
 
 
-def search_episodes(
-    query: str,
-    k: int = 5,
-    include_full: bool = False
+def filter_episodes(
+    filters: Dict[str, Any],
+    k: Optional[int] = None,
+    include_archive: bool = False
 ) -> List[Dict[str, Any]]:
     """
-    Search episodes with scoring and optional full episode loading.
+    Index entries passing a filter, without a query.
+
+    Live entries are selected through the secondary indexes; archived ones
+    are read only from segments overlapping the filter's date range.
 
     Args:
-        query: Search query
-        k: Maximum results
-        include_full: Whether to load full episode data
+        filters: Conditions (see keyword_search)
+        k: Maximum entries to return (None = all)
+        include_archive: Also return archived entries, after the live ones
 
     Returns:
-        List of result dicts with scores
+        Matching index entries, newest first (live before archived)
+
+    Raises:
+        ValueError: For unknown filter keys or unparseable dates
     """
-    results = []
+    episode_filter = EpisodeFilter.parse(filters)
+    keyword_index = get_keyword_index()
+    allowed = keyword_index.filters.select(episode_filter)
+
+    positions = keyword_index.positions
+    ids = sorted(positions if allowed is None else allowed, key=positions.__getitem__)
+    results = [keyword_index.entries[episode_id] for episode_id in ids]
+
+    if include_archive and (k is None or len(results) < k):
+        since, until = episode_filter.bounds() if episode_filter else (None, None)
+        seen = set(positions)
+        for _, load in iter_archive_segments(None, since=since, until=until):
+            for entry in load():
+                if entry.get("id") in seen:
+                    continue
+                if episode_filter is None or episode_filter.matches(entry):
+                    seen.add(entry.get("id"))
+                    results.append(entry)
+            if k is not None and len(results) >= k:
+                break
+    return results if k is None else results[:k]
+
+
+def _run_in_daemon_thread(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    # Interpreter exit joins pool threads, so a query abandoned over
+    # budget would hold up a short-lived process until the provider
+    # answered. Daemon threads are left running instead.
+    future: Future = Future()
+
+    def run() -> None:
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+    threading.Thread(target=run, name="sophia-vector", daemon=True).start()
+    return future
 
-    # Perform keyword search
-    matches = keyword_search(query, k=k*2)
 
-    for entry, match_score in matches[:k]:
-        # Compute retrieval score
-        score = compute_retrieval_score(entry, match_score)
+def default_search_mode() -> str:
+    """
+    Search mode used when none is given.
+
+    RETRIEVAL_CONFIG["search_mode"] if set; otherwise "hybrid" when
+    config.json names an embedding provider and "keyword" when not, so
+    searches don't start an embedding call that can't help.
+    """
+    if RETRIEVAL_CONFIG["search_mode"]:
+        return RETRIEVAL_CONFIG["search_mode"]
+    if get_config().get("embedding_provider", "none") != "none":
+        return "hybrid"
+    return "keyword"
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Tuple[Dict[str, Any], float]]],
+    rrf_k: Optional[int] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Fuse ranked result lists by reciprocal rank.
+
+    Each entry scores sum(1 / (rrf_k + rank)) over the lists it appears
+    in (rank from 1), normalized so an entry ranked first everywhere
+    scores 1.0. Only ranks count, so scores on different scales (BM25,
+    cosine similarity) combine without calibration.
+
+    Args:
+        rankings: Lists of (index_entry, score) tuples, best first
+        rrf_k: Rank offset (default RETRIEVAL_CONFIG["rrf_k"])
+
+    Returns:
+        List of (index_entry, fused_score) tuples, best first. The entry
+        dict comes from the first list containing the episode.
+    """
+    if rrf_k is None:
+        rrf_k = RETRIEVAL_CONFIG["rrf_k"]
+
+    fused: Dict[str, float] = {}
+    entries: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, (entry, _) in enumerate(ranking, start=1):
+            episode_id = entry.get("id")
+            fused[episode_id] = fused.get(episode_id, 0.0) + 1.0 / (rrf_k + rank)
+            entries.setdefault(episode_id, entry)
+
+    best = len(rankings) / (rrf_k + 1)
+    ranked = sorted(fused, key=lambda episode_id: fused[episode_id], reverse=True)
+    return [(entries[episode_id], fused[episode_id] / best) for episode_id in ranked]
+
+
+def hybrid_search(
+    query: str,
+    k: int = 10,
+    include_archive: bool = False,
+    budget_ms: Optional[float] = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Tuple[Dict[str, Any], float]], List[str]]:
+    """
+    Keyword and embedding retrieval run concurrently, fused by rank.
+
+    The vector side (query embedding plus sidecar search) runs in a
+    daemon thread while BM25 runs in the caller's. If it hasn't finished
+    within the latency budget, or finds nothing (no provider, no stored
+    embeddings), the BM25 results are returned unchanged. Episodes
+    without an embedding are still found by the keyword side.
 
-        result = {
+    Args:
+        query: Search query string
+        k: Maximum number of results to return
+        include_archive: Also search archived index entries (keyword side)
+        budget_ms: Latency budget for the vector side (default
+            RETRIEVAL_CONFIG["hybrid_budget_ms"])
+        filters: Conditions results must meet (see keyword_search)
+
+    Returns:
+        Tuple of (list of (index_entry, score) tuples best first, names of
+        the retrievers that contributed: "keyword" and/or "semantic")
+    """
+    EpisodeFilter.parse(filters)  # Raise on bad filters here, not in the worker
+    results, methods, _ = _hybrid_search(query, k, include_archive, budget_ms, filters)
+    return results, methods
+
+
+def _hybrid_search(
+    query: str,
+    k: int,
+    include_archive: bool,
+    budget_ms: Optional[float],
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Tuple[Dict[str, Any], float]], List[str], bool]:
+    """hybrid_search(), plus whether the vector side finished in time."""
+    if budget_ms is None:
+        budget_ms = RETRIEVAL_CONFIG["hybrid_budget_ms"]
+    deadline = time.monotonic() + budget_ms / 1000
+
+    # The provider gets the budget as its request timeout, so an
+    # abandoned call doesn't run on for long either
+    vector_future = _run_in_daemon_thread(
+        semantic_search, query, k, filters=filters, timeout=budget_ms / 1000
+    )
+    lexical = bm25_search(query, k=k, include_archive=include_archive, filters=filters)
+
+    complete = True
+    try:
+        semantic = vector_future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        semantic, complete = [], False
+    except Exception:
+        # Provider errors degrade to keyword results
+        semantic, complete = [], False
+
+    if not semantic:
+        return lexical, ["keyword"], complete
+    if not lexical:
+        return semantic, ["semantic"], complete
+    return reciprocal_rank_fusion([lexical, semantic])[:k], ["keyword", "semantic"], complete
+
+
+def _rank_episodes(
+    query: str,
+    k: int,
+    include_archive: bool,
+    mode: str,
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """search_episodes() results without full data, plus whether they're complete."""
+    # Semantic and hybrid retrieve 2k candidates, then re-rank them with
+    # the outcome and recency boosts
+    complete = True
+    if mode == "hybrid":
+        matches, methods, complete = _hybrid_search(query, k * 2, include_archive, None, filters)
+        if methods == ["keyword"]:
+            mode = "keyword"  # No vector results: rank exactly as keyword mode
+    elif mode == "semantic":
+        matches, methods = semantic_search(query, k=k*2, filters=filters), ["semantic"]
+
+    if mode == "keyword":
+        # Every match is scored with the boosts, so there's no candidate cut
+        scored = ranked_keyword_search(
+            query, k=k, include_archive=include_archive, filters=filters
+        )
+        methods = ["keyword"]
+    else:
+        scored = list(zip((entry for entry, _ in matches), score_candidates(matches)))
+        scored.sort(key=lambda x: x[1], reverse=True)
+
+    results = [
+        {
             "episode_id": entry.get("id"),
             "relevance_score": round(score, 2),
             "goal_summary": entry.get("goal_summary", ""),
@@ -162,11 +853,64 @@ def search_episodes(
             "timestamp": entry.get("timestamp"),
             "tool_call_count": entry.get("tool_call_count", 0),
             "heuristics_count": entry.get("heuristics_count", 0),
+            "search_method": "+".join(methods),
         }
+        for entry, score in scored[:k]
+    ]
+    return results, complete
+
 
-        # Optionally load full episode
+def search_episodes(
+    query: str,
+    k: int = 5,
+    include_full: bool = False,
+    include_archive: bool = False,
+    mode: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search episodes with scoring and optional full episode loading.
+
+    Args:
+        query: Search query
+        k: Maximum results
+        include_full: Whether to load full episode data
+        include_archive: Also search archived index entries
+        mode: "keyword" (BM25), "semantic" (embeddings only) or "hybrid"
+            (see hybrid_search); default from default_search_mode()
+        filters: Conditions on outcome, since/until, tools, session_id,
+            consolidated and trivial; only entries passing them are scored
+
+    Returns:
+        List of result dicts with scores; "search_method" names the
+        retrievers that produced them
+
+    Raises:
+        ValueError: For unknown filter keys or unparseable dates
+    """
+    mode = mode or default_search_mode()
+    episode_filter = EpisodeFilter.parse(filters)
+
+    # The ranking is cached until the index changes; full episode data is
+    # loaded fresh. Vector results also depend on the embedding model.
+    model = None
+    if mode != "keyword":
+        provider = EmbeddingManager(get_config()).get_provider()
+        model = (provider.name, provider.model_id) if provider else None
+    ranked = cached_search(
+        "search_episodes",
+        (normalize_query(query), k, mode, model, include_archive,
+         episode_filter.key() if episode_filter else None),
+        lambda: _rank_episodes(query, k, include_archive, mode, filters)
+    )
+
+    results = []
+    for result in ranked:
+        result = dict(result)
+
+        # Optionally load episode details (actions/embedding stay on disk)
         if include_full:
-            episode = read_episode(entry.get("id"))
+            episode = read_episode(result["episode_id"], fields=RECALL_FIELDS)
             if episode:
                 result["heuristics"] = episode.heuristics
                 result["keywords"] = episode.keywords
@@ -192,22 +936,11 @@ def get_episodes_for_reflection(
     Returns:
         List of full Episode objects
     """
-    episodes = []
-
-    if episode_ids:
-        for ep_id in episode_ids:
-            episode = read_episode(ep_id)
-            if episode:
-                episodes.append(episode)
-    else:
+    if not episode_ids:
         # Get recent episodes
-        recent_entries = get_recent_episodes(recent)
-        for entry in recent_entries:
-            episode = read_episode(entry.get("id"))
-            if episode:
-                episodes.append(episode)
+        episode_ids = [e.get("id") for e in get_recent_episodes(recent)]
 
-    return episodes
+    return read_episodes(episode_ids).episodes
 
 
 def get_unconsolidated_episodes(min_count: int = 5) -> List[Episode]:
@@ -223,13 +956,17 @@ def get_unconsolidated_episodes(min_count: int = 5) -> List[Episode]:
     index = get_episode_index()
     entries = index.get("entries", [])
 
-    unconsolidated = []
-    for entry in entries:
-        if not entry.get("consolidated", False) and not entry.get("trivial", False):
-            episode = read_episode(entry.get("id"))
-            if episode:
-                unconsolidated.append(episode)
-            if len(unconsolidated) >= min_count:
-                break
+    candidates = [
+        entry.get("id") for entry in entries
+        if not entry.get("consolidated", False) and not entry.get("trivial", False)
+    ]
+
+    # Load in batches, topping up for missing or corrupt episodes
+    unconsolidated: List[Episode] = []
+    start = 0
+    while len(unconsolidated) < min_count and start < len(candidates):
+        batch_ids = candidates[start:start + min_count - len(unconsolidated)]
+        start += len(batch_ids)
+        unconsolidated.extend(read_episodes(batch_ids).episodes)
 
     return unconsolidated
@@ -0,0 +1,179 @@
+"""
+score_columns.py - Precomputed ranking columns for batch re-scoring
+
+retrieval.compute_retrieval_score parses the entry's timestamp and walks
+the outcome, heuristics, consolidation and recency branches once per
+candidate. ScoreColumns holds those inputs as columns, one row per index
+entry in index order, computed once when the keyword index is loaded:
+
+- timestamp: microseconds since the epoch (naive timestamps against a
+  naive epoch, so ages match naive datetime subtraction)
+- kind: 0 no or unparseable timestamp, 1 naive, 2 timezone-aware
+- success: outcome == "SUCCESS"
+- heuristics: heuristics_count
+- consolidated: consolidated flag
+
+score() then re-scores a candidate set in one pass, with numpy when it is
+installed and over array columns otherwise. Both give exactly the scores
+of compute_retrieval_score (same float operations in the same order;
+ages compare as integer microseconds).
+"""
+
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+EPOCH_NAIVE = datetime(1970, 1, 1)
+EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+DAY_US = 86400 * 1000000
+
+# Below this many candidates the array loop beats numpy's call overhead
+_NUMPY_MIN_ROWS = 64
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def entry_columns(entry: Dict[str, Any]) -> Tuple[int, int, int, float, int]:
+    """
+    Ranking inputs of one index entry.
+
+    Returns:
+        (timestamp_us, kind, success, heuristics, consolidated); see the
+        module docstring
+    """
+    timestamp_us, kind = 0, 0
+    timestamp_str = entry.get("timestamp")
+    if timestamp_str:
+        try:
+            timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+            if timestamp.tzinfo is None:
+                timestamp_us, kind = (timestamp - EPOCH_NAIVE) // MICROSECOND, 1
+            else:
+                timestamp_us, kind = (timestamp - EPOCH_AWARE) // MICROSECOND, 2
+        except (ValueError, TypeError, AttributeError, OverflowError):
+            pass
+
+    heuristics = entry.get("heuristics_count", 0)
+    if not isinstance(heuristics, (int, float)):
+        heuristics = 0
+
+    return (
+        timestamp_us,
+        kind,
+        int(entry.get("outcome") == 'SUCCESS'),
+        float(heuristics),
+        int(bool(entry.get("consolidated", False))),
+    )
+
+
+def _now_us() -> Tuple[int, int]:
+    """Current time as (naive, aware) microseconds since the epoch."""
+    return (
+        (datetime.now() - EPOCH_NAIVE) // MICROSECOND,
+        (datetime.now(timezone.utc) - EPOCH_AWARE) // MICROSECOND,
+    )
+
+
+class ScoreColumns:
+    """Ranking columns of a list of index entries (see module docstring)."""
+
+    def __init__(self):
+        self.timestamp = array('q')
+        self.kind = array('b')
+        self.success = array('b')
+        self.heuristics = array('d')
+        self.consolidated = array('b')
+        self._arrays = None  # numpy views, built on first use
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]]) -> 'ScoreColumns':
+        """
+        Compute the columns of a list of entries.
+
+        Args:
+            entries: Index entries; row i is entries[i]
+
+        Returns:
+            ScoreColumns
+        """
+        columns = cls()
+        for entry in entries:
+            timestamp_us, kind, success, heuristics, consolidated = entry_columns(entry)
+            columns.timestamp.append(timestamp_us)
+            columns.kind.append(kind)
+            columns.success.append(success)
+            columns.heuristics.append(heuristics)
+            columns.consolidated.append(consolidated)
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def _numpy_arrays(self, np) -> Tuple[Any, ...]:
+        if self._arrays is None:
+            self._arrays = (
+                np.frombuffer(self.timestamp, dtype=np.int64),
+                np.frombuffer(self.kind, dtype=np.int8),
+                np.frombuffer(self.success, dtype=np.int8).astype(bool),
+                np.frombuffer(self.heuristics, dtype=np.float64),
+                np.frombuffer(self.consolidated, dtype=np.int8).astype(bool),
+            )
+        return self._arrays
+
+    def score(self, rows: Sequence[int], similarities: Sequence[float]) -> List[float]:
+        """
+        compute_retrieval_score for many rows at once.
+
+        Args:
+            rows: Row of each candidate
+            similarities: Base similarity/match score of each candidate
+
+        Returns:
+            Composite scores (capped at 1.0), in candidate order
+        """
+        if not rows:
+            return []
+        naive_now, aware_now = _now_us()
+
+        np = _numpy()
+        if np is not None and len(rows) >= _NUMPY_MIN_ROWS:
+            timestamp, kind, success, heuristics, consolidated = self._numpy_arrays(np)
+            rows = np.asarray(rows, dtype=np.intp)
+            scores = np.asarray(similarities, dtype=np.float64)
+
+            scores = scores * np.where(success[rows], 1.2, 1.0)
+            scores = scores + 0.1 * heuristics[rows]
+            scores = scores * np.where(consolidated[rows], 0.8, 1.0)
+
+            row_kind = kind[rows]
+            age = np.where(row_kind == 2, aware_now, naive_now) - timestamp[rows]
+            recency = np.where(age < 7 * DAY_US, 0.1, np.where(age < 30 * DAY_US, 0.05, 0.0))
+            scores = scores + np.where(row_kind > 0, recency, 0.0)
+
+            return np.minimum(scores, 1.0).tolist()
+
+        timestamp, kind = self.timestamp, self.kind
+        success, heuristics, consolidated = self.success, self.heuristics, self.consolidated
+        scores = []
+        for row, score in zip(rows, similarities):
+            if success[row]:
+                score *= 1.2
+            if heuristics[row]:
+                score += 0.1 * heuristics[row]
+            if consolidated[row]:
+                score *= 0.8
+            if kind[row]:
+                age = (aware_now if kind[row] == 2 else naive_now) - timestamp[row]
+                if age < 7 * DAY_US:
+                    score += 0.1
+                elif age < 30 * DAY_US:
+                    score += 0.05
+            scores.append(min(1.0, score))
+        return scores
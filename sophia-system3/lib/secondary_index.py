@@ -0,0 +1,266 @@
+"""
+secondary_index.py - Attribute indexes over the live episode index
+
+Filtered recall ("FAILURE episodes in the last 30 days that used Bash")
+shouldn't score or even look at entries outside the filter. SecondaryIndex
+keeps, for the live index entries:
+
+- outcome -> ids
+- tool name (lowercase) -> ids, from the entry's "tools" list
+- session_id -> ids
+- ids flagged consolidated, ids flagged trivial
+- (epoch, id) pairs sorted by timestamp, for date ranges
+
+EpisodeFilter.select() intersects these, starting from the smallest
+posting list, so only entries passing every filter are ever touched by
+scoring. It is rebuilt with the keyword index (storage.get_keyword_index)
+and cached with it.
+
+Entries get "tools" and "session_id" from the session_end hook; older
+entries without them (see storage.backfill_index_fields) never match a
+tool or session filter.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+_FILTER_KEYS = ("outcome", "since", "until", "tools", "session_id", "consolidated", "trivial")
+
+
+def _epoch(value: Any) -> Optional[float]:
+    """Seconds since the epoch of an ISO timestamp or datetime (naive = local)."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _outcome(entry: Dict[str, Any]) -> str:
+    """An entry's outcome; entries without one count as UNKNOWN."""
+    return entry.get("outcome") or "UNKNOWN"
+
+
+def _names(value: Union[None, str, Iterable[str]]) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+class EpisodeFilter(NamedTuple):
+    """
+    Conditions on index entries; None means unconstrained.
+
+    outcome matches any of the given outcomes; tools requires every given
+    tool to have been used. since/until bound the entry timestamp
+    (inclusive).
+    """
+    outcome: Optional[Tuple[str, ...]] = None
+    since: Optional[float] = None  # Epoch seconds
+    until: Optional[float] = None
+    tools: Optional[Tuple[str, ...]] = None  # Lowercase tool names
+    session_id: Optional[str] = None
+    consolidated: Optional[bool] = None
+    trivial: Optional[bool] = None
+
+    @classmethod
+    def parse(cls, filters: Optional[Dict[str, Any]]) -> Optional['EpisodeFilter']:
+        """
+        Build a filter from keyword-style options.
+
+        Args:
+            filters: Dict with any of outcome (str or list), since/until
+                (datetime or ISO string), tools (str or list), session_id,
+                consolidated and trivial (bool)
+
+        Returns:
+            EpisodeFilter, or None if no condition is set
+
+        Raises:
+            ValueError: For an unknown key or an unparseable since/until
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - set(_FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown episode filters: {', '.join(sorted(unknown))}")
+
+        bounds = {}
+        for key in ("since", "until"):
+            value = filters.get(key)
+            bounds[key] = _epoch(value)
+            if value is not None and bounds[key] is None:
+                raise ValueError(f"Invalid {key} timestamp: {value!r}")
+
+        tools = _names(filters.get("tools"))
+        episode_filter = cls(
+            outcome=_names(filters.get("outcome")),
+            since=bounds["since"],
+            until=bounds["until"],
+            tools=tuple(tool.lower() for tool in tools) if tools is not None else None,
+            session_id=filters.get("session_id"),
+            consolidated=filters.get("consolidated"),
+            trivial=filters.get("trivial"),
+        )
+        return episode_filter if any(v is not None for v in episode_filter) else None
+
+    def key(self) -> List[Any]:
+        """JSON-serializable form, for cache keys."""
+        return list(self)
+
+    def matches(self, entry: Dict[str, Any]) -> bool:
+        """Whether a single entry (e.g. an archived one) passes the filter."""
+        if self.outcome is not None and _outcome(entry) not in self.outcome:
+            return False
+        if self.since is not None or self.until is not None:
+            epoch = _epoch(entry.get("timestamp"))
+            if epoch is None:
+                return False
+            if self.since is not None and epoch < self.since:
+                return False
+            if self.until is not None and epoch > self.until:
+                return False
+        if self.tools is not None:
+            used = {str(tool).lower() for tool in entry.get("tools") or ()}
+            if not used.issuperset(self.tools):
+                return False
+        if self.session_id is not None and entry.get("session_id") != self.session_id:
+            return False
+        if self.consolidated is not None and bool(entry.get("consolidated", False)) != self.consolidated:
+            return False
+        if self.trivial is not None and bool(entry.get("trivial", False)) != self.trivial:
+            return False
+        return True
+
+    def bounds(self) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """since/until as datetimes, for skipping archive segments."""
+        return (
+            datetime.fromtimestamp(self.since) if self.since is not None else None,
+            datetime.fromtimestamp(self.until) if self.until is not None else None,
+        )
+
+
+class SecondaryIndex:
+    """Posting lists per attribute value (see module docstring)."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.outcomes: Dict[str, Set[str]] = {}
+        self.tools: Dict[str, Set[str]] = {}
+        self.sessions: Dict[str, Set[str]] = {}
+        self.consolidated: Set[str] = set()
+        self.trivial: Set[str] = set()
+        self.epochs: Dict[str, float] = {}
+        self._times: List[float] = []  # Sorted epochs...
+        self._timed_ids: List[str] = []  # ...and their ids
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]]) -> 'SecondaryIndex':
+        """
+        Index a list of entries.
+
+        Args:
+            entries: Live index entries
+
+        Returns:
+            SecondaryIndex
+        """
+        index = cls()
+        timed = []
+        for entry in entries:
+            episode_id = entry.get("id")
+            if not episode_id:
+                continue
+            index.ids.append(episode_id)
+            index.outcomes.setdefault(_outcome(entry), set()).add(episode_id)
+            for tool in entry.get("tools") or ():
+                index.tools.setdefault(str(tool).lower(), set()).add(episode_id)
+            if entry.get("session_id"):
+                index.sessions.setdefault(entry["session_id"], set()).add(episode_id)
+            if entry.get("consolidated", False):
+                index.consolidated.add(episode_id)
+            if entry.get("trivial", False):
+                index.trivial.add(episode_id)
+            epoch = _epoch(entry.get("timestamp"))
+            if epoch is not None:
+                index.epochs[episode_id] = epoch
+                timed.append((epoch, episode_id))
+
+        timed.sort()
+        index._times = [epoch for epoch, _ in timed]
+        index._timed_ids = [episode_id for _, episode_id in timed]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(self, episode_filter: Optional[EpisodeFilter]) -> Optional[Set[str]]:
+        """
+        Ids of the entries passing a filter.
+
+        The smallest posting list (or time range) is scanned and checked
+        against the others by set membership.
+
+        Args:
+            episode_filter: Filter, or None
+
+        Returns:
+            Set of episode ids, or None if the filter is None (everything
+            passes)
+        """
+        if episode_filter is None:
+            return None
+        f = episode_filter
+
+        # Posting lists an entry must be in
+        required: List[Set[str]] = []
+        if f.outcome is not None:
+            required.append(set().union(*(self.outcomes.get(o, ()) for o in f.outcome)))
+        for tool in f.tools or ():
+            required.append(self.tools.get(tool, set()))
+        if f.session_id is not None:
+            required.append(self.sessions.get(f.session_id, set()))
+        if f.consolidated:
+            required.append(self.consolidated)
+        if f.trivial:
+            required.append(self.trivial)
+
+        # ...and flag sets it must not be in
+        excluded = []
+        if f.consolidated is False:
+            excluded.append(self.consolidated)
+        if f.trivial is False:
+            excluded.append(self.trivial)
+
+        timed = f.since is not None or f.until is not None
+        if timed:
+            lo = bisect_left(self._times, f.since) if f.since is not None else 0
+            hi = bisect_right(self._times, f.until) if f.until is not None else len(self._times)
+
+        required.sort(key=len)
+        if timed and (not required or hi - lo < len(required[0])):
+            candidates: Iterable[str] = self._timed_ids[lo:hi]
+        elif required:
+            candidates = required.pop(0)
+        else:
+            candidates = self.ids
+
+        selected = set()
+        for episode_id in candidates:
+            if any(episode_id not in s for s in required):
+                continue
+            if any(episode_id in s for s in excluded):
+                continue
+            if timed:
+                epoch = self.epochs.get(episode_id)
+                if epoch is None or (f.since is not None and epoch < f.since) \
+                        or (f.until is not None and epoch > f.until):
+                    continue
+            selected.add(episode_id)
+        return selected
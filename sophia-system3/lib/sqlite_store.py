@@ -0,0 +1,454 @@
+"""
+sqlite_store.py - SQLite storage backend for System 3
+
+Alternative to the per-file JSON layout. Episodes, episode index entries,
+semantic rules and the self model live in tables of a single WAL-mode
+database (~/.sophia/sophia.db). Enabled with "storage_backend": "sqlite" in
+config.json; the public functions in storage.py route through SQLiteStore
+when it is selected.
+
+Rows store the same JSON documents the file backend writes, so switching
+backends never changes what callers get back. Keyword postings of index
+entries (see inverted_index.py) are kept in index_postings and
+index_lengths, written with the entries they belong to.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+
+from . import codec
+from .inverted_index import entry_terms
+from .text import FIELDS
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS episode_index (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_postings (
+    token TEXT NOT NULL,
+    id TEXT NOT NULL,
+    tf TEXT NOT NULL,
+    PRIMARY KEY (token, id)
+);
+CREATE INDEX IF NOT EXISTS index_postings_id ON index_postings (id);
+CREATE TABLE IF NOT EXISTS index_lengths (
+    id TEXT PRIMARY KEY,
+    lengths TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS semantic_rules (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+# Document holding the semantic rule set's version counter
+RULES_VERSION_DOC = "semantic_rules_version"
+
+# Databases whose schema has been created by this process
+_initialized: set = set()
+_init_lock = threading.Lock()
+
+
+def _dumps(data: Any) -> str:
+    return codec.dumps(data).decode('utf-8')
+
+
+class SQLiteStore:
+    """
+    Episode, index, rule and self-model storage in one SQLite database.
+
+    A connection is opened per operation, which keeps the store safe to use
+    from threads and forked processes; WAL mode lets readers proceed while a
+    writer commits.
+    """
+
+    def __init__(self, db_path: Path, timeout: float = 5.0):
+        """
+        Initialize the store.
+
+        Args:
+            db_path: Path to the SQLite database file
+            timeout: Seconds to wait on a locked database
+        """
+        self.db_path = Path(db_path)
+        self.timeout = timeout
+
+    def _init_db(self, conn: sqlite3.Connection) -> None:
+        key = str(self.db_path.resolve())
+        with _init_lock:
+            if key in _initialized:
+                return
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _initialized.add(key)
+
+    @contextmanager
+    def connect(self):
+        """
+        Open a connection wrapped in a transaction.
+
+        Commits on normal exit and rolls back if the block raises.
+
+        Yields:
+            sqlite3.Connection
+        """
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=self.timeout)
+        try:
+            self._init_db(conn)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Episodes
+
+    def write_episode(self, data: Dict[str, Any]) -> None:
+        """Insert or replace an episode document."""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO episodes (id, data) VALUES (?, ?)",
+                (data["id"], _dumps(data))
+            )
+
+    def read_episode(self, episode_id: str) -> Optional[Dict[str, Any]]:
+        """Return an episode document or None if not stored."""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM episodes WHERE id = ?", (episode_id,)
+            ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def read_episode_fields(
+        self,
+        episode_id: str,
+        fields: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return selected top-level fields of an episode document.
+
+        Only the requested fields are extracted and parsed. Field names
+        are interpolated into SQL, so callers pass known Episode fields.
+
+        Args:
+            episode_id: Episode ID to look up
+            fields: Field names to extract
+
+        Returns:
+            Dict of the fields present in the document, or None if the
+            episode isn't stored
+        """
+        columns = ", ".join(f"data -> '$.{f}'" for f in fields)
+        try:
+            with self.connect() as conn:
+                row = conn.execute(
+                    f"SELECT {columns} FROM episodes WHERE id = ?", (episode_id,)
+                ).fetchone()
+        except sqlite3.OperationalError:
+            # SQLite < 3.38 has no -> operator
+            data = self.read_episode(episode_id)
+            if data is None:
+                return None
+            return {f: data[f] for f in fields if f in data}
+
+        if row is None:
+            return None
+        return {f: codec.loads(v) for f, v in zip(fields, row) if v is not None}
+
+    def read_episodes(self, episode_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Return stored episode documents for many IDs in one query per chunk.
+
+        Args:
+            episode_ids: Episode IDs to look up
+
+        Returns:
+            Dict of episode id to document (IDs not stored are absent)
+        """
+        ids = list(dict.fromkeys(episode_ids))
+        found: Dict[str, Dict[str, Any]] = {}
+        with self.connect() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT id, data FROM episodes WHERE id IN ({placeholders})",
+                    chunk
+                )
+                for episode_id, data in rows:
+                    found[episode_id] = codec.loads(data)
+        return found
+
+    def episode_ids(self) -> List[str]:
+        """Return the ids of all stored episodes."""
+        with self.connect() as conn:
+            return [r[0] for r in conn.execute("SELECT id FROM episodes")]
+
+    # Episode index
+
+    def get_episode_index(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Return the episode index in the same shape as episodes/index.json.
+
+        Args:
+            limit: Maximum number of entries (newest first); None for all
+
+        Returns:
+            Dict with last_updated, total_episodes and entries
+        """
+        with self.connect() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM episode_index").fetchone()[0]
+            query = "SELECT data FROM episode_index ORDER BY seq DESC"
+            params: tuple = ()
+            if limit is not None:
+                query += " LIMIT ?"
+                params = (limit,)
+            entries = [codec.loads(r[0]) for r in conn.execute(query, params)]
+            meta = conn.execute(
+                "SELECT data FROM documents WHERE name = 'episode_index'"
+            ).fetchone()
+
+        last_updated = codec.loads(meta[0]).get("last_updated") if meta else None
+        return {
+            "last_updated": last_updated or datetime.now().isoformat(),
+            "total_episodes": total,
+            "entries": entries,
+        }
+
+    def iter_index_entries(self, offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate index entries newest first, skipping the first `offset`.
+
+        Args:
+            offset: Number of newest entries to skip
+
+        Yields:
+            Index entries
+        """
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "SELECT data FROM episode_index ORDER BY seq DESC LIMIT -1 OFFSET ?",
+                (offset,)
+            )
+            # Batches, so a consumer that stops early never loads the rest
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield codec.loads(row[0])
+
+    def add_index_entries(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        Append index entries, oldest first.
+
+        An entry whose id is already indexed is updated in place and keeps
+        its position in the recency order.
+        """
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT INTO episode_index (id, timestamp, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET "
+                "timestamp = excluded.timestamp, data = excluded.data",
+                [(e.get("id"), e.get("timestamp"), _dumps(e)) for e in entries]
+            )
+            self._write_terms(conn, entries)
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (name, data) VALUES ('episode_index', ?)",
+                (_dumps({"last_updated": datetime.now().isoformat()}),)
+            )
+
+    def get_index_terms(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Return the stored postings of index entries.
+
+        Entries the session_end hook inserted with the sqlite3 CLI have no
+        postings yet; see add_index_terms.
+
+        Args:
+            limit: Only entries among this many newest (None for all)
+
+        Returns:
+            Dict in InvertedIndex.to_dict() form (without a generation)
+        """
+        where = ""
+        params: tuple = ()
+        if limit is not None:
+            where = " WHERE id IN (SELECT id FROM episode_index ORDER BY seq DESC LIMIT ?)"
+            params = (limit,)
+
+        postings: Dict[str, Dict[str, List[int]]] = {}
+        lengths: Dict[str, List[int]] = {}
+        with self.connect() as conn:
+            for token, episode_id, tf in conn.execute(
+                "SELECT token, id, tf FROM index_postings" + where, params
+            ):
+                postings.setdefault(token, {})[episode_id] = codec.loads(tf)
+            for episode_id, row in conn.execute(
+                "SELECT id, lengths FROM index_lengths" + where, params
+            ):
+                lengths[episode_id] = codec.loads(row)
+        return {"fields": list(FIELDS), "postings": postings, "lengths": lengths}
+
+    def add_index_terms(self, entries: List[Dict[str, Any]]) -> None:
+        """Store the postings of already indexed entries, replacing any."""
+        with self.connect() as conn:
+            self._write_terms(conn, entries)
+
+    def _write_terms(self, conn: sqlite3.Connection, entries: List[Dict[str, Any]]) -> None:
+        # Later entries win, as they do in episode_index
+        latest = {e.get("id"): e for e in entries if e.get("id")}
+        conn.executemany(
+            "DELETE FROM index_postings WHERE id = ?", [(i,) for i in latest]
+        )
+        postings = []
+        lengths = []
+        for episode_id, entry in latest.items():
+            frequencies, field_lengths = entry_terms(entry)
+            postings.extend((token, episode_id, _dumps(tf)) for token, tf in frequencies.items())
+            lengths.append((episode_id, _dumps(field_lengths)))
+        conn.executemany(
+            "INSERT INTO index_postings (token, id, tf) VALUES (?, ?, ?)", postings
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO index_lengths (id, lengths) VALUES (?, ?)", lengths
+        )
+
+    # Semantic rules
+
+    def get_semantic_rules(self) -> List[Dict[str, Any]]:
+        """Return all rule documents in insertion order."""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM semantic_rules ORDER BY position"
+            ).fetchall()
+        return [codec.loads(r[0]) for r in rows]
+
+    def add_semantic_rule(self, data: Dict[str, Any]) -> None:
+        """Append a rule document (replacing any rule with the same id)."""
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO semantic_rules (id, data) VALUES (?, ?)",
+                (data.get("id"), _dumps(data))
+            )
+            version = self._get_version(conn, RULES_VERSION_DOC)
+            self._set_version(conn, RULES_VERSION_DOC, version + 1)
+
+    def save_semantic_rules(
+        self,
+        rules: List[Dict[str, Any]],
+        expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Replace the full rule set in one transaction.
+
+        Args:
+            rules: Rule documents
+            expected_version: Only save if the rule set is still at this
+                version; None saves unconditionally
+
+        Returns:
+            New version, or None on a version conflict
+        """
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            version = self._get_version(conn, RULES_VERSION_DOC)
+            if expected_version is not None and version != expected_version:
+                return None
+            conn.execute("DELETE FROM semantic_rules")
+            conn.executemany(
+                "INSERT OR REPLACE INTO semantic_rules (id, data) VALUES (?, ?)",
+                [(r.get("id"), _dumps(r)) for r in rules]
+            )
+            self._set_version(conn, RULES_VERSION_DOC, version + 1)
+        return version + 1
+
+    def get_semantic_rules_version(self) -> int:
+        """Return the rule set's version counter."""
+        with self.connect() as conn:
+            return self._get_version(conn, RULES_VERSION_DOC)
+
+    @staticmethod
+    def _get_version(conn: sqlite3.Connection, name: str) -> int:
+        row = conn.execute(
+            "SELECT data FROM documents WHERE name = ?", (name,)
+        ).fetchone()
+        return codec.loads(row[0]).get("version", 0) if row else 0
+
+    @staticmethod
+    def _set_version(conn: sqlite3.Connection, name: str, version: int) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)",
+            (name, _dumps({"version": version}))
+        )
+
+    # Documents (self model)
+
+    def get_document(self, name: str) -> Optional[Any]:
+        """Return a named JSON document or None."""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM documents WHERE name = ?", (name,)
+            ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def save_document(self, name: str, data: Any) -> None:
+        """Insert or replace a named JSON document."""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)",
+                (name, _dumps(data))
+            )
+
+    def save_versioned_document(
+        self,
+        name: str,
+        data: Dict[str, Any],
+        expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Save a document carrying its own "version" field, bumping it.
+
+        Args:
+            name: Document name
+            data: Document dict; its "version" is set to the new version
+            expected_version: Only save if the stored document is still at
+                this version; None saves unconditionally
+
+        Returns:
+            New version, or None on a version conflict
+        """
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data FROM documents WHERE name = ?", (name,)
+            ).fetchone()
+            version = codec.loads(row[0]).get("version", 0) if row else 0
+            if expected_version is not None and version != expected_version:
+                return None
+            data["version"] = version + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)",
+                (name, _dumps(data))
+            )
+        return version + 1
@@ -6,15 +6,31 @@ Uses atomic writes and file locking for data integrity.
 """
 
 import os
-import json
+import copy
+import hashlib
 import shutil
 import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional, List
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, List, Set, Tuple, Union
+)
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 
+from . import archive, codec, compression, index_log
+from .inverted_index import InvertedIndex
 from .locking import file_lock, LockAcquisitionError
+from .score_columns import ScoreColumns
+from .secondary_index import SecondaryIndex
+from .trigram_index import TrigramIndex
+from pydantic import TypeAdapter
+
 from .models import SelfModel, Episode, SemanticRule
+from .config import ANN_CONFIG, MEMORY_CONFIG, STORAGE_CONFIG
+from .sqlite_store import SQLiteStore
+from .vector_store import VectorStore
 
 
 def get_sophia_dir() -> Path:
@@ -72,6 +88,107 @@ def ensure_sophia_dir() -> Path:
     return sophia_dir
 
 
+# Process-local cache of parsed documents, keyed on the files they were
+# parsed from. An entry is reused while every file's (inode, mtime_ns, size)
+# is unchanged, so writes from other processes invalidate it on the next
+# read. Atomic writes rename a new inode into place, which changes the
+# signature even when the size and coarse mtime don't.
+_read_cache: Dict[Tuple[str, ...], Tuple[Tuple, Any]] = {}
+_read_cache_lock = threading.Lock()
+_read_cache_stats = {"hits": 0, "misses": 0}
+_read_cache_enabled = not os.environ.get("SOPHIA_DISABLE_CACHE")
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """
+    Identify a file's current version with one stat call.
+
+    Args:
+        path: File path
+
+    Returns:
+        (inode, mtime in ns, size), or None if the file doesn't exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _cached(kind: str, paths: List[Path], loader: Callable[[], Any]) -> Any:
+    """
+    Return loader() for the given files, reusing the parsed result while
+    none of the files changed.
+
+    Callers must not mutate the returned object; public getters hand out
+    copies.
+    """
+    if not _read_cache_enabled:
+        return loader()
+
+    key = (kind,) + tuple(str(p) for p in paths)
+    # Signature is taken before loading: if a file changes mid-load, the
+    # next read sees a newer signature and reloads
+    signature = tuple(file_signature(p) for p in paths)
+
+    with _read_cache_lock:
+        cached = _read_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            _read_cache_stats["hits"] += 1
+            return cached[1]
+        _read_cache_stats["misses"] += 1
+
+    value = loader()
+
+    with _read_cache_lock:
+        _read_cache[key] = (signature, value)
+
+    return value
+
+
+def _invalidate_cached(file_path: Path) -> None:
+    """Drop cache entries built from file_path (after our own writes)."""
+    path_str = str(file_path)
+    with _read_cache_lock:
+        for key in [k for k in _read_cache if path_str in k[1:]]:
+            del _read_cache[key]
+
+
+def read_cache_stats() -> Dict[str, int]:
+    """
+    Get read cache counters.
+
+    Returns:
+        Dict with hits, misses and the number of cached entries
+    """
+    with _read_cache_lock:
+        return {**_read_cache_stats, "entries": len(_read_cache)}
+
+
+def clear_read_cache() -> None:
+    """Drop all cached documents and reset the counters."""
+    with _read_cache_lock:
+        _read_cache.clear()
+        _read_cache_stats["hits"] = 0
+        _read_cache_stats["misses"] = 0
+
+
+def set_read_cache_enabled(enabled: bool) -> None:
+    """
+    Enable or bypass the read cache (e.g. in tests).
+
+    The cache can also be disabled with SOPHIA_DISABLE_CACHE=1.
+
+    Args:
+        enabled: Whether getters may reuse parsed documents
+    """
+    global _read_cache_enabled
+    _read_cache_enabled = enabled
+    if not enabled:
+        clear_read_cache()
+
+
 def read_json(file_path: Path, default: Any = None) -> Any:
     """
     Read JSON from a file.
@@ -89,13 +206,18 @@ def read_json(file_path: Path, default: Any = None) -> Any:
         return default
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
+        with open(file_path, 'rb') as f:
+            return codec.loads(compression.decompress(f.read()))
+    except (ValueError, IOError):
         return default
 
 
-def write_json(file_path: Path, data: Any, use_lock: bool = False) -> None:
+def write_json(
+    file_path: Path,
+    data: Any,
+    use_lock: bool = False,
+    file_type: Optional[str] = None
+) -> None:
     """
     Write JSON to a file atomically (write to temp, then rename).
 
@@ -103,28 +225,25 @@ def write_json(file_path: Path, data: Any, use_lock: bool = False) -> None:
         file_path: Path to the JSON file
         data: Data to serialize
         use_lock: Whether to acquire a file lock first
+        file_type: Key into STORAGE_CONFIG["json_formats"] choosing
+            "pretty" or "compact" output; None uses the default format.
+            Types in STORAGE_CONFIG["compressed_types"] are compressed
+            when config.json enables compression.
     """
     file_path = Path(file_path)
+    formats = STORAGE_CONFIG["json_formats"]
+    pretty = formats.get(file_type, formats["default"]) == "pretty"
+
+    method = None
+    if file_type in STORAGE_CONFIG["compressed_types"]:
+        method = _compression_method()
 
     # Ensure parent directory exists
     file_path.parent.mkdir(parents=True, exist_ok=True)
 
     def do_write():
-        # Write to temp file first
-        fd, temp_path = tempfile.mkstemp(
-            suffix='.tmp',
-            dir=file_path.parent
-        )
-        try:
-            with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, default=str)
-            # Atomic rename
-            shutil.move(temp_path, file_path)
-        except Exception:
-            # Clean up temp file on error
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            raise
+        payload = codec.dumps(data, pretty=pretty and method is None)
+        _atomic_write(file_path, compression.compress(payload, method))
 
     if use_lock:
         with file_lock(str(file_path)):
@@ -133,6 +252,104 @@ def write_json(file_path: Path, data: Any, use_lock: bool = False) -> None:
         do_write()
 
 
+def _atomic_write(file_path: Path, payload: bytes) -> None:
+    """
+    Replace file_path with payload via a temp file and rename.
+
+    Flushes according to the configured durability mode. The file is
+    always fsynced before the rename; inside a batch_writes() block the
+    directory fsync is left to the end of the block.
+    """
+    mode = _durability_mode()
+    pending = getattr(_batch_state, "pending", None)
+
+    # Write to temp file first
+    fd, temp_path = tempfile.mkstemp(
+        suffix='.tmp',
+        dir=file_path.parent
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            if mode != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        # Atomic rename
+        shutil.move(temp_path, file_path)
+        _invalidate_cached(file_path)
+    except Exception:
+        # Clean up temp file on error
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    if mode == "fsync-file+dir":
+        if pending is None:
+            _fsync_dir(file_path.parent)
+        else:
+            pending[file_path.parent] = None
+
+
+DURABILITY_MODES = ("none", "fsync-file", "fsync-file+dir")
+
+# Directories written to inside the current thread's batch_writes() block
+_batch_state = threading.local()
+
+
+def _durability_mode() -> str:
+    mode = _stored_config().get("durability", STORAGE_CONFIG["durability"])
+    return mode if mode in DURABILITY_MODES else STORAGE_CONFIG["durability"]
+
+
+def _fsync_dir(directory: Path) -> None:
+    """Persist renames in a directory (a no-op where unsupported)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Removed since it was written
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # Some platforms can't fsync directories
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def batch_writes():
+    """
+    Group the directory flushes of several write_json calls.
+
+    Only has an effect under durability "fsync-file+dir": the directory
+    fsyncs that make the renames durable are deferred to the end of the
+    block, once per directory, and until then a crash may undo renames
+    done in the block. The other modes never fsync directories, so the
+    block changes nothing there; each file is still written, fsynced (if
+    the mode says so) and renamed into place as usual.
+
+    Nested blocks join the outermost one. Batches are per thread.
+
+    Example:
+        with batch_writes():
+            save_self_model(model)
+            save_semantic_rules(rules)
+            save_agent_result(task_id, result)
+    """
+    if getattr(_batch_state, "pending", None) is not None:
+        yield
+        return
+
+    # Dict keeps first-write order and drops repeats
+    _batch_state.pending = {}
+    try:
+        yield
+    finally:
+        directories = list(_batch_state.pending)
+        _batch_state.pending = None
+        for directory in directories:
+            _fsync_dir(directory)
+
+
 def get_config() -> Dict[str, Any]:
     """
     Get the current configuration.
@@ -140,8 +357,6 @@ def get_config() -> Dict[str, Any]:
     Returns:
         Configuration dict with defaults applied
     """
-    config_path = get_sophia_dir() / "config.json"
-
     defaults = {
         "schema_version": "1.0.0",
         "embedding_provider": "none",
@@ -150,10 +365,13 @@ def get_config() -> Dict[str, Any]:
         "guardian_tier3_enabled": True,
         "consolidation_min_episodes": 5,
         "user_mode": "single",
-        "current_user": "default"
+        "current_user": "default",
+        "storage_backend": STORAGE_CONFIG["backend"],
+        "compression": STORAGE_CONFIG["compression"],
+        "durability": STORAGE_CONFIG["durability"],
     }
 
-    config = read_json(config_path, {})
+    config = copy.deepcopy(_stored_config())
 
     # Apply defaults for missing keys
     for key, value in defaults.items():
@@ -163,6 +381,19 @@ def get_config() -> Dict[str, Any]:
     return config
 
 
+def _stored_config() -> Dict[str, Any]:
+    """config.json as stored (shared with the cache, don't mutate)."""
+    config_path = get_sophia_dir() / "config.json"
+    return _cached("config", [config_path], lambda: read_json(config_path, {}))
+
+
+def _compression_method() -> Optional[str]:
+    """Compression applied to new episode and archive files, or None."""
+    return compression.resolve_method(
+        _stored_config().get("compression", STORAGE_CONFIG["compression"])
+    )
+
+
 def save_config(config: Dict[str, Any]) -> None:
     """
     Save configuration to config.json with locking.
@@ -174,6 +405,22 @@ def save_config(config: Dict[str, Any]) -> None:
     write_json(config_path, config, use_lock=True)
 
 
+def get_store() -> Optional[SQLiteStore]:
+    """
+    Get the configured storage backend.
+
+    Returns:
+        SQLiteStore when config.json selects "sqlite", None for the
+        default one-file-per-document JSON layout
+    """
+    backend = _stored_config().get("storage_backend", STORAGE_CONFIG["backend"])
+
+    if backend != "sqlite":
+        return None
+
+    return SQLiteStore(get_sophia_dir() / STORAGE_CONFIG["sqlite_db"])
+
+
 def get_self_model() -> SelfModel:
     """
     Load the self model from disk.
@@ -181,10 +428,20 @@ def get_self_model() -> SelfModel:
     Returns:
         SelfModel instance (creates default if not exists)
     """
+    store = get_store()
+    if store is not None:
+        import_hook_entries(store)
+        return _validate_self_model(store.get_document("self_model"))
+
     model_path = get_sophia_dir() / "self_model.json"
+    model = _cached(
+        "self_model", [model_path],
+        lambda: _validate_self_model(read_json(model_path))
+    )
+    return model.model_copy(deep=True)
 
-    data = read_json(model_path)
 
+def _validate_self_model(data: Optional[Dict[str, Any]]) -> SelfModel:
     if data is None:
         return SelfModel()
 
@@ -199,98 +456,968 @@ def save_self_model(model: SelfModel) -> None:
     """
     Save the self model to disk with locking.
 
+    Overwrites whatever is stored; use update_self_model() to modify the
+    current model without losing concurrent changes. Either way the
+    stored version is bumped and copied to model.version.
+
     Args:
         model: SelfModel instance to save
     """
-    model_path = get_sophia_dir() / "self_model.json"
-
     # Update timestamp
     model.updated_at = datetime.now()
 
     # Convert to dict for JSON serialization
     data = model.model_dump(mode='json')
 
-    write_json(model_path, data, use_lock=True)
+    model.version = _save_self_model_data(data)
 
 
-def get_episode_index() -> Dict[str, Any]:
+def _save_self_model_data(
+    data: Dict[str, Any],
+    expected_version: Optional[int] = None
+) -> Optional[int]:
+    """Write self model data with a bumped version; None on a conflict."""
+    store = get_store()
+    if store is not None:
+        return store.save_versioned_document("self_model", data, expected_version)
+
+    model_path = get_sophia_dir() / "self_model.json"
+
+    with file_lock(str(model_path)):
+        current = read_json(model_path)
+        version = current.get("version", 0) if isinstance(current, dict) else 0
+        if expected_version is not None and version != expected_version:
+            return None
+        data["version"] = version + 1
+        write_json(model_path, data)
+
+    return version + 1
+
+
+class VersionConflictError(Exception):
+    """Raised when an update keeps conflicting with concurrent writers."""
+    pass
+
+
+# Outcomes of update_self_model / update_semantic_rules in this process
+_update_stats = {
+    kind: {"updates": 0, "conflicts": 0, "failures": 0}
+    for kind in ("self_model", "semantic_rules")
+}
+_update_stats_lock = threading.Lock()
+
+
+def _count_update(kind: str, outcome: str) -> None:
+    with _update_stats_lock:
+        _update_stats[kind][outcome] += 1
+
+
+def update_stats() -> Dict[str, Dict[str, int]]:
     """
-    Get the episode index.
+    Get optimistic update counters for this process.
 
     Returns:
-        Episode index dict with entries list
+        Per document ("self_model", "semantic_rules"): committed updates,
+        version conflicts (each one retried) and failures (updates that
+        ran out of retries)
+    """
+    with _update_stats_lock:
+        return {kind: dict(counts) for kind, counts in _update_stats.items()}
+
+
+def _run_update(
+    kind: str,
+    load: Callable[[], Tuple[Any, int]],
+    mutate: Callable[[Any], Any],
+    commit: Callable[[Any, int], Optional[int]],
+    max_retries: Optional[int]
+) -> Tuple[Any, int]:
+    """Load, mutate and commit with a version check until it sticks."""
+    if max_retries is None:
+        max_retries = STORAGE_CONFIG["update_max_retries"]
+
+    for _ in range(max_retries + 1):
+        value, version = load()
+        result = mutate(value)
+        if result is not None:
+            value = result
+
+        new_version = commit(value, version)
+        if new_version is not None:
+            _count_update(kind, "updates")
+            return value, new_version
+        _count_update(kind, "conflicts")
+
+    _count_update(kind, "failures")
+    raise VersionConflictError(
+        f"{kind} changed concurrently on each of {max_retries + 1} attempts"
+    )
+
+
+def update_self_model(
+    mutate: Callable[[SelfModel], Optional[SelfModel]],
+    max_retries: Optional[int] = None
+) -> SelfModel:
+    """
+    Modify the self model with optimistic concurrency.
+
+    mutate gets the current model and changes it in place (or returns a
+    replacement). The result is saved only if nobody else saved in the
+    meantime; otherwise mutate runs again on the fresh model. The lock
+    is held just for the final version check and write, so mutate may
+    take as long as it needs, but it must be safe to call more than once.
+
+    Args:
+        mutate: Function applying the change
+        max_retries: Re-runs after a version conflict (default
+            STORAGE_CONFIG["update_max_retries"])
+
+    Returns:
+        The saved SelfModel
+
+    Raises:
+        VersionConflictError if every attempt conflicted
     """
-    index_path = get_sophia_dir() / "episodes" / "index.json"
+    def load():
+        model = get_self_model()
+        return model, model.version
+
+    def commit(model, version):
+        model.updated_at = datetime.now()
+        return _save_self_model_data(model.model_dump(mode='json'), version)
 
-    return read_json(index_path, {
+    model, version = _run_update("self_model", load, mutate, commit, max_retries)
+    model.version = version
+    return model
+
+
+def _empty_index() -> Dict[str, Any]:
+    return {
         "last_updated": datetime.now().isoformat(),
         "total_episodes": 0,
         "entries": []
-    })
+    }
+
+
+def get_episode_index() -> Dict[str, Any]:
+    """
+    Get the episode index.
+
+    Merges the compacted snapshot (index.json) with entries appended to
+    index.log.jsonl since the last compaction. A log past the compaction
+    threshold is folded in the background (see compact_oversized_log).
+
+    Returns:
+        Episode index dict with entries list
+    """
+    store = get_store()
+    if store is not None:
+        import_hook_entries(store)
+        return store.get_episode_index(limit=MEMORY_CONFIG["max_index_entries"])
+
+    episodes_dir = get_sophia_dir() / "episodes"
+    index_path = episodes_dir / "index.json"
+    log_path = episodes_dir / "index.log.jsonl"
+    compact_oversized_log()
+
+    def merge():
+        index = read_json(index_path, _empty_index())
+        log_entries = index_log.read_log(log_path)
+
+        if log_entries:
+            index["entries"] = index_log.merge_entries(index.get("entries", []), log_entries)
+            index["total_episodes"] = len(index["entries"])
+
+        return index
+
+    def load():
+        # Shared lock: readers run concurrently, but never between
+        # compaction's snapshot write and its log truncation
+        try:
+            with file_lock(str(index_path), shared=True):
+                return merge()
+        except LockAcquisitionError:
+            return merge()
+
+    index = _cached("episode_index", [index_path, log_path], load)
+
+    # Entries are shared with the cache and must be treated as read-only
+    return {**index, "entries": list(index.get("entries", []))}
+
+
+def import_hook_entries(store: SQLiteStore) -> int:
+    """
+    Move sessions the session_end hook recorded as files into the database.
+
+    Under the sqlite backend the hook writes to sophia.db directly, but
+    without the sqlite3 CLI, or before the database exists, it falls back
+    to an episode file and a line in index.log.jsonl (which the library
+    doesn't otherwise use with this backend). Each such line is one ended
+    session: its episode and index entry are stored and the self model's
+    session and episode counts bumped, as the hook would have done. Only
+    episode files that were stored are removed; one that can't be read is
+    left for inspection.
+
+    Args:
+        store: The sqlite backend
+
+    Returns:
+        Number of sessions imported
+    """
+    episodes_dir = get_sophia_dir() / "episodes"
+    log_path = episodes_dir / "index.log.jsonl"
+    signature = file_signature(log_path)
+    if signature is None or not signature[2]:
+        return 0  # Costs one stat call in the usual case
+
+    stored = []
+    try:
+        with file_lock(str(episodes_dir / "index.json")):
+            entries = index_log.read_log(log_path)
+            for entry in entries:
+                episode_path = episodes_dir / f"{entry.get('id')}.json"
+                data = read_json(episode_path)
+                if isinstance(data, dict) and data.get("id"):
+                    store.write_episode(data)
+                    stored.append(episode_path)
+            if entries:
+                store.add_index_entries(entries)
+            index_log.truncate_log(log_path)
+    except LockAcquisitionError:
+        return 0  # The hook is appending; import on a later read
+
+    # Episode files that couldn't be read or validated are left in place
+    for episode_path in stored:
+        episode_path.unlink(missing_ok=True)
+
+    if entries:
+        def bump(model: SelfModel) -> None:
+            model.total_sessions += len(entries)
+            model.total_episodes += len(entries)
+            model.last_session = datetime.now()
+
+        update_self_model(bump)
+    return len(entries)
 
 
 def update_episode_index(entry: Dict[str, Any]) -> None:
     """
     Add an entry to the episode index with locking.
 
-    Handles index capping (max 1000 entries).
+    Appends one line to index.log.jsonl, so index.json isn't rewritten,
+    and adds the entry's postings to index.terms.json, so keyword search
+    doesn't re-tokenize the log. An entry whose id is already indexed
+    replaces the existing one. Once the log passes
+    STORAGE_CONFIG["index_log_compact_bytes"] it is folded into index.json
+    in a background thread.
 
     Args:
         entry: Episode index entry to add
     """
-    index_path = get_sophia_dir() / "episodes" / "index.json"
+    store = get_store()
+    if store is not None:
+        store.add_index_entries([entry])
+        return
+
+    episodes_dir = get_sophia_dir() / "episodes"
+    index_path = episodes_dir / "index.json"
 
     with file_lock(str(index_path)):
-        index = read_json(index_path, {
-            "last_updated": datetime.now().isoformat(),
-            "total_episodes": 0,
-            "entries": []
+        log_size = index_log.append_entry(episodes_dir / "index.log.jsonl", entry)
+        _append_terms(episodes_dir, log_size)
+
+    if log_size >= STORAGE_CONFIG["index_log_compact_bytes"]:
+        _schedule_index_compaction(get_sophia_dir())
+
+
+def compact_oversized_log() -> bool:
+    """
+    Schedule compaction if index.log.jsonl has passed its size threshold.
+
+    The session_end hook appends to the log without compacting, so
+    readers check its size (one stat call) and fold it in the background
+    once it passes STORAGE_CONFIG["index_log_compact_bytes"]. That also
+    applies the index cap and moves capped entries to the archive.
+
+    Returns:
+        True if a compaction was scheduled
+    """
+    sophia_dir = get_sophia_dir()
+    signature = file_signature(sophia_dir / "episodes" / "index.log.jsonl")
+    if signature is None or signature[2] < STORAGE_CONFIG["index_log_compact_bytes"]:
+        return False
+    _schedule_index_compaction(sophia_dir)
+    return True
+
+
+TERMS_FILE = "index.terms.json"
+
+# Trigram index per index location, kept as the keyword index reloads
+_trigram_indexes: Dict[str, TrigramIndex] = {}
+
+
+def _shared_trigrams(path: Path) -> TrigramIndex:
+    with _read_cache_lock:
+        return _trigram_indexes.setdefault(str(path), TrigramIndex())
+
+
+def _read_terms(episodes_dir: Path) -> Tuple[Optional[InvertedIndex], int]:
+    """index.terms.json and the log offset it covers (None, 0 if unusable)."""
+    data = read_json(episodes_dir / TERMS_FILE)
+    terms = InvertedIndex.from_dict(data)
+    if terms is None:
+        return None, 0
+    offset = data.get("log_offset", 0)
+    return terms, offset if isinstance(offset, int) else 0
+
+
+def _write_terms(episodes_dir: Path, terms: InvertedIndex, log_offset: int) -> None:
+    write_json(
+        episodes_dir / TERMS_FILE,
+        {**terms.to_dict(), "log_offset": log_offset},
+        file_type="index"
+    )
+
+
+def _load_terms(episodes_dir: Path, snapshot: Dict[str, Any]) -> InvertedIndex:
+    """
+    Postings for an index.json snapshot and the log on top of it.
+
+    Rebuilt from the snapshot if missing or stale; log entries past the
+    offset the postings cover are added.
+    """
+    log_path = episodes_dir / "index.log.jsonl"
+    log_signature = file_signature(log_path)
+    terms, offset = _read_terms(episodes_dir)
+    if (terms is None or terms.generation != snapshot.get("last_updated")
+            or offset > (log_signature[2] if log_signature else 0)):
+        terms = InvertedIndex.build(snapshot.get("entries", []), snapshot.get("last_updated"))
+        offset = 0
+    for entry in index_log.read_log(log_path, offset):
+        terms.add(entry)
+    return terms
+
+
+def _append_terms(episodes_dir: Path, log_size: int) -> None:
+    """
+    Index entries appended to the log in index.terms.json.
+
+    Called under the index lock after an append. Adds every log entry the
+    postings don't cover yet (including any the hook appended) and
+    advances their log offset to log_size. Postings that are stale for
+    index.json are left for readers to rebuild.
+    """
+    terms, offset = _read_terms(episodes_dir)
+    if terms is None:
+        snapshot = read_json(episodes_dir / "index.json", _empty_index())
+        terms = InvertedIndex.build(snapshot.get("entries", []), snapshot.get("last_updated"))
+    elif offset > log_size:
+        return
+    for entry in index_log.read_log(episodes_dir / "index.log.jsonl", offset):
+        terms.add(entry)
+    _write_terms(episodes_dir, terms, log_size)
+
+
+class KeywordIndex(NamedTuple):
+    """Postings plus the live index entries they refer to."""
+    terms: InvertedIndex
+    entries: Dict[str, Dict[str, Any]]  # id -> index entry
+    positions: Dict[str, int]  # id -> position in the index, newest first
+    columns: ScoreColumns  # Ranking inputs, one row per position
+    filters: SecondaryIndex  # Attribute postings for filtered search
+
+
+def get_keyword_index() -> KeywordIndex:
+    """
+    Get token postings for the live episode index.
+
+    For the JSON backend the postings stored in episodes/index.terms.json
+    (kept current by update_episode_index and compaction) are loaded and
+    log entries they don't cover yet, such as those the session_end hook
+    appended, are added on top. The sqlite backend loads them from its
+    index_postings table, indexing rows the hook inserted on the first
+    read. The result is cached until
+    any of the files changes, so repeated searches only touch the
+    postings of their query tokens. The trigram index used for fuzzy
+    matching carries over reloads; only tokens added or dropped since are
+    indexed or pruned.
+
+    Returns:
+        KeywordIndex; treat it as read-only
+    """
+    store = get_store()
+    if store is not None:
+        db_path = get_sophia_dir() / STORAGE_CONFIG["sqlite_db"]
+        # The log holds hook entries not imported yet (see import_hook_entries)
+        paths = [db_path, Path(f"{db_path}-wal"), get_sophia_dir() / "episodes" / "index.log.jsonl"]
+
+        def build():
+            entries = get_episode_index()["entries"]
+            terms = InvertedIndex.from_dict(
+                store.get_index_terms(limit=MEMORY_CONFIG["max_index_entries"])
+            )
+            # Rows the hook inserted with the sqlite3 CLI have no postings
+            missing = [e for e in entries if e.get("id") and e["id"] not in terms]
+            if missing:
+                store.add_index_terms(missing)
+                for entry in missing:
+                    terms.add(entry)
+            terms.attach_trigrams(_shared_trigrams(db_path))
+            return _keyword_index(terms, entries)
+
+        return _cached("keyword_index", paths, build)
+
+    episodes_dir = get_sophia_dir() / "episodes"
+    index_path = episodes_dir / "index.json"
+    log_path = episodes_dir / "index.log.jsonl"
+    compact_oversized_log()
+
+    def load():
+        # Read under the index lock so the snapshot, log and postings
+        # belong together
+        try:
+            with file_lock(str(index_path), shared=True):
+                snapshot = read_json(index_path, _empty_index())
+                log_entries = index_log.read_log(log_path)
+                terms = _load_terms(episodes_dir, snapshot)
+        except LockAcquisitionError:
+            snapshot = read_json(index_path, _empty_index())
+            log_entries = index_log.read_log(log_path)
+            terms = _load_terms(episodes_dir, snapshot)
+
+        terms.attach_trigrams(_shared_trigrams(index_path))
+        entries = index_log.merge_entries(snapshot.get("entries", []), log_entries)
+        return _keyword_index(terms, entries)
+
+    return _cached("keyword_index", [episodes_dir / TERMS_FILE, index_path, log_path], load)
+
+
+def index_generation() -> str:
+    """
+    Token identifying the current state of everything searches read.
+
+    Derived from the signatures of the episode index and its log, the
+    archive, the vector sidecar and its IVF index, the sqlite database and
+    config.json (which selects the embedding provider), so it changes on
+    every write by any process, including the session_end hook appending
+    to the index log. Costs a handful of stat calls.
+
+    Returns:
+        Hex string; equal tokens mean searches would see the same data
+    """
+    sophia_dir = get_sophia_dir()
+    episodes_dir = sophia_dir / "episodes"
+    vectors_dir = episodes_dir / "vectors"
+    db_path = sophia_dir / STORAGE_CONFIG["sqlite_db"]
+    paths = [
+        sophia_dir / "config.json",
+        episodes_dir / "index.json",
+        episodes_dir / "index.log.jsonl",
+        episodes_dir / "archive" / archive.MANIFEST,
+        episodes_dir / "archive" / archive.OPEN_SEGMENT,
+        vectors_dir / "ids.txt",
+        vectors_dir / "matrix.f32",
+        vectors_dir / "ivf_meta.json",
+        vectors_dir / "ivf_assign.i32",
+        db_path,
+        Path(f"{db_path}-wal"),
+    ]
+    state = repr((str(sophia_dir), [file_signature(p) for p in paths]))
+    return hashlib.blake2b(state.encode(), digest_size=8).hexdigest()
+
+
+def _keyword_index(
+    terms: InvertedIndex,
+    entries: Optional[List[Dict[str, Any]]] = None
+) -> KeywordIndex:
+    if entries is None:
+        entries = get_episode_index()["entries"]
+    return KeywordIndex(
+        terms=terms,
+        entries={e.get("id"): e for e in entries},
+        positions={e.get("id"): i for i, e in enumerate(entries)},
+        columns=ScoreColumns.from_entries(entries),
+        filters=SecondaryIndex.from_entries(entries),
+    )
+
+
+def rebuild_keyword_index() -> int:
+    """
+    Rebuild the stored keyword postings from the current index.
+
+    That is episodes/index.terms.json, or the index_postings and
+    index_lengths tables under the sqlite backend. Normally index writes
+    keep them current; this is for existing trees and after editing the
+    index by hand.
+
+    Returns:
+        Number of entries indexed
+    """
+    store = get_store()
+    if store is not None:
+        store.add_index_terms(list(store.iter_index_entries()))
+        return len(get_keyword_index().terms)
+
+    episodes_dir = get_sophia_dir() / "episodes"
+    index_path = episodes_dir / "index.json"
+    log_path = episodes_dir / "index.log.jsonl"
+
+    with file_lock(str(index_path)):
+        snapshot = read_json(index_path, _empty_index())
+        entries = index_log.merge_entries(snapshot.get("entries", []), index_log.read_log(log_path))
+        terms = InvertedIndex.build(entries, snapshot.get("last_updated"))
+        log_signature = file_signature(log_path)
+        _write_terms(episodes_dir, terms, log_signature[2] if log_signature else 0)
+
+    return len(terms)
+
+
+def backfill_index_fields() -> int:
+    """
+    Add "tools" and "session_id" to index entries that predate them.
+
+    Filtered search reads both from index entries; the session_end hook
+    records them for new episodes. Each older entry's episode is read
+    once and the entry re-appended with the fields (replacing it by id).
+
+    Returns:
+        Number of entries updated
+    """
+    updated = []
+    for entry in get_episode_index()["entries"]:
+        if not entry.get("id") or ("tools" in entry and "session_id" in entry):
+            continue
+        episode = read_episode(entry["id"], fields=["session_id", "actions"])
+        if episode is None:
+            continue
+        tools = {a.get("tool") for a in episode.actions if isinstance(a, dict)}
+        updated.append({
+            **entry,
+            "tools": sorted(str(tool) for tool in tools if tool),
+            "session_id": episode.session_id,
         })
 
-        # Add new entry at beginning
-        index["entries"].insert(0, entry)
+    # Entries replaced by id keep their position in the index
+    store = get_store()
+    if store is not None:
+        store.add_index_entries(updated)
+    else:
+        for entry in updated:
+            update_episode_index(entry)
+    return len(updated)
+
+
+def compact_episode_index(sophia_dir: Optional[Path] = None) -> int:
+    """
+    Fold index.log.jsonl into the index.json snapshot.
+
+    Handles index capping (MEMORY_CONFIG["max_index_entries"]); older
+    entries move to the segmented archive in episodes/archive/.
+
+    Args:
+        sophia_dir: System 3 directory (defaults to ~/.sophia)
+
+    Returns:
+        Number of log entries folded
+    """
+    sophia_dir = Path(sophia_dir) if sophia_dir else get_sophia_dir()
+    episodes_dir = sophia_dir / "episodes"
+    index_path = episodes_dir / "index.json"
+    log_path = episodes_dir / "index.log.jsonl"
+    max_entries = MEMORY_CONFIG["max_index_entries"]
+
+    with file_lock(str(index_path)):
+        log_entries = index_log.read_log(log_path)
+        if not log_entries:
+            return 0
+
+        index = read_json(index_path, _empty_index())
+        terms = _load_terms(episodes_dir, index)
+        index["entries"] = index_log.merge_entries(index.get("entries", []), log_entries)
         index["total_episodes"] = len(index["entries"])
         index["last_updated"] = datetime.now().isoformat()
 
-        # Cap at 1000 entries
-        if len(index["entries"]) > 1000:
-            # Archive older entries
-            year = datetime.now().year
-            archive_path = get_sophia_dir() / "episodes" / f"index_archive_{year}.json"
+        # Cap the live index
+        if len(index["entries"]) > max_entries:
+            segment_size = STORAGE_CONFIG["archive_segment_size"]
+            archive.import_legacy_archives(episodes_dir, segment_size)
+            archive.add_entries(
+                episodes_dir / "archive",
+                index["entries"][max_entries:],
+                segment_size
+            )
+            for entry in index["entries"][max_entries:]:
+                terms.remove(entry.get("id"))
+            index["entries"] = index["entries"][:max_entries]
+            index["total_episodes"] = len(index["entries"])
+
+        terms.generation = index["last_updated"]
+
+        # Snapshot first: a crash before the truncate only re-folds the
+        # same entries, which replace themselves by id. Postings are
+        # written last; a stale generation makes readers rebuild them.
+        write_json(index_path, index, file_type="index")
+        index_log.truncate_log(log_path)
+        _write_terms(episodes_dir, terms, 0)
+
+    return len(log_entries)
+
 
-            archived = index["entries"][1000:]
-            existing_archive = read_json(archive_path, [])
-            existing_archive.extend(archived)
-            write_json(archive_path, existing_archive)
+_compaction_thread: Optional[threading.Thread] = None
+_compaction_guard = threading.Lock()
 
-            index["entries"] = index["entries"][:1000]
 
-        write_json(index_path, index)
+def _schedule_index_compaction(sophia_dir: Path) -> None:
+    """
+    Run compact_episode_index in a background thread.
+
+    The thread is non-daemon, so a short-lived process (e.g. a hook)
+    still finishes the compaction before exiting.
+    """
+    global _compaction_thread
+
+    def run():
+        try:
+            compact_episode_index(sophia_dir)
+        except LockAcquisitionError:
+            pass  # Next append past the threshold retries
+
+    with _compaction_guard:
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return
+        _compaction_thread = threading.Thread(
+            target=run, name="sophia-index-compaction"
+        )
+        _compaction_thread.start()
 
 
-def read_episode(episode_id: str) -> Optional[Episode]:
+def iter_archived_entries(
+    query_keywords: Optional[Set[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Iterator[Dict[str, Any]]:
     """
-    Read a full episode from disk.
+    Iterate index entries that were capped out of the live index.
+
+    Args:
+        query_keywords: Lowercase query tokens used to skip archive
+            segments that can't match
+        since: Skip archive segments that end before this time
+        until: Skip archive segments that start after this time
+
+    Yields:
+        Archived index entries, newest first
+    """
+    store = get_store()
+    if store is not None:
+        yield from store.iter_index_entries(offset=MEMORY_CONFIG["max_index_entries"])
+        return
+
+    yield from archive.iter_archived_entries(
+        get_sophia_dir() / "episodes" / "archive",
+        query_keywords=query_keywords,
+        since=since,
+        until=until
+    )
+
+
+class IndexSegment(NamedTuple):
+    """A batch of archived index entries that can be read on demand."""
+    summary: Optional[Dict[str, Any]]  # Manifest summary, None if unknown
+    load: Callable[[], Iterable[Dict[str, Any]]]  # Entries, newest first
+
+
+def iter_archive_segments(
+    query_keywords: Optional[Set[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Iterator[IndexSegment]:
+    """
+    Iterate archived index entries segment by segment, newest first.
+
+    Nothing is read until a segment's load() is called, so a search can
+    skip segments by their summary and stop without touching the rest.
+    Entries may repeat across segments after an interrupted seal (see
+    archive.add_entries).
+
+    Args:
+        query_keywords: Lowercase query tokens used to skip segments
+            that can't match
+        since: Skip segments that end before this time
+        until: Skip segments that start after this time
+
+    Yields:
+        IndexSegment for the open archive segment (summary None), then
+        each sealed segment; the sqlite backend yields one segment with
+        every archived entry
+    """
+    store = get_store()
+    if store is not None:
+        offset = MEMORY_CONFIG["max_index_entries"]
+        yield IndexSegment(None, lambda: store.iter_index_entries(offset=offset))
+        return
+
+    archive_dir = get_sophia_dir() / "episodes" / "archive"
+    segments = archive.iter_segment_files(
+        archive_dir, query_keywords=query_keywords, since=since, until=until
+    )
+    for summary, path in segments:
+        yield IndexSegment(summary, lambda path=path: read_json(path, []))
+
+
+def read_episode(
+    episode_id: str,
+    fields: Optional[List[str]] = None
+) -> Optional[Union[Episode, "LazyEpisode"]]:
+    """
+    Read an episode from disk.
 
     Args:
         episode_id: Episode ID to load
+        fields: Episode fields to parse and validate up front. Returns a
+            LazyEpisode that loads the remaining fields (e.g. actions,
+            embedding) on first access. None reads the full episode.
 
     Returns:
-        Episode instance or None if not found
+        Episode (or LazyEpisode with fields) or None if not found
     """
+    if fields is not None:
+        return _read_episode_projection(episode_id, fields)
+
     episode_path = get_sophia_dir() / "episodes" / f"{episode_id}.json"
 
-    data = read_json(episode_path)
+    data = None
+    store = get_store()
+    if store is not None:
+        data = store.read_episode(episode_id)
+
+    # Hooks without sqlite3 available still write JSON episode files
+    if data is None:
+        data = read_json(episode_path)
 
     if data is None:
         return None
 
+    _attach_embedding(data)
+
     try:
         return Episode.model_validate(data)
     except Exception:
         return None
 
 
+class LazyEpisode:
+    """
+    Episode view holding a subset of fields.
+
+    Attribute access mirrors Episode. Projected fields are returned
+    directly; the first access to any other field loads and validates the
+    full episode once.
+    """
+
+    def __init__(self, fields: Dict[str, Any], loader: Callable[[], Optional[Episode]]):
+        """
+        Initialize a lazy episode.
+
+        Args:
+            fields: Validated values of the projected fields (includes id)
+            loader: Loads the full episode
+        """
+        self._fields = fields
+        self._loader = loader
+        self._episode: Optional[Episode] = None
+
+    @property
+    def loaded_fields(self) -> List[str]:
+        """Fields available without loading the full episode."""
+        if self._episode is not None:
+            return list(Episode.model_fields)
+        return list(self._fields)
+
+    def load(self) -> Optional[Episode]:
+        """Load (once) and return the full episode."""
+        if self._episode is None:
+            self._episode = self._loader()
+        return self._episode
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for names not found on the instance
+        if name.startswith('_') or name not in Episode.model_fields:
+            raise AttributeError(name)
+        if name in self._fields:
+            return self._fields[name]
+
+        episode = self.load()
+        if episode is None:
+            raise AttributeError(f"Episode {self._fields.get('id')} could not be loaded")
+        return getattr(episode, name)
+
+    def __repr__(self) -> str:
+        return f"LazyEpisode(id={self._fields.get('id')!r}, loaded={self.loaded_fields})"
+
+
+_field_adapters: Dict[str, TypeAdapter] = {}
+
+
+def _validate_episode_fields(data: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Validate projected field values, filling defaults for absent ones."""
+    values = {}
+    for name in fields:
+        field_info = Episode.model_fields[name]
+        if name not in data:
+            if field_info.is_required():
+                raise ValueError(f"Missing required field {name}")
+            values[name] = field_info.get_default(call_default_factory=True)
+            continue
+
+        adapter = _field_adapters.get(name)
+        if adapter is None:
+            adapter = _field_adapters[name] = TypeAdapter(field_info.annotation)
+        values[name] = adapter.validate_python(data[name])
+
+    return values
+
+
+def _read_episode_projection(episode_id: str, fields: List[str]) -> Optional[LazyEpisode]:
+    """Parse and validate only the requested fields of an episode."""
+    unknown = [f for f in fields if f not in Episode.model_fields]
+    if unknown:
+        raise ValueError(f"Unknown episode fields: {unknown}")
+
+    fields = list(dict.fromkeys(["id"] + list(fields)))
+
+    data = None
+    store = get_store()
+    if store is not None:
+        data = store.read_episode_fields(episode_id, fields)
+
+    # Hooks without sqlite3 available still write JSON episode files
+    if data is None:
+        episode_path = get_sophia_dir() / "episodes" / f"{episode_id}.json"
+        try:
+            with open(episode_path, 'rb') as f:
+                data = codec.loads_fields(compression.decompress(f.read()), fields)
+        except (ValueError, IOError):
+            return None
+
+    if "embedding" in fields:
+        _attach_embedding(data)
+
+    try:
+        values = _validate_episode_fields(data, fields)
+    except Exception:
+        return None
+
+    return LazyEpisode(values, lambda: read_episode(episode_id))
+
+
+class EpisodeBatch(NamedTuple):
+    """Result of a bulk episode read."""
+    episodes: List[Episode]  # Loaded episodes, in input order
+    missing: List[str]  # IDs with no stored episode
+    corrupt: List[str]  # IDs whose data failed to parse or validate
+
+
+def _read_episode_file(path: Path) -> Tuple[str, Any]:
+    """Load raw episode data, distinguishing missing from corrupt files."""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return "missing", None
+    except IOError:
+        return "corrupt", None
+
+    try:
+        return "ok", codec.loads(compression.decompress(raw))
+    except ValueError:
+        return "corrupt", None
+
+
+def _validate_episodes(items: List[Any]) -> List[Optional[Episode]]:
+    """Validate raw episode dicts; None for invalid ones (process pool worker)."""
+    episodes = []
+    for data in items:
+        try:
+            episodes.append(Episode.model_validate(data))
+        except Exception:
+            episodes.append(None)
+    return episodes
+
+
+def read_episodes(
+    episode_ids: List[str],
+    use_processes: Optional[bool] = None
+) -> EpisodeBatch:
+    """
+    Read many episodes at once.
+
+    File reads overlap in a thread pool. Large batches can also validate
+    in a process pool; a missing or corrupt episode is reported instead of
+    failing the batch.
+
+    Args:
+        episode_ids: Episode IDs to load
+        use_processes: Validate in a process pool; None decides by batch
+            size (STORAGE_CONFIG["bulk_process_threshold"])
+
+    Returns:
+        EpisodeBatch with the loaded episodes in input order plus the
+        missing and corrupt IDs
+    """
+    episode_ids = list(episode_ids)
+    if not episode_ids:
+        return EpisodeBatch([], [], [])
+
+    episodes_dir = get_sophia_dir() / "episodes"
+    raw: Dict[str, Tuple[str, Any]] = {}
+
+    store = get_store()
+    if store is not None:
+        for episode_id, data in store.read_episodes(episode_ids).items():
+            raw[episode_id] = ("ok", data)
+
+    # Hooks without sqlite3 available still write JSON episode files
+    to_read = [i for i in dict.fromkeys(episode_ids) if i not in raw]
+    if to_read:
+        workers = min(STORAGE_CONFIG["bulk_read_workers"], len(to_read))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            paths = [episodes_dir / f"{i}.json" for i in to_read]
+            for episode_id, result in zip(to_read, pool.map(_read_episode_file, paths)):
+                raw[episode_id] = result
+
+    loaded_ids = [i for i in dict.fromkeys(episode_ids) if raw[i][0] == "ok"]
+    items = [raw[i][1] for i in loaded_ids]
+    for data in items:
+        _attach_embedding(data)
+
+    if use_processes is None:
+        use_processes = len(items) >= STORAGE_CONFIG["bulk_process_threshold"]
+
+    if use_processes and len(items) > 1:
+        workers = min(os.cpu_count() or 1, len(items))
+        chunk = -(-len(items) // workers)
+        chunks = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            validated = [ep for part in pool.map(_validate_episodes, chunks) for ep in part]
+    else:
+        validated = _validate_episodes(items)
+
+    by_id = dict(zip(loaded_ids, validated))
+
+    batch = EpisodeBatch([], [], [])
+    for episode_id in episode_ids:
+        status = raw[episode_id][0]
+        if status == "missing":
+            batch.missing.append(episode_id)
+        elif status == "corrupt" or by_id.get(episode_id) is None:
+            batch.corrupt.append(episode_id)
+        else:
+            batch.episodes.append(by_id[episode_id])
+
+    return batch
+
+
 def write_episode(episode: Episode) -> None:
     """
     Write an episode to disk.
@@ -303,7 +1430,136 @@ def write_episode(episode: Episode) -> None:
     episode_path = get_sophia_dir() / "episodes" / f"{episode.id}.json"
 
     data = episode.model_dump(mode='json')
-    write_json(episode_path, data)
+
+    # The embedding goes to the vector sidecar; it stays in the episode
+    # only if its dimension doesn't match the sidecar's
+    if data.get("embedding") and get_vector_store().add(episode.id, data["embedding"]):
+        data["embedding"] = None
+
+    store = get_store()
+    if store is not None:
+        store.write_episode(data)
+        return
+
+    write_json(episode_path, data, file_type="episode")
+
+
+_vector_stores: Dict[Path, VectorStore] = {}
+
+
+def get_vector_store() -> VectorStore:
+    """
+    Get the episode embedding sidecar (episodes/vectors/).
+
+    The instance is shared so its id -> row map is only reloaded when
+    another process adds vectors.
+
+    Returns:
+        VectorStore instance
+    """
+    directory = get_sophia_dir() / "episodes" / "vectors"
+    store = _vector_stores.get(directory)
+    if store is None:
+        store = _vector_stores[directory] = VectorStore(directory)
+    return store
+
+
+def _attach_embedding(data: Any) -> None:
+    """Fill in an episode's embedding from the sidecar."""
+    if isinstance(data, dict) and data.get("embedding") is None and data.get("id"):
+        vector = get_vector_store().get(data["id"])
+        if vector is not None:
+            data["embedding"] = vector
+
+
+def rebuild_vector_store(strip_episodes: bool = True) -> Dict[str, int]:
+    """
+    Rebuild the embedding sidecar from the stored episodes.
+
+    Embeddings still inside episode documents (written before the sidecar
+    existed) are collected along with sidecar vectors of episodes that
+    still exist; vectors of deleted episodes are dropped.
+
+    Args:
+        strip_episodes: Rewrite episodes whose embedding moved to the
+            sidecar without it
+
+    Returns:
+        Counts of vectors in the rebuilt sidecar and episodes rewritten
+    """
+    episodes_dir = get_sophia_dir() / "episodes"
+    vectors = get_vector_store()
+    store = get_store()
+
+    documents: Dict[str, Dict[str, Any]] = {}
+    if store is not None:
+        documents.update(store.read_episodes(store.episode_ids()))
+    for episode_path in sorted(episodes_dir.glob("*.json")):
+        if episode_path.name.startswith("index") or episode_path.stem in documents:
+            continue
+        status, data = _read_episode_file(episode_path)
+        if status == "ok" and isinstance(data, dict) and data.get("id"):
+            documents[data["id"]] = data
+
+    pairs = []
+    embedded = []
+    for episode_id in vectors.ids():
+        if episode_id in documents:
+            pairs.append((episode_id, vectors.get(episode_id)))
+    for episode_id, data in documents.items():
+        if data.get("embedding"):
+            pairs.append((episode_id, data["embedding"]))
+            embedded.append(episode_id)
+
+    stored = vectors.rebuild(pairs)
+    counts = {"vectors": stored, "episodes_stripped": 0}
+    # The rebuilt sidecar starts without an ANN index
+    build_ann_index(only_if_stale=True)
+
+    if strip_episodes:
+        for episode_id in embedded:
+            data = documents[episode_id]
+            if vectors.get(episode_id) is None:
+                continue  # Dimension differs from the sidecar's
+            data["embedding"] = None
+            if store is not None and store.read_episode(episode_id) is not None:
+                store.write_episode(data)
+            else:
+                write_json(episodes_dir / f"{episode_id}.json", data, file_type="episode")
+            counts["episodes_stripped"] += 1
+
+    return counts
+
+
+def build_ann_index(nlist: Optional[int] = None, only_if_stale: bool = False) -> Dict[str, int]:
+    """
+    Train the IVF index that semantic search uses at scale.
+
+    New embeddings are added to the trained index as they arrive, but the
+    clusters themselves only change here. Retrain after the sidecar has
+    grown a lot (e.g. from a periodic job with only_if_stale=True).
+
+    Args:
+        nlist: Number of clusters (default ANN_CONFIG["nlist"] or about
+            4 * sqrt(vectors))
+        only_if_stale: Only train if the store has at least
+            ANN_CONFIG["min_vectors"] vectors and is untrained or has grown
+            past ANN_CONFIG["retrain_growth"] times its size at training
+
+    Returns:
+        Dict with clusters (0 if nothing was trained) and vectors
+    """
+    vectors = get_vector_store()
+    count = len(vectors)
+
+    if only_if_stale:
+        meta = vectors.ann.meta()
+        trained_rows = meta.get("trained_rows", 0) if meta else 0
+        fresh = meta is not None and count < trained_rows * ANN_CONFIG["retrain_growth"]
+        if count < ANN_CONFIG["min_vectors"] or fresh:
+            return {"clusters": 0, "vectors": count}
+
+    return {"clusters": vectors.train_ann(nlist), "vectors": count}
 
 
 def get_semantic_rules() -> List[SemanticRule]:
@@ -313,10 +1569,19 @@ def get_semantic_rules() -> List[SemanticRule]:
     Returns:
         List of SemanticRule instances
     """
+    store = get_store()
+    if store is not None:
+        return _validate_rules(store.get_semantic_rules())
+
     rules_path = get_sophia_dir() / "semantic_rules.json"
+    rules = _cached(
+        "semantic_rules", [rules_path],
+        lambda: _validate_rules(read_json(rules_path, []))
+    )
+    return [rule.model_copy(deep=True) for rule in rules]
 
-    data = read_json(rules_path, [])
 
+def _validate_rules(data: List[Dict[str, Any]]) -> List[SemanticRule]:
     rules = []
     for item in data:
         try:
@@ -334,11 +1599,17 @@ def add_semantic_rule(rule: SemanticRule) -> None:
     Args:
         rule: SemanticRule to add
     """
+    store = get_store()
+    if store is not None:
+        store.add_semantic_rule(rule.model_dump(mode='json'))
+        return
+
     rules_path = get_sophia_dir() / "semantic_rules.json"
 
     with file_lock(str(rules_path)):
         data = read_json(rules_path, [])
         data.append(rule.model_dump(mode='json'))
+        _bump_rules_version()
         write_json(rules_path, data)
 
 
@@ -346,13 +1617,98 @@ def save_semantic_rules(rules: List[SemanticRule]) -> None:
     """
     Save all semantic rules with locking.
 
+    Overwrites the stored rule set; use update_semantic_rules() to modify
+    it without losing concurrent changes.
+
     Args:
         rules: List of SemanticRule instances
     """
+    _save_rules_data([r.model_dump(mode='json') for r in rules])
+
+
+def _rules_version_path() -> Path:
+    # Kept beside semantic_rules.json, which stays a plain list
+    return get_sophia_dir() / "semantic_rules.version.json"
+
+
+def _bump_rules_version(expected_version: Optional[int] = None) -> Optional[int]:
+    """Bump the rules version (caller holds the rules lock); None on a conflict."""
+    version = read_json(_rules_version_path(), {}).get("version", 0)
+    if expected_version is not None and version != expected_version:
+        return None
+    write_json(_rules_version_path(), {"version": version + 1})
+    return version + 1
+
+
+def _save_rules_data(
+    data: List[Dict[str, Any]],
+    expected_version: Optional[int] = None
+) -> Optional[int]:
+    """Write rule data with a bumped version; None on a conflict."""
+    store = get_store()
+    if store is not None:
+        return store.save_semantic_rules(data, expected_version)
+
+    rules_path = get_sophia_dir() / "semantic_rules.json"
+
+    with file_lock(str(rules_path)):
+        # Version first: a crash before the rules write only makes
+        # concurrent updates retry
+        version = _bump_rules_version(expected_version)
+        if version is not None:
+            write_json(rules_path, data)
+
+    return version
+
+
+def get_semantic_rules_version() -> int:
+    """Current version of the semantic rule set (bumped on every save)."""
+    store = get_store()
+    if store is not None:
+        return store.get_semantic_rules_version()
+    return read_json(_rules_version_path(), {}).get("version", 0)
+
+
+def update_semantic_rules(
+    mutate: Callable[[List[SemanticRule]], Optional[List[SemanticRule]]],
+    max_retries: Optional[int] = None
+) -> List[SemanticRule]:
+    """
+    Modify the semantic rules with optimistic concurrency.
+
+    Works like update_self_model(): mutate gets the current rules and
+    changes the list in place (or returns a replacement), and runs again
+    on fresh rules if another writer saved in the meantime.
+
+    Args:
+        mutate: Function applying the change
+        max_retries: Re-runs after a version conflict (default
+            STORAGE_CONFIG["update_max_retries"])
+
+    Returns:
+        The saved rules
+
+    Raises:
+        VersionConflictError if every attempt conflicted
+    """
     rules_path = get_sophia_dir() / "semantic_rules.json"
 
-    data = [r.model_dump(mode='json') for r in rules]
-    write_json(rules_path, data, use_lock=True)
+    def load():
+        store = get_store()
+        if store is not None:
+            # Writers commit rules and version in one transaction
+            version = store.get_semantic_rules_version()
+            return _validate_rules(store.get_semantic_rules()), version
+        # Shared lock: the version and rules must come from the same save
+        with file_lock(str(rules_path), shared=True):
+            version = read_json(_rules_version_path(), {}).get("version", 0)
+            return _validate_rules(read_json(rules_path, [])), version
+
+    def commit(rules, version):
+        return _save_rules_data([r.model_dump(mode='json') for r in rules], version)
+
+    rules, _ = _run_update("semantic_rules", load, mutate, commit, max_retries)
+    return rules
 
 
 def get_user_model(user_id: str = "default") -> Optional[Dict[str, Any]]:
@@ -407,6 +1763,153 @@ def read_agent_result(task_id: str) -> Optional[Dict[str, Any]]:
     return read_json(result_path)
 
 
+def migrate_to_sqlite(switch_backend: bool = True) -> Dict[str, int]:
+    """
+    One-shot migration of an existing ~/.sophia JSON tree into SQLite.
+
+    Safe to re-run: episodes and rules are upserted by id, index entries
+    keep their recency order, and a self model already in the database is
+    not overwritten. The JSON files are left in place.
+
+    Args:
+        switch_backend: Set "storage_backend": "sqlite" in config.json
+            once the data has been copied
+
+    Returns:
+        Counts of migrated documents by kind
+    """
+    sophia_dir = get_sophia_dir()
+    episodes_dir = sophia_dir / "episodes"
+    store = SQLiteStore(sophia_dir / STORAGE_CONFIG["sqlite_db"])
+
+    counts = {"episodes": 0, "index_entries": 0, "semantic_rules": 0, "self_model": 0}
+
+    # Fold the log in first (which may archive entries): a log left
+    # behind would later be taken for hook sessions not imported yet
+    # (see import_hook_entries)
+    compact_episode_index(sophia_dir)
+
+    # Archives hold the oldest entries; index.json is newest first
+    entries = []
+    for archive_path in sorted(episodes_dir.glob("index_archive_*.json")):
+        entries.extend(read_json(archive_path, []))
+    archived = list(archive.iter_archived_entries(episodes_dir / "archive"))
+    entries.extend(reversed(archived))
+    index = read_json(episodes_dir / "index.json", {})
+    entries.extend(reversed(index.get("entries", [])))
+    if entries:
+        store.add_index_entries(entries)
+    counts["index_entries"] = len(entries)
+
+    for episode_path in sorted(episodes_dir.glob("*.json")):
+        if episode_path.name.startswith("index"):
+            continue
+        data = read_json(episode_path)
+        if isinstance(data, dict) and data.get("id"):
+            store.write_episode(data)
+            counts["episodes"] += 1
+
+    for rule in read_json(sophia_dir / "semantic_rules.json", []):
+        store.add_semantic_rule(rule)
+        counts["semantic_rules"] += 1
+
+    self_model = read_json(sophia_dir / "self_model.json")
+    if self_model is not None and store.get_document("self_model") is None:
+        store.save_document("self_model", self_model)
+        counts["self_model"] = 1
+
+    if switch_backend:
+        config = read_json(sophia_dir / "config.json", {})
+        config["storage_backend"] = "sqlite"
+        save_config(config)
+
+    return counts
+
+
+def compress_existing_data(method: Optional[str] = None) -> Dict[str, int]:
+    """
+    Rewrite existing episode files and archives with the given compression.
+
+    Files are rewritten in place (atomically) and can be read again
+    straight away, since readers detect the format. Passing "none"
+    decompresses them. Databases of the sqlite backend are not touched.
+
+    Logs in logs/ are appended to by the shell hooks and stay plain text.
+    With compression enabled each one is instead rotated: its contents
+    move to a compressed {name}.{timestamp}{ext}.gz (or .zst) file next to
+    it, and the hooks start a fresh log on their next append.
+
+    Args:
+        method: "none", "gzip" or "zstd"; saved as "compression" in
+            config.json so new files match. None uses the configured method.
+
+    Returns:
+        Counts of rewritten episodes, archives and rotated logs, plus the
+        total bytes of the affected files before and after
+    """
+    sophia_dir = get_sophia_dir()
+    episodes_dir = sophia_dir / "episodes"
+
+    if method is None:
+        method = _stored_config().get("compression", STORAGE_CONFIG["compression"])
+    else:
+        config = read_json(sophia_dir / "config.json", {})
+        config["compression"] = method
+        save_config(config)
+    target = compression.resolve_method(method)
+
+    counts = {"episodes": 0, "archives": 0, "logs": 0, "bytes_before": 0, "bytes_after": 0}
+
+    def recompress(path: Path) -> bool:
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            if compression.detect(raw) == target:
+                return False
+            payload = compression.compress(compression.decompress(raw), target)
+        except (ValueError, IOError):
+            return False  # Unreadable files are left for read_episodes to report
+        _atomic_write(path, payload)
+        counts["bytes_before"] += len(raw)
+        counts["bytes_after"] += len(payload)
+        return True
+
+    for episode_path in sorted(episodes_dir.glob("*.json")):
+        if episode_path.name.startswith("index"):
+            continue
+        if recompress(episode_path):
+            counts["episodes"] += 1
+
+    # Archive files are rewritten by compaction, which holds the index lock
+    with file_lock(str(episodes_dir / "index.json")):
+        archive_paths = sorted(episodes_dir.glob("index_archive_*.json"))
+        archive_paths += sorted((episodes_dir / "archive").glob("*.json"))
+        for archive_path in archive_paths:
+            if recompress(archive_path):
+                counts["archives"] += 1
+
+    if target is not None:
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        suffix = compression.SUFFIXES[target]
+        for log_path in sorted((sophia_dir / "logs").glob("*.jsonl")) + \
+                sorted((sophia_dir / "logs").glob("*.txt")):
+            if log_path.stat().st_size == 0:
+                continue
+            # Rename first so the hooks append to a fresh file while the
+            # old contents are compressed
+            rotated = log_path.with_name(f"{log_path.stem}.{stamp}{log_path.suffix}")
+            os.replace(log_path, rotated)
+            raw = rotated.read_bytes()
+            payload = compression.compress(raw, target)
+            _atomic_write(rotated.with_name(rotated.name + suffix), payload)
+            rotated.unlink()
+            counts["logs"] += 1
+            counts["bytes_before"] += len(raw)
+            counts["bytes_after"] += len(payload)
+
+    return counts
+
+
 def sophia_exists() -> bool:
     """Check if ~/.sophia has been initialized."""
     sophia_dir = get_sophia_dir()
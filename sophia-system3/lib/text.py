@@ -0,0 +1,50 @@
+"""
+text.py - Tokenization shared by the episode index and retrieval
+"""
+
+import re
+from typing import Any, Dict, List
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of tokens in order of appearance (duplicates kept)
+    """
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+# Fields indexed for keyword search, in posting order
+FIELDS = ("goal_summary", "keywords", "heuristics")
+
+
+def entry_field_tokens(entry: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Tokens of an index entry per searchable field.
+
+    Heuristics are only present on entries that carry their text (index
+    entries normally just have heuristics_count).
+
+    Args:
+        entry: Episode index entry
+
+    Returns:
+        Dict of field name to token list
+    """
+    tokens: Dict[str, List[str]] = {
+        "goal_summary": tokenize(entry.get("goal_summary") or ""),
+        "keywords": [],
+        "heuristics": [],
+    }
+    for keyword in entry.get("keywords") or []:
+        tokens["keywords"].extend(tokenize(str(keyword)))
+    for heuristic in entry.get("heuristics") or []:
+        tokens["heuristics"].extend(tokenize(str(heuristic)))
+    return tokens
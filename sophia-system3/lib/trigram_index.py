@@ -0,0 +1,126 @@
+"""
+trigram_index.py - Character trigram index over the keyword vocabulary
+
+Keyword search matches whole tokens, so a misspelled query token
+("kubernets", "authentification") matches nothing. TrigramIndex maps each
+character trigram to the vocabulary tokens containing it; the tokens
+similar to a query token are found by counting shared trigrams over the
+postings of the query token's own trigrams, with no edit-distance scan
+of the vocabulary.
+
+Tokens are padded ("  kubernets ") so prefixes and suffixes carry weight,
+and similarity is the Jaccard index of the two trigram sets (as in
+PostgreSQL's pg_trgm).
+
+The index holds exactly the current vocabulary: InvertedIndex adds a
+token when its first entry is indexed and discards it with its last, so
+a lookup only reads posting lists. storage keeps one index per location
+across reloads of the keyword index; sync() then only indexes the tokens
+new since the last load and drops the ones gone.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def trigrams(token: str) -> Set[str]:
+    """Character trigrams of a padded token."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Trigram -> vocabulary tokens containing it."""
+
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = {}
+        self.sizes: Dict[str, int] = {}  # token -> number of trigrams
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.sizes
+
+    def _add(self, token: str) -> None:
+        grams = trigrams(token)
+        self.sizes[token] = len(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(token)
+
+    def _discard(self, token: str) -> None:
+        if self.sizes.pop(token, None) is None:
+            return
+        for gram in trigrams(token):
+            tokens = self.postings[gram]
+            tokens.discard(token)
+            if not tokens:
+                del self.postings[gram]
+
+    def add(self, token: str) -> None:
+        """Index a token (no-op if already indexed)."""
+        with self._lock:
+            if token not in self.sizes:
+                self._add(token)
+
+    def discard(self, token: str) -> None:
+        """Drop a token from the index, if indexed."""
+        with self._lock:
+            self._discard(token)
+
+    def sync(self, vocabulary: Iterable[str]) -> int:
+        """
+        Make the indexed tokens those of a vocabulary.
+
+        Args:
+            vocabulary: Current tokens (e.g. InvertedIndex.postings)
+
+        Returns:
+            Number of tokens added
+        """
+        vocabulary = set(vocabulary)
+        with self._lock:
+            for token in self.sizes.keys() - vocabulary:
+                self._discard(token)
+            new = vocabulary.difference(self.sizes)
+            for token in new:
+                self._add(token)
+            return len(new)
+
+    def copy(self) -> 'TrigramIndex':
+        """Independent copy of the index."""
+        index = TrigramIndex()
+        with self._lock:
+            index.postings = {gram: set(tokens) for gram, tokens in self.postings.items()}
+            index.sizes = dict(self.sizes)
+        return index
+
+    def similar(self, token: str, threshold: float, limit: int) -> List[Tuple[str, float]]:
+        """
+        Indexed tokens whose trigram similarity to a token reaches a threshold.
+
+        Args:
+            token: Token to match (need not be indexed)
+            threshold: Minimum Jaccard similarity (0-1)
+            limit: Maximum number of matches
+
+        Returns:
+            List of (token, similarity) tuples, most similar first (ties
+            alphabetically); the token itself is never returned
+        """
+        grams = trigrams(token)
+        shared: Dict[str, int] = {}
+        with self._lock:
+            for gram in grams:
+                for candidate in self.postings.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            sizes = {candidate: self.sizes[candidate] for candidate in shared}
+
+        matches = []
+        for candidate, count in shared.items():
+            similarity = count / (len(grams) + sizes[candidate] - count)
+            if similarity >= threshold and candidate != token:
+                matches.append((candidate, similarity))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:limit]
@@ -0,0 +1,368 @@
+"""
+vector_store.py - Episode embeddings in a memory-mapped float32 matrix
+
+Embeddings live next to the episodes instead of inside them, in
+episodes/vectors/:
+- matrix.f32: row-major little-endian float32, one row per episode
+- ids.txt: episode id of each row, one per line, in row order
+- meta.json: {"dimension": d}
+
+Semantic search maps the matrix (numpy.memmap when numpy is installed)
+and scores every episode without opening any episode JSON. Adding an
+episode appends one row and one line; re-adding an id overwrites its row
+in place. The matrix is written before the id, so a crash in between
+leaves a trailing row without an id, which readers ignore and the next
+append overwrites.
+"""
+
+import os
+import shutil
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+from . import codec
+from .ann_index import IVFIndex
+from .config import ANN_CONFIG
+from .embeddings import row_norms, top_k_similar
+from .locking import file_lock
+
+MATRIX_FILE = "matrix.f32"
+IDS_FILE = "ids.txt"
+META_FILE = "meta.json"
+
+DTYPE = "<f4"
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+class VectorStore:
+    """Append-only embedding matrix with an id -> row map."""
+
+    def __init__(self, directory: Path):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Sidecar directory (episodes/vectors)
+        """
+        self.directory = Path(directory)
+        self.matrix_path = self.directory / MATRIX_FILE
+        self.ids_path = self.directory / IDS_FILE
+        self.meta_path = self.directory / META_FILE
+
+        self._ids: List[str] = []
+        self._rows: dict = {}
+        self._dimension: Optional[int] = None
+        self._norms: Optional[Tuple[Any, Any]] = None  # (signature, row norms)
+        self.ann = IVFIndex(self.directory)
+        self._signature: Optional[Tuple] = None
+
+    def _stat_signature(self) -> Optional[Tuple]:
+        try:
+            ids_stat = os.stat(self.ids_path)
+            matrix_stat = os.stat(self.matrix_path)
+        except OSError:
+            return None
+        # Matrix mtime too: overwriting a row keeps the size
+        return (
+            ids_stat.st_ino, ids_stat.st_mtime_ns, ids_stat.st_size,
+            matrix_stat.st_ino, matrix_stat.st_size, matrix_stat.st_mtime_ns,
+        )
+
+    def _refresh(self) -> None:
+        """Reload the id map if another process changed the store."""
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+
+        ids: List[str] = []
+        dimension = None
+        if signature is not None:
+            try:
+                dimension = codec.loads(self.meta_path.read_bytes()).get("dimension")
+                with open(self.ids_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                # A line without its newline is a torn append
+                ids = text.split("\n")[:-1]
+            except (ValueError, IOError, AttributeError):
+                ids, dimension = [], None
+
+        if dimension:
+            ids = ids[:signature[4] // (4 * dimension)]
+
+        self._ids = ids
+        self._rows = {episode_id: row for row, episode_id in enumerate(ids)}
+        self._dimension = dimension
+        self._signature = signature
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """Embedding dimension, or None while the store is empty."""
+        self._refresh()
+        return self._dimension
+
+    def ids(self) -> List[str]:
+        """Episode ids in row order."""
+        self._refresh()
+        return list(self._ids)
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._ids)
+
+    def __contains__(self, episode_id: str) -> bool:
+        self._refresh()
+        return episode_id in self._rows
+
+    def add(self, episode_id: str, vector: List[float]) -> bool:
+        """
+        Store an episode's embedding.
+
+        Args:
+            episode_id: Episode ID
+            vector: Embedding values
+
+        Returns:
+            True if stored, False if the dimension doesn't match the store
+            (e.g. after switching embedding providers)
+        """
+        if not vector or "\n" in episode_id:
+            return False
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        row_bytes = pack_vector(vector)
+
+        with file_lock(str(self.directory)):
+            self._refresh()
+            if self._dimension is None:
+                # First vector (or an unreadable store): start fresh. An IVF
+                # index left over would refer to the old rows.
+                self.ann.clear()
+                with open(self.meta_path, 'wb') as f:
+                    f.write(codec.dumps({"dimension": len(vector)}))
+                open(self.matrix_path, 'wb').close()
+                open(self.ids_path, 'wb').close()
+                self._ids, self._rows = [], {}
+                self._dimension = len(vector)
+            elif len(vector) != self._dimension:
+                return False
+
+            row = self._rows.get(episode_id)
+            with open(self.matrix_path, 'r+b') as f:
+                if row is not None:
+                    f.seek(row * len(row_bytes))
+                    f.write(row_bytes)
+                else:
+                    # Drop any row orphaned by a crash before its id was written
+                    f.truncate(len(self._ids) * len(row_bytes))
+                    f.seek(0, os.SEEK_END)
+                    f.write(row_bytes)
+
+            if row is None:
+                with open(self.ids_path, 'a', encoding='utf-8') as f:
+                    f.write(episode_id + "\n")
+
+            if self.ann.trained:
+                self.ann.assign(len(self._ids) if row is None else row, vector)
+
+            # Cached row norms are stale even if the mtime didn't tick
+            self._norms = None
+
+        return True
+
+    def get(self, episode_id: str) -> Optional[List[float]]:
+        """
+        Get an episode's embedding.
+
+        Args:
+            episode_id: Episode ID
+
+        Returns:
+            List of floats, or None if the episode has no stored vector
+        """
+        self._refresh()
+        row = self._rows.get(episode_id)
+        if row is None:
+            return None
+
+        size = 4 * self._dimension
+        try:
+            with open(self.matrix_path, 'rb') as f:
+                f.seek(row * size)
+                raw = f.read(size)
+        except IOError:
+            return None
+        if len(raw) != size:
+            return None
+        return unpack_vector(raw).tolist()
+
+    def matrix(self) -> Optional[Any]:
+        """
+        Map the matrix read-only.
+
+        Returns:
+            numpy.memmap of shape (rows, dimension), or None if the store
+            is empty or numpy isn't installed
+        """
+        np = _numpy()
+        self._refresh()
+        if np is None or not self._ids:
+            return None
+        return np.memmap(
+            self.matrix_path, dtype=DTYPE, mode='r',
+            shape=(len(self._ids), self._dimension)
+        )
+
+    def search(
+        self,
+        query: List[float],
+        k: int = 10,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        only: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the stored embeddings most similar to a query vector.
+
+        Uses the IVF index (ann_index.py) once it's trained and the store
+        holds at least ANN_CONFIG["min_vectors"] rows; otherwise scores
+        every row.
+
+        Args:
+            query: Query embedding
+            k: Maximum number of results
+            nprobe: IVF clusters to scan (default ANN_CONFIG["nprobe"]);
+                higher is slower but closer to exact
+            exact: Score every row even if the IVF index is available
+            only: Score just these episodes (exactly), e.g. the ones
+                passing a filter
+
+        Returns:
+            List of (episode_id, cosine_similarity) tuples, most similar first
+        """
+        self._refresh()
+        if not self._ids or len(query) != self._dimension or k <= 0:
+            return []
+
+        np = _numpy()
+        if only is not None:
+            rows = sorted({self._rows[i] for i in only if i in self._rows})
+            ids = [self._ids[row] for row in rows]
+            if np is None:
+                return top_k_similar(query, (self.get(i) for i in ids), ids, k)
+            return top_k_similar(query, self.matrix()[rows], ids, k, norms=self._row_norms()[rows])
+
+        if np is None:
+            return self._search_python(query, k)
+
+        if not exact and len(self._ids) >= ANN_CONFIG["min_vectors"]:
+            hits = self.ann.search(
+                query, self.matrix(), self._ids, self._row_norms(), k,
+                nprobe=nprobe, key=self._signature
+            )
+            if hits is not None:
+                return hits
+
+        return top_k_similar(query, self.matrix(), self._ids, k, norms=self._row_norms())
+
+    def train_ann(self, nlist: Optional[int] = None) -> int:
+        """
+        Train (or retrain) the IVF index on the stored vectors.
+
+        Args:
+            nlist: Number of clusters (default: about 4 * sqrt(rows))
+
+        Returns:
+            Number of clusters, 0 if the store is empty or numpy is missing
+        """
+        if _numpy() is None:
+            return 0
+
+        with file_lock(str(self.directory)):
+            self._refresh()
+            if not self._ids:
+                return 0
+            return self.ann.train(self.matrix(), nlist)
+
+    def _row_norms(self) -> Any:
+        """Row norms for the current matrix, computed once per change."""
+        if self._norms is None or self._norms[0] != self._signature:
+            self._norms = (self._signature, row_norms(self.matrix()))
+        return self._norms[1]
+
+    def _search_python(self, query: List[float], k: int) -> List[Tuple[str, float]]:
+        values = unpack_vector(self.matrix_path.read_bytes())
+        d = self._dimension
+        rows = (values[row * d:(row + 1) * d] for row in range(len(self._ids)))
+        return top_k_similar(query, rows, self._ids, k)
+
+    def rebuild(self, vectors: Iterable[Tuple[str, List[float]]]) -> int:
+        """
+        Replace the store with the given embeddings.
+
+        The new store is written to a sibling directory and swapped in, so
+        readers never see a half-written matrix. Vectors whose dimension
+        differs from the first one are skipped.
+
+        Args:
+            vectors: (episode_id, embedding) pairs; later duplicates win
+
+        Returns:
+            Number of vectors stored
+        """
+        latest = {}
+        for episode_id, vector in vectors:
+            if vector and "\n" not in episode_id:
+                latest[episode_id] = vector
+
+        dimension = len(next(iter(latest.values()))) if latest else None
+        rows = [(i, v) for i, v in latest.items() if len(v) == dimension]
+
+        staging = self.directory.with_name(self.directory.name + ".new")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+
+        with open(staging / MATRIX_FILE, 'wb') as f:
+            for _, vector in rows:
+                f.write(pack_vector(vector))
+        with open(staging / IDS_FILE, 'w', encoding='utf-8') as f:
+            f.writelines(episode_id + "\n" for episode_id, _ in rows)
+        with open(staging / META_FILE, 'wb') as f:
+            f.write(codec.dumps({"dimension": dimension}))
+
+        self.directory.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(str(self.directory)):
+            old = self.directory.with_name(self.directory.name + ".old")
+            shutil.rmtree(old, ignore_errors=True)
+            if self.directory.exists():
+                os.rename(self.directory, old)
+            os.rename(staging, self.directory)
+            shutil.rmtree(old, ignore_errors=True)
+
+        self._signature = None
+        return len(rows)
+
+
+def pack_vector(vector: List[float]) -> bytes:
+    """Encode a vector as little-endian float32, the layout of matrix.f32."""
+    values = array('f', vector)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack_vector(raw: bytes) -> array:
+    """Decode little-endian float32 bytes written by pack_vector."""
+    values = array('f')
+    values.frombytes(raw)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
@@ -5,11 +5,22 @@ These tests verify the hook scripts execute correctly.
 Note: Full integration testing requires Claude Code environment.
 """
 
+import json
 import pytest
+import shutil
 import subprocess
 import tempfile
+import time
 import os
 from pathlib import Path
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import storage
+from lib.locking import FileLock
+from lib.sqlite_store import SQLiteStore
 
 
 HOOKS_DIR = Path(__file__).parent.parent / "hooks"
@@ -147,6 +158,189 @@ class TestSessionEnd:
             # Should exit successfully (nothing to do)
             assert result.returncode == 0
 
+    def test_appends_index_entry_under_lock(self, hook_script):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            episodes_dir = Path(tmpdir) / ".sophia" / "episodes"
+            episodes_dir.mkdir(parents=True)
+            session_id = f"lock_test_{os.getpid()}"
+            buffer_file = Path(f"/tmp/sophia_session_{session_id}.jsonl")
+            buffer_file.write_text('{"tool": "Bash"}\n{"tool": "Read"}\n')
+
+            # The hook must wait for a library writer holding the index lock
+            lock = FileLock(str(episodes_dir / "index.json"))
+            lock.acquire()
+            try:
+                proc = subprocess.Popen(
+                    ["bash", str(hook_script)],
+                    env={**os.environ, "HOME": tmpdir, "CLAUDE_SESSION_ID": session_id},
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+                time.sleep(0.5)
+                assert not (episodes_dir / "index.log.jsonl").exists()
+            finally:
+                lock.release()
+                buffer_file.unlink(missing_ok=True)
+
+            assert proc.wait(timeout=10) == 0
+            lines = (episodes_dir / "index.log.jsonl").read_text().splitlines()
+            assert len(lines) == 1 and '"tool_call_count":2' in lines[0]
+
+            # Filter fields for the secondary indexes
+            entry = json.loads(lines[0])
+            assert entry["session_id"] == session_id
+            assert entry["tools"] == ["Bash", "Read"]
+
+
+    def test_hook_log_folded_by_readers(self, hook_script):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sophia_dir = Path(tmpdir) / ".sophia"
+            episodes_dir = sophia_dir / "episodes"
+            episodes_dir.mkdir(parents=True)
+            for i in range(3):
+                self._end_session(hook_script, tmpdir, f"fold_test_{os.getpid()}_{i}")
+            log_path = episodes_dir / "index.log.jsonl"
+            assert len(log_path.read_text().splitlines()) == 3
+
+            # Past the threshold, a read folds the log into index.json
+            with patch('lib.storage.get_sophia_dir', return_value=sophia_dir), \
+                    patch.dict('lib.storage.STORAGE_CONFIG', {"index_log_compact_bytes": 1}):
+                assert len(storage.get_episode_index()["entries"]) == 3
+                storage._compaction_thread.join()
+
+                assert log_path.stat().st_size == 0
+                index = json.loads((episodes_dir / "index.json").read_text())
+                assert [e["session_id"] for e in index["entries"]] == \
+                    [f"fold_test_{os.getpid()}_{i}" for i in (2, 1, 0)]
+                assert not storage.compact_oversized_log()
+
+    def test_hook_entries_capped_and_archived(self, hook_script):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            episodes_dir = Path(tmpdir) / ".sophia" / "episodes"
+            episodes_dir.mkdir(parents=True)
+            session_ids = [f"cap_test_{os.getpid()}_{i}" for i in range(3)]
+            for session_id in session_ids:
+                self._end_session(hook_script, tmpdir, session_id)
+
+            with patch('lib.storage.get_sophia_dir', return_value=episodes_dir.parent), \
+                    patch.dict('lib.storage.STORAGE_CONFIG', {"index_log_compact_bytes": 1}), \
+                    patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 2}):
+                storage.get_episode_index()
+                storage._compaction_thread.join()
+
+                # Oldest session moved to the archive, newest two stay live
+                entries = storage.get_episode_index()["entries"]
+                assert [e["session_id"] for e in entries] == session_ids[:0:-1]
+                archived = list(storage.iter_archived_entries())
+                assert [e["session_id"] for e in archived] == session_ids[:1]
+
+    def _end_session(self, hook_script, home, session_id):
+        buffer_file = Path(f"/tmp/sophia_session_{session_id}.jsonl")
+        buffer_file.write_text('{"tool": "Bash"}\n{"tool": "Read"}\n')
+        try:
+            subprocess.run(
+                ["bash", str(hook_script)], capture_output=True, check=True,
+                env={**os.environ, "HOME": str(home), "CLAUDE_SESSION_ID": session_id}
+            )
+        finally:
+            buffer_file.unlink(missing_ok=True)
+
+    def _end_sqlite_session(self, hook_script, sophia_dir, session_id):
+        (sophia_dir / "episodes").mkdir(parents=True, exist_ok=True)
+        (sophia_dir / "config.json").write_text('{"storage_backend": "sqlite"}')
+        buffer_file = Path(f"/tmp/sophia_session_{session_id}.jsonl")
+        buffer_file.write_text('{"tool": "Bash"}\n{"tool": "Read"}\n')
+        try:
+            result = subprocess.run(
+                ["bash", str(hook_script)],
+                capture_output=True,
+                env={**os.environ, "HOME": str(sophia_dir.parent), "CLAUDE_SESSION_ID": session_id}
+            )
+        finally:
+            buffer_file.unlink(missing_ok=True)
+        assert result.returncode == 0
+
+    def test_sqlite_backend_writes_database(self, hook_script):
+        if not shutil.which("sqlite3") or not shutil.which("jq"):
+            pytest.skip("sqlite3 CLI or jq not installed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sophia_dir = Path(tmpdir) / ".sophia"
+            store = SQLiteStore(sophia_dir / "sophia.db")
+            store.save_document("self_model", {"total_sessions": 3, "total_episodes": 3, "version": 1})
+            session_id = f"sqlite_test_{os.getpid()}"
+            self._end_sqlite_session(hook_script, sophia_dir, session_id)
+
+            # Nothing left for the library to import
+            assert not (sophia_dir / "episodes" / "index.log.jsonl").exists()
+            assert not list((sophia_dir / "episodes").glob("ep_*.json"))
+
+            with patch('lib.storage.get_sophia_dir', return_value=sophia_dir):
+                entries = storage.get_episode_index()["entries"]
+                model = storage.get_self_model()
+            assert [e["session_id"] for e in entries] == [session_id]
+            assert store.read_episode(entries[0]["id"]) is not None
+            assert model.total_sessions == 4
+            assert model.total_episodes == 4
+            assert model.last_session is not None
+
+    def test_sqlite_fallback_imported_by_library(self, hook_script):
+        if not shutil.which("jq"):
+            pytest.skip("jq not installed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # No sophia.db yet: the hook writes the JSON fallback files
+            sophia_dir = Path(tmpdir) / ".sophia"
+            session_id = f"fallback_test_{os.getpid()}"
+            self._end_sqlite_session(hook_script, sophia_dir, session_id)
+            assert (sophia_dir / "episodes" / "index.log.jsonl").exists()
+
+            with patch('lib.storage.get_sophia_dir', return_value=sophia_dir):
+                model = storage.get_self_model()
+                entries = storage.get_episode_index()["entries"]
+                store = storage.get_store()
+                assert [e["session_id"] for e in entries] == [session_id]
+                assert store.read_episode(entries[0]["id"]) is not None
+                assert model.total_sessions == 1
+                assert model.total_episodes == 1
+
+                # Imported once: later reads don't count the session again
+                assert storage.get_self_model().total_sessions == 1
+            assert (sophia_dir / "episodes" / "index.log.jsonl").stat().st_size == 0
+            assert not list((sophia_dir / "episodes").glob("ep_*.json"))
+
+    def test_sqlite_quotes_in_session_id(self, hook_script):
+        if not shutil.which("sqlite3") or not shutil.which("jq"):
+            pytest.skip("sqlite3 CLI or jq not installed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sophia_dir = Path(tmpdir) / ".sophia"
+            SQLiteStore(sophia_dir / "sophia.db").save_document("self_model", {"version": 1})
+            session_id = f"o'brien_{os.getpid()}"
+            self._end_sqlite_session(hook_script, sophia_dir, session_id)
+
+            # Inserted directly, not through the fallback files
+            assert not (sophia_dir / "episodes" / "index.log.jsonl").exists()
+            with patch('lib.storage.get_sophia_dir', return_value=sophia_dir):
+                entries = storage.get_episode_index()["entries"]
+            assert [e["session_id"] for e in entries] == [session_id]
+
+    def test_sqlite_fallback_keeps_unreadable_episode(self, hook_script):
+        if not shutil.which("jq"):
+            pytest.skip("jq not installed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sophia_dir = Path(tmpdir) / ".sophia"
+            session_id = f"corrupt_test_{os.getpid()}"
+            self._end_sqlite_session(hook_script, sophia_dir, session_id)
+            episode_file, = (sophia_dir / "episodes").glob("ep_*.json")
+            episode_file.write_text('{"id": "ep_')
+
+            with patch('lib.storage.get_sophia_dir', return_value=sophia_dir):
+                entries = storage.get_episode_index()["entries"]
+                assert storage.get_store().read_episode(entries[0]["id"]) is None
+            assert [e["session_id"] for e in entries] == [session_id]
+            assert episode_file.exists()
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,203 @@
+"""
+test_locking.py - Tests for cross-process file locks
+"""
+
+import json
+import os
+import pytest
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import lock_metrics
+from lib.locking import FileLock, LockAcquisitionError, file_lock, fcntl
+
+needs_fcntl = pytest.mark.skipif(fcntl is None, reason="flock requires fcntl")
+
+
+@pytest.fixture
+def target(tmp_path):
+    return str(tmp_path / "data.json")
+
+
+@needs_fcntl
+class TestFlockLock:
+    def test_shared_locks_coexist(self, target):
+        with file_lock(target, shared=True) as first:
+            with file_lock(target, shared=True, timeout=0.2) as second:
+                assert first.uses_flock and second.uses_flock
+
+    def test_exclusive_excludes_readers_and_writers(self, target):
+        with file_lock(target):
+            with pytest.raises(LockAcquisitionError):
+                FileLock(target, timeout=0.2, shared=True).acquire()
+            with pytest.raises(LockAcquisitionError):
+                FileLock(target, timeout=0.2).acquire()
+
+        # A timed-out waiter must not keep the lock once it frees up
+        time.sleep(0.05)
+        with file_lock(target, timeout=0.2):
+            pass
+
+    def test_waiter_wakes_on_release(self, target):
+        holder = FileLock(target)
+        holder.acquire()
+        released_at = []
+
+        def release_later():
+            time.sleep(0.2)
+            released_at.append(time.monotonic())
+            holder.release()
+
+        threading.Thread(target=release_later).start()
+        with file_lock(target, timeout=2):
+            acquired_at = time.monotonic()
+
+        # No polling interval between release and acquire
+        assert acquired_at - released_at[0] < 0.05
+
+    def test_lock_file_survives_release(self, target):
+        with file_lock(target):
+            pass
+        assert Path(target + ".lock").is_file()
+
+
+class TestDirectoryLock:
+    def test_fallback_without_fcntl(self, target):
+        with patch('lib.locking.fcntl', None):
+            with file_lock(target, shared=True) as lock:
+                assert not lock.uses_flock
+                assert Path(target + ".lock").is_dir()
+            assert not Path(target + ".lock").exists()
+
+    def test_old_style_lock_directory_is_honoured(self, target):
+        lock_dir = Path(target + ".lock")
+        lock_dir.mkdir()
+        lock = FileLock(target, timeout=0.2, poll_interval=0.05)
+        assert not lock.uses_flock
+
+        # Left behind by a crashed process: broken once stale
+        os.utime(lock_dir, (time.time() - 60, time.time() - 60))
+        with lock:
+            assert lock_dir.is_dir()
+        assert not lock_dir.exists()
+
+
+def write_owner(lock_dir: Path, **owner):
+    lock_dir.mkdir()
+    owner = {"pid": os.getpid(), "host": socket.gethostname(), "token": "t",
+             "heartbeat": time.time(), **owner}
+    (lock_dir / "owner.json").write_text(json.dumps(owner))
+
+
+@pytest.fixture
+def dir_backend(monkeypatch):
+    monkeypatch.setenv("SOPHIA_LOCK_BACKEND", "dir")
+
+
+class TestOwnerAwareStaleness:
+    def test_dead_owner_is_broken_without_waiting(self, target, dir_backend):
+        proc = subprocess.Popen(["true"])
+        proc.wait()
+        write_owner(Path(target + ".lock"), pid=proc.pid)
+
+        start = time.monotonic()
+        with file_lock(target, timeout=5):
+            assert time.monotonic() - start < 0.5
+
+    def test_live_owner_keeps_old_lock(self, target, dir_backend):
+        lock_dir = Path(target + ".lock")
+        write_owner(lock_dir)
+        # Far older than the timeout, but the heartbeat is fresh
+        os.utime(lock_dir, (time.time() - 600, time.time() - 600))
+        with pytest.raises(LockAcquisitionError):
+            FileLock(target, timeout=0.3, poll_interval=0.05).acquire()
+
+    def test_missing_heartbeat_breaks_remote_owner(self, target, dir_backend):
+        write_owner(Path(target + ".lock"), host="other-host", heartbeat=time.time() - 600)
+        with file_lock(target, timeout=1):
+            pass
+
+    def test_holder_heartbeats(self, target, dir_backend):
+        with patch.dict('lib.locking.LOCK_CONFIG', {"heartbeat_interval": 0.05}):
+            with file_lock(target) as lock:
+                owner_path = Path(target + ".lock") / "owner.json"
+                first = json.loads(owner_path.read_text())["heartbeat"]
+                time.sleep(0.3)
+                owner = json.loads(owner_path.read_text())
+                assert owner["heartbeat"] > first
+                assert owner["pid"] == os.getpid()
+                assert not lock.uses_flock
+
+    def test_release_leaves_a_lock_taken_over(self, target, dir_backend):
+        lock = FileLock(target)
+        lock.acquire()
+        owner_path = Path(target + ".lock") / "owner.json"
+        owner = json.loads(owner_path.read_text())
+        owner_path.write_text(json.dumps({**owner, "token": "someone-else"}))
+
+        lock.release()
+        assert Path(target + ".lock").is_dir()
+
+
+class TestLockMetrics:
+    @pytest.fixture
+    def sophia(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            yield tmp_path
+
+    def test_records_wait_hold_and_timeouts(self, sophia):
+        (sophia / "episodes").mkdir()
+        target = str(sophia / "episodes" / "index.json")
+        with file_lock(target):
+            time.sleep(0.05)
+            with pytest.raises(LockAcquisitionError):
+                FileLock(target, timeout=0.1).acquire()
+
+        summary = lock_metrics.summarize()
+        stats = summary["locks"]["episodes/index.json"]
+        assert stats["acquisitions"] == 1
+        assert stats["timeouts"] == 1
+        assert stats["hold"]["p50"] >= 0.05
+        assert stats["total_wait"] >= 0.1
+        assert summary["worst"][0]["lock"] == "episodes/index.json"
+        assert (sophia / "logs" / "lock_metrics.jsonl").exists()
+
+    def test_stale_break_is_recorded(self, sophia, dir_backend):
+        target = str(sophia / "config.json")
+        write_owner(Path(target + ".lock"), host="other-host", heartbeat=time.time() - 600)
+        with file_lock(target, timeout=1):
+            pass
+        assert lock_metrics.summarize()["locks"]["config.json"]["stale_breaks"] == 1
+
+    def test_percentiles_and_worst_offenders(self, sophia):
+        for i in range(100):
+            lock_metrics.record(sophia / "a.json", "acquire", wait=i / 1000, hold=0.001)
+        lock_metrics.record(sophia / "b.json", "acquire", wait=1.0, hold=0.001)
+        lock_metrics.record(sophia / "c.json", "acquire", wait=0.0, hold=0.001)
+
+        summary = lock_metrics.summarize(top=2)
+        wait = summary["locks"]["a.json"]["wait"]
+        assert (wait["p50"], wait["p95"], wait["p99"]) == (0.049, 0.094, 0.098)
+        assert [w["lock"] for w in summary["worst"]] == ["a.json", "b.json"]
+        assert "a.json" in lock_metrics.format_summary(summary)
+
+    def test_rolls_over_and_ignores_outside_locks(self, sophia, tmp_path_factory):
+        with file_lock(str(tmp_path_factory.mktemp("other") / "data.json")):
+            pass
+        with patch.dict('lib.locking.LOCK_CONFIG', {"metrics_max_bytes": 1}):
+            lock_metrics.record(sophia / "a.json", "acquire", wait=0.0, hold=0.0)
+            lock_metrics.flush()
+            lock_metrics.record(sophia / "a.json", "acquire", wait=0.0, hold=0.0)
+            lock_metrics.flush()
+
+        assert (sophia / "logs" / "lock_metrics.1.jsonl").exists()
+        summary = lock_metrics.summarize()
+        assert list(summary["locks"]) == ["a.json"]
+        assert summary["locks"]["a.json"]["acquisitions"] == 2
@@ -0,0 +1,904 @@
+"""
+test_retrieval.py - Tests for episode search and ranking
+"""
+
+from array import array
+import json
+import pytest
+import random
+import sqlite3
+import subprocess
+import textwrap
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import storage
+from lib.storage import (
+    backfill_index_fields, ensure_sophia_dir, update_episode_index,
+    compact_episode_index, write_episode
+)
+from lib.retrieval import (
+    bm25_search, compute_retrieval_score, default_search_mode, filter_episodes, hybrid_search,
+    keyword_search, ranked_keyword_search, reciprocal_rank_fusion,
+    score_candidates, search_episodes, semantic_search
+)
+from lib import index_log, score_columns
+from lib.score_columns import ScoreColumns
+from lib import query_cache
+from lib.query_cache import cache_stats, clear_query_cache
+from lib.embeddings import (
+    EmbeddingManager, EmbeddingProvider, cosine_similarity, normalize_rows, top_k_similar
+)
+from lib.embedding_cache import EmbeddingCache, embedding_cache_stats
+from lib.inverted_index import InvertedIndex
+from lib.trigram_index import TrigramIndex
+from lib.models import Episode
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@pytest.fixture
+def sophia_dir(tmp_path):
+    with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+        ensure_sophia_dir()
+        yield tmp_path
+
+
+class TestKeywordSearch:
+    def test_matches_summary_and_keywords(self, sophia_dir):
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy docker app"})
+        update_episode_index({"id": "ep_2", "goal_summary": "Fix tests", "keywords": ["pytest"]})
+
+        results = keyword_search("docker deploy")
+        assert [e["id"] for e, _ in results] == ["ep_1"]
+        assert results[0][1] == 1.0
+
+    def test_matches_whole_tokens(self, sophia_dir):
+        update_episode_index({"id": "ep_1", "goal_summary": "Update the product catalog"})
+        update_episode_index({"id": "ep_2", "goal_summary": "Rotate the nginx log"})
+
+        assert [e["id"] for e, _ in keyword_search("log")] == ["ep_2"]
+
+    def test_ties_keep_index_order(self, sophia_dir):
+        for i in range(3):
+            update_episode_index({"id": f"ep_{i}", "goal_summary": "Fix flaky tests"})
+        update_episode_index({"id": "ep_best", "goal_summary": "Fix flaky tests in CI"})
+
+        results = keyword_search("flaky ci")
+        assert [e["id"] for e, _ in results] == ["ep_best", "ep_2", "ep_1", "ep_0"]
+
+    def test_archive_searched_on_request(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 1}):
+            update_episode_index({"id": "ep_old", "goal_summary": "Configure nginx"})
+            update_episode_index({"id": "ep_new", "goal_summary": "Write docs"})
+            compact_episode_index()
+
+            assert keyword_search("nginx") == []
+            results = keyword_search("nginx", include_archive=True)
+            assert [e["id"] for e, _ in results] == ["ep_old"]
+
+    def test_archive_skips_segments_that_cannot_match(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 1}):
+            for i, summary in enumerate(["Configure nginx", "Tune postgres", "Write docs"]):
+                update_episode_index({"id": f"ep_{i}", "goal_summary": summary})
+            compact_episode_index()
+
+            read_files = []
+            original = storage.read_json
+
+            def tracking_read(path, default=None):
+                read_files.append(Path(path).name)
+                return original(path, default)
+
+            with patch('lib.storage.read_json', side_effect=tracking_read):
+                keyword_search("nginx", include_archive=True)
+
+            assert "seg_000001.json" in read_files
+            assert "seg_000002.json" not in read_files
+
+
+class TestKeywordIndex:
+    def test_appends_and_compaction_persist_postings(self, sophia_dir):
+        episodes_dir = sophia_dir / "episodes"
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy docker app"})
+        compact_episode_index()
+        update_episode_index({"id": "ep_2", "goal_summary": "Docker cleanup",
+                              "heuristics": ["Prune dangling images weekly"]})
+
+        terms = storage.read_json(episodes_dir / storage.TERMS_FILE)
+        assert terms["postings"]["docker"] == {"ep_1": [1, 0, 0], "ep_2": [1, 0, 0]}
+        assert terms["postings"]["prune"] == {"ep_2": [0, 0, 1]}
+        assert terms["log_offset"] == (episodes_dir / "index.log.jsonl").stat().st_size
+        assert terms["generation"] == storage.read_json(
+            episodes_dir / "index.json")["last_updated"]
+
+        # Appended without the library, as the session_end hook does
+        index_log.append_entry(episodes_dir / "index.log.jsonl",
+                               {"id": "ep_3", "goal_summary": "Docker compose"})
+        assert [e["id"] for e, _ in keyword_search("docker")] == ["ep_3", "ep_2", "ep_1"]
+        assert [e["id"] for e, _ in keyword_search("prune")] == ["ep_2"]
+
+        # The next append picks up the hook's entry too
+        update_episode_index({"id": "ep_4", "goal_summary": "Write docs"})
+        terms = storage.read_json(episodes_dir / storage.TERMS_FILE)
+        assert set(terms["postings"]["docker"]) == {"ep_1", "ep_2", "ep_3"}
+
+        compact_episode_index()
+        terms = storage.read_json(episodes_dir / storage.TERMS_FILE)
+        assert set(terms["postings"]["docker"]) == {"ep_1", "ep_2", "ep_3"}
+        assert terms["log_offset"] == 0
+
+    def test_replaced_and_capped_entries_leave_postings(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 2}):
+            update_episode_index({"id": "ep_1", "goal_summary": "Configure nginx"})
+            update_episode_index({"id": "ep_1", "goal_summary": "Configure caddy"})
+            update_episode_index({"id": "ep_2", "goal_summary": "Tune postgres"})
+            update_episode_index({"id": "ep_3", "goal_summary": "Write docs"})
+            compact_episode_index()
+
+        terms = storage.get_keyword_index().terms
+        assert terms.lookup("nginx") == {} and terms.lookup("caddy") == {}
+        assert set(terms.lengths) == {"ep_2", "ep_3"}
+
+    def test_remove_matches_rebuild(self):
+        entries = [
+            {"id": "ep_1", "goal_summary": "Configure nginx proxy"},
+            {"id": "ep_2", "goal_summary": "Tune nginx", "keywords": ["postgres"]},
+            {"id": "ep_3", "goal_summary": "Write docs"},
+        ]
+        built = InvertedIndex.build(entries)
+        loaded = InvertedIndex.from_dict(json.loads(json.dumps(built.to_dict())))
+        expected = InvertedIndex.build(entries[1:] + [{"id": "ep_2", "goal_summary": "Tune caddy"}])
+        for terms in (built, loaded):
+            assert terms.remove("ep_1") and not terms.remove("ep_1")
+            terms.add({"id": "ep_2", "goal_summary": "Tune caddy"})
+            assert terms.postings == expected.postings
+            assert terms.lengths == expected.lengths
+
+    def test_stale_postings_are_rebuilt(self, sophia_dir):
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy docker app"})
+        compact_episode_index()
+
+        # index.json edited without going through compaction
+        index_path = sophia_dir / "episodes" / "index.json"
+        index = storage.read_json(index_path)
+        index["entries"][0]["goal_summary"] = "Deploy podman app"
+        index["last_updated"] = "edited"
+        storage.write_json(index_path, index)
+
+        assert keyword_search("docker") == []
+        assert [e["id"] for e, _ in keyword_search("podman")] == ["ep_1"]
+        assert storage.rebuild_keyword_index() == 1
+        terms = storage.read_json(sophia_dir / "episodes" / storage.TERMS_FILE)
+        assert terms["generation"] == "edited"
+
+    def test_sqlite_backend(self, sophia_dir):
+        storage.save_config({"storage_backend": "sqlite"})
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy docker app"})
+        assert [e["id"] for e, _ in keyword_search("docker")] == ["ep_1"]
+        update_episode_index({"id": "ep_2", "goal_summary": "Docker cleanup"})
+        assert len(keyword_search("docker")) == 2
+
+    def test_sqlite_postings_table(self, sophia_dir):
+        storage.save_config({"storage_backend": "sqlite"})
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy docker app"})
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy podman app"})
+        store = storage.get_store()
+        assert set(store.get_index_terms()["postings"]) == {"deploy", "podman", "app"}
+
+        # Inserted without postings, as the session_end hook does
+        with store.connect() as conn:
+            conn.execute(
+                "INSERT INTO episode_index (id, timestamp, data) VALUES (?, ?, ?)",
+                ("ep_2", "", json.dumps({"id": "ep_2", "goal_summary": "Podman cleanup"}))
+            )
+        with patch('lib.storage.InvertedIndex.build', side_effect=AssertionError):
+            assert [e["id"] for e, _ in keyword_search("podman")] == ["ep_2", "ep_1"]
+        assert store.get_index_terms()["postings"]["podman"] == {
+            "ep_1": [1, 0, 0], "ep_2": [1, 0, 0]
+        }
+
+
+class TestBM25Search:
+    def test_rare_tokens_outrank_common_ones(self, sophia_dir):
+        for i in range(5):
+            update_episode_index({"id": f"ep_{i}", "goal_summary": f"Fix python tests {i}"})
+        update_episode_index({"id": "ep_rare", "goal_summary": "Fix segfault"})
+        update_episode_index({"id": "ep_common", "goal_summary": "Python tests again"})
+
+        # Both match one query token; keyword_search ties them
+        results = bm25_search("python segfault")
+        assert results[0][0]["id"] == "ep_rare"
+        assert 0 < results[-1][1] < results[0][1] < 1
+
+    def test_goal_summary_outweighs_keywords(self, sophia_dir):
+        update_episode_index({"id": "ep_kw", "goal_summary": "Setup", "keywords": ["redis"]})
+        update_episode_index({"id": "ep_goal", "goal_summary": "Redis", "keywords": ["setup"]})
+
+        assert [e["id"] for e, _ in bm25_search("redis")] == ["ep_goal", "ep_kw"]
+
+    def test_corpus_statistics_follow_updates(self, sophia_dir):
+        update_episode_index({"id": "ep_1", "goal_summary": "One two three four"})
+        update_episode_index({"id": "ep_2", "goal_summary": "One two"})
+        compact_episode_index()
+        update_episode_index({"id": "ep_1", "goal_summary": "One"})
+
+        terms = storage.get_keyword_index().terms
+        assert len(terms) == 2
+        assert terms.document_frequency("two") == 1
+        assert terms.average_lengths()[0] == 1.5
+
+    def test_search_episodes_applies_boosts(self, sophia_dir):
+        update_episode_index({"id": "ep_ok", "goal_summary": "Configure nginx",
+                              "outcome": "SUCCESS", "heuristics_count": 2})
+        update_episode_index({"id": "ep_fail", "goal_summary": "Configure nginx",
+                              "outcome": "FAILURE"})
+        update_episode_index({"id": "ep_other", "goal_summary": "Write docs"})
+
+        # Equal BM25 scores (newest first) until the boosts are applied
+        assert [e["id"] for e, _ in bm25_search("nginx")] == ["ep_fail", "ep_ok"]
+        results = search_episodes("nginx", k=2)
+        assert [r["episode_id"] for r in results] == ["ep_ok", "ep_fail"]
+        assert results[0]["relevance_score"] > results[1]["relevance_score"]
+
+    def test_archive_entries_are_scored(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 1}):
+            update_episode_index({"id": "ep_old", "goal_summary": "Configure nginx"})
+            update_episode_index({"id": "ep_new", "goal_summary": "Nginx docs"})
+            compact_episode_index()
+
+            results = bm25_search("configure nginx", include_archive=True)
+            assert [e["id"] for e, _ in results] == ["ep_old", "ep_new"]
+
+
+def tracking_reads():
+    """Patch storage.read_json to record the names of files read."""
+    read_files = []
+    original = storage.read_json
+
+    def tracking_read(path, default=None):
+        read_files.append(Path(path).name)
+        return original(path, default)
+
+    return read_files, patch('lib.storage.read_json', side_effect=tracking_read)
+
+
+class TestStreamingSearch:
+    def test_ranks_every_match_with_boosts(self, sophia_dir):
+        update_episode_index({"id": "ep_boosted", "goal_summary": "Configure nginx proxy cache",
+                              "outcome": "SUCCESS", "heuristics_count": 3})
+        for i in range(5):
+            update_episode_index({"id": f"ep_{i}", "goal_summary": "Configure nginx"})
+
+        # Outside the top 2k by BM25, first by retrieval score
+        assert "ep_boosted" not in [e["id"] for e, _ in bm25_search("configure nginx", k=2)]
+        results = ranked_keyword_search("configure nginx", k=1)
+        assert [e["id"] for e, _ in results] == ["ep_boosted"]
+
+        expected = max(compute_retrieval_score(e, s) for e, s in bm25_search("configure nginx"))
+        assert results[0][1] == expected
+        assert search_episodes("configure nginx", k=1, mode="keyword")[0]["episode_id"] == "ep_boosted"
+
+    def test_segments_that_cannot_beat_top_k_are_not_read(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 1}):
+            update_episode_index({"id": "ep_weak", "goal_summary": "Nginx notes"})
+            update_episode_index({"id": "ep_boostable", "goal_summary": "Nginx tips",
+                                  "outcome": "SUCCESS", "heuristics_count": 3})
+            update_episode_index({"id": "ep_strong", "goal_summary": "Configure nginx"})
+            update_episode_index({"id": "ep_live", "goal_summary": "Write docs"})
+            compact_episode_index()
+
+            read_files, tracking = tracking_reads()
+            with tracking:
+                results = ranked_keyword_search("configure nginx", k=1, include_archive=True)
+
+        # Matching only "nginx" still wins with the boosts...
+        assert [e["id"] for e, _ in results] == ["ep_boostable"]
+        assert "seg_000002.json" in read_files
+        # ...but not without them
+        assert "seg_000001.json" not in read_files
+
+    def test_archive_ties_and_duplicates(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 2}):
+            for i in range(5):
+                update_episode_index({"id": f"ep_{i}", "goal_summary": "Configure nginx"})
+            compact_episode_index()
+
+        # ep_4 is live; archive order is newest first
+        results = keyword_search("nginx", k=10, include_archive=True)
+        assert [e["id"] for e, _ in results] == ["ep_4", "ep_3", "ep_2", "ep_1", "ep_0"]
+
+        # A copy left in open.json by an interrupted seal appears once
+        archive_dir = sophia_dir / "episodes" / "archive"
+        storage.write_json(archive_dir / "open.json", [{"id": "ep_2", "goal_summary": "Configure nginx"}])
+        results = keyword_search("nginx", k=10, include_archive=True)
+        assert [e["id"] for e, _ in results] == ["ep_4", "ep_2", "ep_3", "ep_1", "ep_0"]
+
+
+class TestSemanticSearch:
+    def test_scores_sidecar_vectors(self, sophia_dir):
+        for episode_id, vector in [("ep_1", [1.0, 0.0]), ("ep_2", [0.0, 1.0])]:
+            write_episode(Episode(
+                id=episode_id, session_id="s", started_at="2024-01-01T00:00:00",
+                ended_at="2024-01-01T00:10:00", end_trigger="stop_hook", embedding=vector
+            ))
+        update_episode_index({"id": "ep_2", "goal_summary": "Fix tests"})
+
+        results = semantic_search("tests", k=1, query_embedding=[0.1, 0.9])
+        assert results[0][0] == {"id": "ep_2", "goal_summary": "Fix tests"}
+        assert results[0][1] > 0.9
+
+    def test_no_provider(self, sophia_dir):
+        with patch('lib.retrieval.embed_text', return_value=None):
+            assert semantic_search("anything") == []
+
+
+def add_episode(episode_id, summary, embedding=None):
+    write_episode(Episode(
+        id=episode_id, session_id="s", started_at="2024-01-01T00:00:00",
+        ended_at="2024-01-01T00:10:00", end_trigger="stop_hook", embedding=embedding
+    ))
+    update_episode_index({"id": episode_id, "goal_summary": summary})
+
+
+class TestHybridSearch:
+    def test_rank_fusion(self):
+        a, b, c = {"id": "a"}, {"id": "b"}, {"id": "c"}
+        fused = reciprocal_rank_fusion([[(a, 9.0), (b, 5.0)], [(b, 0.9), (c, 0.8)]], rrf_k=1)
+        # b: 1/3 + 1/2, a: 1/2, c: 1/3; normalized by 2 * 1/2
+        assert [(e["id"], round(score, 3)) for e, score in fused] == [
+            ("b", 0.833), ("a", 0.5), ("c", 0.333)
+        ]
+
+    def test_fuses_keyword_and_vector_results(self, sophia_dir):
+        add_episode("ep_words", "Restart the web server", embedding=[0.0, 1.0])
+        add_episode("ep_vector", "Bounce nginx", embedding=[1.0, 0.0])
+        add_episode("ep_plain", "Restart server cron")  # No embedding yet
+
+        with patch('lib.retrieval.embed_text', return_value=[1.0, 0.1]):
+            results, methods = hybrid_search("restart server", k=3)
+            assert methods == ["keyword", "semantic"]
+            assert {e["id"] for e, _ in results} == {"ep_words", "ep_vector", "ep_plain"}
+
+            results = search_episodes("restart server", k=3, mode="hybrid")
+            assert results[0]["search_method"] == "keyword+semantic"
+            assert [r["episode_id"] for r in search_episodes("restart", mode="semantic")][0] == "ep_vector"
+
+    def test_slow_vector_side_falls_back_to_keywords(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server", embedding=[1.0, 0.0])
+
+        def slow_embed(*args, **kwargs):
+            time.sleep(0.5)
+            return [1.0, 0.0]
+
+        with patch('lib.retrieval.embed_text', side_effect=slow_embed):
+            start = time.monotonic()
+            results, methods = hybrid_search("restart", budget_ms=50)
+            assert time.monotonic() - start < 0.3
+        assert methods == ["keyword"]
+        assert results == bm25_search("restart")
+
+    def test_budget_is_provider_timeout(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server", embedding=[1.0, 0.0])
+        with patch('lib.retrieval.embed_text', return_value=[1.0, 0.0]) as embed:
+            hybrid_search("restart", budget_ms=250)
+        assert embed.call_args.kwargs["timeout"] == 0.25
+
+    def test_abandoned_vector_side_does_not_delay_exit(self, tmp_path):
+        # A provider slower than the budget must not keep the process alive
+        script = textwrap.dedent(f"""
+            import sys, time
+            from unittest.mock import patch
+            sys.path.insert(0, {str(Path(__file__).parent.parent)!r})
+            from lib import retrieval, storage
+            from tests.test_retrieval import add_episode
+
+            def slow_embed(*args, **kwargs):
+                time.sleep(10)
+
+            with patch('lib.storage.get_sophia_dir', return_value=storage.Path({str(tmp_path)!r})):
+                storage.ensure_sophia_dir()
+                add_episode("ep_1", "Restart the web server", embedding=[1.0, 0.0])
+                with patch('lib.retrieval.embed_text', side_effect=slow_embed):
+                    start = time.monotonic()
+                    retrieval.hybrid_search("restart", budget_ms=300)
+                    print(time.monotonic() - start)
+        """)
+        start = time.monotonic()
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=30)
+        wall = time.monotonic() - start
+        assert result.returncode == 0, result.stderr
+        assert float(result.stdout) < 0.6
+        # Interpreter start-up and imports, plus the 300ms budget
+        assert wall < 3.0
+
+    def test_default_mode_follows_configured_provider(self, sophia_dir):
+        assert default_search_mode() == "keyword"
+        storage.save_config({"embedding_provider": "openai"})
+        assert default_search_mode() == "hybrid"
+        with patch.dict('lib.retrieval.RETRIEVAL_CONFIG', {"search_mode": "semantic"}):
+            assert default_search_mode() == "semantic"
+
+    def test_without_embeddings_matches_keyword_mode(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server")
+        add_episode("ep_2", "Restart cron")
+        with patch('lib.retrieval.embed_text', return_value=None):
+            assert search_episodes("restart web", mode="hybrid") == [
+                {**r, "search_method": "keyword"}
+                for r in search_episodes("restart web", mode="keyword")
+            ]
+
+
+class TestQueryCache:
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self):
+        clear_query_cache()
+        yield
+        clear_query_cache()
+
+    def test_repeated_queries_hit(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server")
+        first = search_episodes("Restart  Server", mode="keyword")
+        assert search_episodes("restart server", mode="keyword") == first
+        assert keyword_search("server restart") == keyword_search("restart server")
+
+        stats = cache_stats()
+        assert (stats["hits"], stats["misses"]) == (2, 2)
+        assert stats["hit_rate"] == 0.5
+
+    def test_writes_change_the_generation(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server")
+        generation = storage.index_generation()
+        assert [e["id"] for e, _ in keyword_search("restart")] == ["ep_1"]
+
+        add_episode("ep_2", "Restart cron")
+        assert storage.index_generation() != generation
+        assert [e["id"] for e, _ in keyword_search("restart")] == ["ep_2", "ep_1"]
+        assert cache_stats()["hits"] == 0
+
+    def test_shared_through_file(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server")
+        results = search_episodes("restart", mode="keyword")
+        assert (sophia_dir / "query_cache.json").exists()
+
+        clear_query_cache()  # As if another process asked
+        assert search_episodes("restart", mode="keyword") == results
+        assert cache_stats()["file_hits"] == 1
+
+    def test_entries_expire(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server")
+        with patch.object(query_cache._cache, 'ttl_seconds', 0):
+            keyword_search("restart")
+            clear_query_cache()
+            keyword_search("restart")
+        assert cache_stats()["hits"] == 0
+
+    def test_results_are_copies(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server")
+        keyword_search("restart")[0][0]["goal_summary"] = "changed"
+        assert keyword_search("restart")[0][0]["goal_summary"] == "Restart the web server"
+        assert cache_stats()["hits"] == 1
+
+    def test_vector_modes_keyed_on_embedding_model(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server", embedding=[1.0, 0.0])
+        provider = CountingProvider()
+        with patch.object(EmbeddingManager, 'get_provider', return_value=provider), \
+                patch('lib.retrieval.embed_text', return_value=[1.0, 0.0]) as embed:
+            search_episodes("restart", mode="semantic")
+            search_episodes("restart", mode="semantic")
+            assert embed.call_count == 1
+            provider.model = "m2"
+            search_episodes("restart", mode="semantic")
+            assert embed.call_count == 2
+
+    def test_timed_out_hybrid_results_not_cached(self, sophia_dir):
+        add_episode("ep_1", "Restart the web server", embedding=[1.0, 0.0])
+
+        def slow_embed(*args, **kwargs):
+            time.sleep(0.5)
+            return [1.0, 0.0]
+
+        with patch('lib.retrieval.embed_text', side_effect=slow_embed), \
+                patch.dict('lib.retrieval.RETRIEVAL_CONFIG', {"hybrid_budget_ms": 50}):
+            assert search_episodes("restart", mode="hybrid")[0]["search_method"] == "keyword"
+        assert cache_stats()["entries"] == 0
+        assert not (sophia_dir / "query_cache.json").exists()
+
+
+class TestFilteredSearch:
+    @pytest.fixture
+    def entries(self, sophia_dir):
+        now = datetime.now()
+        for episode_id, outcome, days, tools in [
+            ("ep_old_fail", "FAILURE", 60, ["Bash"]),
+            ("ep_fail_read", "FAILURE", 3, ["Read"]),
+            ("ep_success", "SUCCESS", 2, ["Bash"]),
+            ("ep_fail_bash", "FAILURE", 1, ["Bash", "Edit"]),
+        ]:
+            update_episode_index({
+                "id": episode_id, "goal_summary": "Deploy the docker app", "outcome": outcome,
+                "timestamp": (now - timedelta(days=days)).isoformat(), "tools": tools,
+                "session_id": f"s_{episode_id}",
+            })
+        return now
+
+    def test_filters_intersect(self, entries):
+        filters = {"outcome": "FAILURE", "since": entries - timedelta(days=30), "tools": ["bash"]}
+        assert [e["id"] for e, _ in keyword_search("deploy", filters=filters)] == ["ep_fail_bash"]
+        assert [e["id"] for e, _ in bm25_search("deploy", filters=filters)] == ["ep_fail_bash"]
+        assert [r["episode_id"] for r in search_episodes("deploy", mode="keyword", filters=filters)] == \
+            ["ep_fail_bash"]
+
+        # Without a query, newest first
+        assert [e["id"] for e in filter_episodes({"outcome": ["FAILURE"]})] == \
+            ["ep_fail_bash", "ep_fail_read", "ep_old_fail"]
+        assert [e["id"] for e in filter_episodes({"session_id": "s_ep_success"})] == ["ep_success"]
+        assert filter_episodes({"until": entries - timedelta(days=90)}) == []
+
+    def test_only_selected_entries_are_scored(self, entries):
+        from lib import retrieval
+        scored = []
+        original = retrieval._bm25f_score
+
+        def counting_score(frequencies, *args):
+            scored.append(frequencies)
+            return original(frequencies, *args)
+
+        with patch('lib.retrieval._bm25f_score', side_effect=counting_score):
+            bm25_search("deploy docker", filters={"tools": "edit"})
+        assert len(scored) == 1
+
+    def test_cached_per_filter(self, entries):
+        with patch.object(query_cache, "_enabled", True):
+            assert len(keyword_search("deploy")) == 4
+            assert len(keyword_search("deploy", filters={"outcome": "SUCCESS"})) == 1
+
+    def test_archived_entries_and_segments(self, sophia_dir):
+        now = datetime.now()
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 1}):
+            for i, days in enumerate([400, 20, 10, 0]):
+                update_episode_index({
+                    "id": f"ep_{i}", "goal_summary": "Configure nginx", "outcome": "FAILURE",
+                    "timestamp": (now - timedelta(days=days)).isoformat(),
+                })
+            compact_episode_index()
+
+            filters = {"since": now - timedelta(days=30), "until": now - timedelta(days=5)}
+            read_files, tracking = tracking_reads()
+            with tracking:
+                results = keyword_search("nginx", k=10, include_archive=True, filters=filters)
+            assert [e["id"] for e, _ in results] == ["ep_2", "ep_1"]
+            # The segment holding only the year-old entry is never read
+            assert "seg_000001.json" not in read_files
+
+            assert [e["id"] for e in filter_episodes(filters, include_archive=True)] == ["ep_2", "ep_1"]
+
+    def test_missing_outcome_is_unknown_live_and_archived(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}):
+            update_episode_index({"id": "ep_old", "goal_summary": "Configure nginx"})
+            update_episode_index({"id": "ep_new", "goal_summary": "Configure nginx"})
+            compact_episode_index()
+
+            filters = {"outcome": "UNKNOWN"}
+            assert [e["id"] for e in filter_episodes(filters, include_archive=True)] == \
+                ["ep_new", "ep_old"]
+            assert [e["id"] for e, _ in keyword_search("nginx", include_archive=True, filters=filters)] == \
+                ["ep_new", "ep_old"]
+
+    def test_semantic_scores_only_selected_vectors(self, sophia_dir):
+        add_episode("ep_close", "Bounce nginx", embedding=[1.0, 0.0])
+        add_episode("ep_far", "Restart server", embedding=[0.0, 1.0])
+        update_episode_index({"id": "ep_far", "goal_summary": "Restart server", "outcome": "SUCCESS"})
+
+        results = semantic_search("x", query_embedding=[1.0, 0.0], filters={"outcome": "SUCCESS"})
+        assert [e["id"] for e, _ in results] == ["ep_far"]
+        assert semantic_search("x", query_embedding=[1.0, 0.0], filters={"outcome": "PARTIAL"}) == []
+
+    def test_backfill_legacy_entries(self, sophia_dir):
+        write_episode(Episode(
+            id="ep_1", session_id="sess_a", started_at="2024-01-01T00:00:00",
+            ended_at="2024-01-01T00:10:00", end_trigger="stop_hook",
+            actions=[{"tool": "Bash"}, {"tool": "Read"}, {"tool": "Bash"}]
+        ))
+        update_episode_index({"id": "ep_1", "goal_summary": "Deploy"})
+        update_episode_index({"id": "ep_2", "goal_summary": "Deploy"})
+        assert filter_episodes({"tools": "read"}) == []
+
+        assert backfill_index_fields() == 1
+        entries = filter_episodes({"tools": "read", "session_id": "sess_a"})
+        assert [(e["id"], e["tools"]) for e in entries] == [("ep_1", ["Bash", "Read"])]
+        # Replaced in place: ep_2 stays newest
+        assert [e["id"] for e in storage.get_episode_index()["entries"]] == ["ep_2", "ep_1"]
+
+    def test_invalid_filters(self, sophia_dir):
+        with pytest.raises(ValueError):
+            keyword_search("deploy", filters={"domain": "web"})
+        with pytest.raises(ValueError):
+            search_episodes("deploy", filters={"since": "last tuesday"})
+
+
+class TestFuzzySearch:
+    def test_trigram_similarity(self):
+        index = TrigramIndex()
+        vocabulary = {"kubernetes", "kubectl", "authentication", "docker"}
+        assert index.sync(vocabulary) == 4
+
+        matches = index.similar("kubernets", 0.5, 5)
+        assert [token for token, _ in matches] == ["kubernetes"]
+        assert 0.5 < matches[0][1] < 1.0
+        assert [t for t, _ in index.similar("authentification", 0.5, 5)] == ["authentication"]
+        # Syncing drops tokens gone from the vocabulary and indexes new ones once
+        assert index.sync({"docker", "kubernetis"}) == 1
+        assert [t for t, _ in index.similar("kubernets", 0.5, 5)] == ["kubernetis"]
+        assert len(index) == 2
+        index.discard("kubernetis")
+        assert index.similar("kubernets", 0.5, 5) == []
+        assert set(index.postings) == {"  d", " do", "doc", "ock", "cke", "ker", "er "}
+
+    def test_trigrams_follow_vocabulary(self):
+        terms = InvertedIndex.build([{"id": "ep_1", "goal_summary": "Configure nginx"}])
+        assert terms.fuzzy_matches("nginxx", 0.3, 3)[0][0] == "nginx"
+
+        # Maintained by add and remove: lookups don't resync
+        with patch.object(TrigramIndex, 'sync', side_effect=AssertionError):
+            terms.add({"id": "ep_2", "goal_summary": "Tune postgres"})
+            assert terms.fuzzy_matches("postgress", 0.3, 3)[0][0] == "postgres"
+            terms.add({"id": "ep_1", "goal_summary": "Configure caddy"})
+            assert terms.fuzzy_matches("nginxx", 0.3, 3) == []
+            assert "nginx" not in terms.trigrams and "caddy" in terms.trigrams
+
+    def test_misspelled_tokens_match(self, sophia_dir):
+        update_episode_index({"id": "ep_k8s", "goal_summary": "Deploy to kubernetes cluster"})
+        update_episode_index({"id": "ep_auth", "goal_summary": "Fix authentication flow",
+                              "outcome": "SUCCESS"})
+        update_episode_index({"id": "ep_docs", "goal_summary": "Deploy docs site"})
+
+        results = keyword_search("kubernets deploy")
+        assert [e["id"] for e, _ in results] == ["ep_k8s", "ep_docs"]
+        # A fuzzy match counts its similarity, below an exact match
+        assert 0.75 < results[0][1] < 1.0
+        assert results[0][1] < keyword_search("kubernetes deploy")[0][1]
+
+        assert [e["id"] for e, _ in bm25_search("authentification")] == ["ep_auth"]
+        assert [r["episode_id"] for r in search_episodes("authentification", mode="keyword")] == ["ep_auth"]
+
+    def test_known_and_short_tokens_match_exactly(self, sophia_dir):
+        update_episode_index({"id": "ep_1", "goal_summary": "Rotate nginx logs"})
+        update_episode_index({"id": "ep_2", "goal_summary": "Rotate nginx log"})
+
+        assert [e["id"] for e, _ in keyword_search("logs")] == ["ep_1"]
+        assert keyword_search("lgo") == []
+        with patch.dict('lib.retrieval.RETRIEVAL_CONFIG', {"fuzzy_threshold": 0}):
+            assert keyword_search("nginz") == []
+
+    def test_trigram_index_updated_incrementally(self, sophia_dir):
+        update_episode_index({"id": "ep_1", "goal_summary": "Configure nginx"})
+        keyword_search("nginxx")
+        trigrams = storage.get_keyword_index().terms.trigrams
+        indexed = len(trigrams)
+
+        update_episode_index({"id": "ep_2", "goal_summary": "Tune postgres"})
+        assert [e["id"] for e, _ in keyword_search("postgress")] == ["ep_2"]
+        # The reloaded keyword index kept the trigram index and added the new tokens
+        assert storage.get_keyword_index().terms.trigrams is trigrams
+        assert len(trigrams) == indexed + 2
+
+    def test_archived_entries_match_live_vocabulary(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 2}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 1}):
+            update_episode_index({"id": "ep_old", "goal_summary": "Tune postgres"})
+            update_episode_index({"id": "ep_live", "goal_summary": "Upgrade postgres"})
+            update_episode_index({"id": "ep_new", "goal_summary": "Write docs"})
+            compact_episode_index()
+
+            results = keyword_search("postgress", include_archive=True)
+            assert [e["id"] for e, _ in results] == ["ep_live", "ep_old"]
+
+    def test_fuzzy_expansions_credited_once(self, sophia_dir):
+        with patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}):
+            # Archived with the misspelling itself, next to its expansion
+            update_episode_index({"id": "ep_old", "goal_summary": "postgress " * 20,
+                                  "keywords": ["postgres"] * 20})
+            update_episode_index({"id": "ep_live", "keywords": ["postgres"] * 20,
+                                  "goal_summary": "postgres postgresql postgre" + " tuning" * 17})
+            compact_episode_index()
+
+            results = bm25_search("postgress", k=10, include_archive=True)
+            assert [e["id"] for e, _ in results] == ["ep_old", "ep_live"]
+            assert all(0 < score <= 1.0 for _, score in results)
+            assert all(0 < score <= 1.0 for _, score in
+                       keyword_search("postgress", k=10, include_archive=True))
+
+
+class TestScoreColumns:
+    @pytest.fixture
+    def entries(self):
+        rng = random.Random(0)
+        now = datetime.now()
+        entries = []
+        for i in range(300):
+            age = timedelta(days=rng.choice([0, 6, 7, 29, 30, 400]), seconds=rng.randint(-5, 5))
+            timestamp = rng.choice([
+                (now - age).isoformat(),
+                (datetime.now(timezone.utc) - age).isoformat(),
+                (datetime.now(timezone.utc) - age).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "not a date", None,
+            ])
+            entries.append({
+                "id": f"ep_{i}", "timestamp": timestamp,
+                "outcome": rng.choice(["SUCCESS", "FAILURE", None]),
+                "heuristics_count": rng.choice([0, 1, 3]),
+                "consolidated": rng.random() < 0.3,
+            })
+        return entries, [rng.random() for _ in entries]
+
+    @pytest.mark.parametrize("use_numpy", [True, False])
+    def test_matches_compute_retrieval_score(self, entries, use_numpy):
+        if use_numpy and np is None:
+            pytest.skip("requires numpy")
+        entries, similarities = entries
+        expected = [compute_retrieval_score(e, s) for e, s in zip(entries, similarities)]
+
+        columns = ScoreColumns.from_entries(entries)
+        rows = list(range(len(entries)))
+        with patch.object(score_columns, '_numpy', score_columns._numpy if use_numpy else lambda: None):
+            assert columns.score(rows, similarities) == expected
+            # Row subsets, as re-ranking uses them
+            assert columns.score(rows[::-7], similarities[::-7]) == expected[::-7]
+
+    def test_candidates_inside_and_outside_the_index(self, sophia_dir):
+        update_episode_index({
+            "id": "ep_live", "goal_summary": "Restart server", "outcome": "SUCCESS",
+            "heuristics_count": 2, "timestamp": datetime.now().isoformat()
+        })
+        live = storage.get_keyword_index().entries["ep_live"]
+        archived = {"id": "ep_old", "timestamp": "2020-01-01T00:00:00", "consolidated": True}
+
+        for matches in ([(live, 0.5)], [(live, 0.5), (archived, 0.9)]):
+            assert score_candidates(matches) == [compute_retrieval_score(e, s) for e, s in matches]
+
+
+class CountingProvider(EmbeddingProvider):
+    """Deterministic provider recording the texts it was asked to embed."""
+
+    name = "test"
+
+    def __init__(self, model="m1"):
+        self.model = model
+        self.calls = []
+
+    @property
+    def model_id(self):
+        return self.model
+
+    @property
+    def available(self):
+        return True
+
+    def embed(self, text):
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts):
+        self.calls.append(list(texts))
+        return [[len(t) / 3, 0.1, float(sum(map(ord, t)) % 7)] for t in texts]
+
+
+class TestEmbeddingCache:
+    @pytest.fixture
+    def provider(self, sophia_dir):
+        provider = CountingProvider()
+        with patch.object(EmbeddingManager, 'get_provider', return_value=provider):
+            yield provider
+
+    def test_only_misses_reach_the_provider(self, provider):
+        manager = EmbeddingManager()
+        first = manager.embed_batch(["deploy app", "fix tests", "deploy app"])
+        assert provider.calls == [["deploy app", "fix tests"]]
+        assert first[0] == first[2]
+
+        # Normalized whitespace hits; only the new text is sent
+        second = manager.embed_batch(["fix  tests", "deploy app", "rotate logs"])
+        assert provider.calls[1:] == [["rotate logs"]]
+        assert second[:2] == [first[1], first[0]]
+        assert manager.embed("rotate logs") == second[2]
+        assert len(provider.calls) == 2
+
+        stats = embedding_cache_stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 4, 3)
+        assert stats["hit_rate"] == 3 / 7
+
+    def test_keyed_on_provider_model(self, provider):
+        EmbeddingManager().embed("deploy app")
+        provider.model = "m2"
+        EmbeddingManager().embed("deploy app")
+        assert provider.calls == [["deploy app"], ["deploy app"]]
+
+    def test_float32_blobs(self, provider, sophia_dir):
+        computed = EmbeddingManager().embed("deploy app")
+        # Misses come back as hits will: rounded to float32
+        assert computed[1] == array('f', [0.1])[0] != 0.1
+        assert EmbeddingManager().embed("deploy app") == computed
+
+        conn = sqlite3.connect(str(sophia_dir / "embedding_cache.db"))
+        try:
+            blobs = [row[0] for row in conn.execute("SELECT vector FROM embeddings")]
+        finally:
+            conn.close()
+        assert [len(blob) for blob in blobs] == [3 * 4]
+
+    def test_lru_eviction(self, sophia_dir):
+        cache = EmbeddingCache(sophia_dir / "cache.db", max_entries=2)
+        cache.put_many([("a", [1.0]), ("b", [2.0])])
+        time.sleep(0.01)
+        assert cache.get_many(["a"]) == [[1.0]]  # a is now more recent than b
+        time.sleep(0.01)
+        cache.put_many([("c", [3.0])])
+
+        assert len(cache) == 2
+        assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+    def test_disabled(self, provider):
+        with patch.dict('lib.embedding_cache.EMBEDDING_CONFIG', {"cache": False}):
+            EmbeddingManager().embed("deploy app")
+            EmbeddingManager().embed("deploy app")
+        assert len(provider.calls) == 2
+
+
+@pytest.mark.skipif(np is None, reason="requires numpy")
+class TestTopKSimilar:
+    @pytest.fixture
+    def vectors(self):
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((200, 16)).astype(np.float32)
+        matrix[7] = 0  # Zero rows score 0
+        return matrix, [f"ep_{i}" for i in range(200)]
+
+    def test_matches_pure_python(self, vectors):
+        matrix, ids = vectors
+        query = matrix[3] + 0.1
+
+        expected = sorted(
+            ((i, cosine_similarity(list(query), list(row))) for i, row in zip(ids, matrix)),
+            key=lambda x: x[1], reverse=True
+        )[:5]
+        results = top_k_similar(query, matrix, ids, k=5)
+        assert [i for i, _ in results] == [i for i, _ in expected]
+        assert results[0][0] == "ep_3"
+        assert results[0][1] == pytest.approx(expected[0][1], abs=1e-5)
+
+        with patch('lib.embeddings._numpy', return_value=None):
+            fallback = top_k_similar(query, matrix.tolist(), ids, k=5)
+        assert [i for i, _ in fallback] == [i for i, _ in expected]
+
+    def test_prenormalized_rows(self, vectors):
+        matrix, ids = vectors
+        query = matrix[42]
+        plain = top_k_similar(query, matrix, ids, k=3)
+        normalized = top_k_similar(query, normalize_rows(matrix), ids, k=3, normalized=True)
+        assert [i for i, _ in normalized] == [i for i, _ in plain]
+        assert normalized[0][1] == pytest.approx(1.0, abs=1e-5)
+        assert not np.isnan(normalize_rows(matrix)[7]).any()
+
+    def test_degenerate_queries(self, vectors):
+        matrix, ids = vectors
+        assert top_k_similar(np.zeros(16), matrix, ids) == []
+        assert top_k_similar(np.ones(8), matrix, ids) == []
+        assert len(top_k_similar(np.ones(16), matrix, ids, k=500)) == 200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
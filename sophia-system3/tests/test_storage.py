@@ -6,19 +6,44 @@ import pytest
 import tempfile
 import shutil
 import os
+import json
 from pathlib import Path
 from datetime import datetime
 from unittest.mock import patch
 
 import sys
-sys.path.insert(0, str(Path(__file__).parent.parent / "lib"))
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from storage import (
+from lib.storage import (
     get_sophia_dir, ensure_sophia_dir, read_json, write_json,
     get_config, save_config, get_self_model, save_self_model,
-    sophia_exists
+    sophia_exists, get_store, write_episode, read_episode,
+    get_episode_index, update_episode_index, get_semantic_rules,
+    add_semantic_rule, migrate_to_sqlite, compact_episode_index,
+    iter_archived_entries, read_cache_stats, clear_read_cache,
+    set_read_cache_enabled, read_episodes, compress_existing_data,
+    get_vector_store, rebuild_vector_store, batch_writes, save_agent_result,
+    update_self_model, update_semantic_rules, get_semantic_rules_version,
+    save_semantic_rules, update_stats, VersionConflictError
 )
-from models import SelfModel
+from lib import codec, compression, storage, vector_store
+from lib.models import SelfModel, Episode, SemanticRule
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def make_episode(episode_id: str, **kwargs) -> Episode:
+    return Episode(
+        id=episode_id,
+        session_id="session",
+        started_at=datetime.now(),
+        ended_at=datetime.now(),
+        end_trigger="stop_hook",
+        **kwargs
+    )
 
 
 class TestReadWriteJson:
@@ -48,10 +73,68 @@ class TestReadWriteJson:
         result = read_json(file_path)
         assert result["version"] == 2
 
+    def test_reads_legacy_pretty_files(self, tmp_path):
+        file_path = tmp_path / "legacy.json"
+        file_path.write_text(json.dumps({"entries": [{"id": "ep_1"}]}, indent=2))
+
+        assert read_json(file_path) == {"entries": [{"id": "ep_1"}]}
+
+    def test_compact_format_per_file_type(self, tmp_path):
+        write_json(tmp_path / "episode.json", {"a": [1, 2]}, file_type="episode")
+        write_json(tmp_path / "config.json", {"a": [1, 2]})
+
+        assert (tmp_path / "episode.json").read_text() == '{"a":[1,2]}'
+        assert "\n" in (tmp_path / "config.json").read_text()
+
+    def test_codecs_interoperate(self, tmp_path):
+        ts = datetime(2024, 1, 1, 12, 0)
+        data = {"ts": ts, "path": Path("/tmp/x"), "text": "caf\u00e9", "n": [1.5, None], "b": True}
+        expected = json.loads(json.dumps({**data, "ts": "2024-01-01T12:00:00"}, default=str))
+
+        for writer in codec.available_codecs():
+            for reader in codec.available_codecs():
+                for pretty in (True, False):
+                    raw = writer.dumps(data, pretty=pretty)
+                    assert reader.loads(raw) == expected, (writer.name, reader.name)
+
+    def test_codecs_write_parseable_datetimes(self):
+        ts = datetime(2024, 1, 1, 12, 0)
+        for c in codec.available_codecs():
+            value = c.loads(c.dumps({"ts": ts}))["ts"]
+            assert datetime.fromisoformat(value) == ts, c.name
+
+
+class TestDurability:
+    @pytest.mark.parametrize("mode,syncs", [
+        ("none", 0), ("fsync-file", 1), ("fsync-file+dir", 2)
+    ])
+    def test_fsyncs_per_mode(self, tmp_path, mode, syncs):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"durability": mode})
+            with patch('lib.storage.os.fsync') as fsync:
+                save_agent_result("task_1", {"ok": True})
+            assert fsync.call_count == syncs
+
+    def test_batch_defers_directory_flushes(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"durability": "fsync-file+dir"})
+            with patch('lib.storage.os.fsync') as fsync:
+                with batch_writes():
+                    save_self_model(SelfModel(agent_id="batched"))
+                    for i in range(3):
+                        save_agent_result(f"task_{i}", {"i": i})
+                    with batch_writes():
+                        save_agent_result("task_0", {"i": 0})
+                    # Visible immediately; each file fsynced before its rename
+                    assert get_self_model().agent_id == "batched"
+                    assert fsync.call_count == 5
+            # Then the root and agent_results directories, once each
+            assert fsync.call_count == 7
+
 
 class TestConfig:
     def test_get_config_defaults(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             config = get_config()
 
             assert config["schema_version"] == "1.0.0"
@@ -59,7 +142,7 @@ class TestConfig:
             assert config["guardian_tier3_enabled"] is True
 
     def test_save_and_get_config(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             tmp_path.mkdir(parents=True, exist_ok=True)
 
             save_config({"custom_key": "custom_value"})
@@ -71,14 +154,14 @@ class TestConfig:
 
 class TestSelfModel:
     def test_get_default_self_model(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             model = get_self_model()
 
             assert model.agent_id == "sophia-system3"
             assert len(model.terminal_creed) == 5
 
     def test_save_and_get_self_model(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             tmp_path.mkdir(parents=True, exist_ok=True)
 
             model = SelfModel(
@@ -92,9 +175,90 @@ class TestSelfModel:
             assert loaded.identity_goal == "Test goal"
 
 
+class TestOptimisticUpdates:
+    def test_save_bumps_version(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            model = SelfModel()
+            save_self_model(model)
+            save_self_model(model)
+            assert model.version == 2
+            assert get_self_model().version == 2
+
+    def test_concurrent_save_reruns_mutate(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_self_model(SelfModel())
+            calls = []
+
+            def mutate(model):
+                calls.append(model.version)
+                if len(calls) == 1:
+                    # Another writer saves between our read and our write
+                    other = get_self_model()
+                    other.identity_goal = "Theirs"
+                    save_self_model(other)
+                model.knowledge_gaps.append("Mine")
+
+            before = update_stats()["self_model"]
+            model = update_self_model(mutate)
+
+            assert calls == [1, 2]
+            loaded = get_self_model()
+            assert loaded.identity_goal == "Theirs"
+            assert loaded.knowledge_gaps[-1] == "Mine"
+            assert loaded.version == model.version == 3
+            after = update_stats()["self_model"]
+            assert after["conflicts"] - before["conflicts"] == 1
+            assert after["updates"] - before["updates"] == 1
+
+    def test_gives_up_after_max_retries(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            def always_conflict(model):
+                save_self_model(get_self_model())
+
+            with pytest.raises(VersionConflictError):
+                update_self_model(always_conflict, max_retries=2)
+
+    def test_rules_keep_both_writers(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ensure_sophia_dir()
+            add_semantic_rule(SemanticRule(trigger_concept="Git", rule_content="Pull first"))
+            assert get_semantic_rules_version() == 1
+
+            def mutate(rules):
+                if len(rules) == 1:
+                    add_semantic_rule(SemanticRule(trigger_concept="Docker", rule_content="Check daemon"))
+                return [r for r in rules if r.trigger_concept != "Git"]
+
+            rules = update_semantic_rules(mutate)
+            assert [r.trigger_concept for r in rules] == ["Docker"]
+            assert [r.trigger_concept for r in get_semantic_rules()] == ["Docker"]
+            assert get_semantic_rules_version() == 3
+            # The rules file itself is still a plain list
+            assert isinstance(read_json(tmp_path / "semantic_rules.json"), list)
+
+    def test_sqlite_backend(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"storage_backend": "sqlite"})
+            save_self_model(SelfModel())
+
+            def mutate(model):
+                if model.version == 1:
+                    save_self_model(get_self_model())
+                model.identity_goal = "Updated"
+
+            assert update_self_model(mutate).version == 3
+            assert get_self_model().identity_goal == "Updated"
+
+            save_semantic_rules([SemanticRule(trigger_concept="Git", rule_content="Pull first")])
+            update_semantic_rules(lambda rules: rules.append(
+                SemanticRule(trigger_concept="Docker", rule_content="Check daemon")))
+            assert len(get_semantic_rules()) == 2
+            assert get_semantic_rules_version() == 2
+
+
 class TestEnsureSophiaDir:
     def test_creates_structure(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             result = ensure_sophia_dir()
 
             assert result == tmp_path
@@ -105,7 +269,7 @@ class TestEnsureSophiaDir:
             assert (tmp_path / "episodes" / "index.json").exists()
 
     def test_idempotent(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             ensure_sophia_dir()
             ensure_sophia_dir()
 
@@ -113,13 +277,443 @@ class TestEnsureSophiaDir:
             assert (tmp_path / "episodes").is_dir()
 
 
+class TestReadEpisodes:
+    def test_keeps_order_and_reports_failures(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            for i in range(5):
+                write_episode(make_episode(f"ep_{i}"))
+            (tmp_path / "episodes" / "ep_bad.json").write_text("{not json")
+            write_json(tmp_path / "episodes" / "ep_invalid.json", {"id": "ep_invalid"})
+
+            batch = read_episodes(["ep_3", "ep_missing", "ep_0", "ep_bad", "ep_invalid", "ep_4"])
+
+            assert [e.id for e in batch.episodes] == ["ep_3", "ep_0", "ep_4"]
+            assert batch.missing == ["ep_missing"]
+            assert batch.corrupt == ["ep_bad", "ep_invalid"]
+
+    def test_process_pool_validation(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ids = [f"ep_{i}" for i in range(6)]
+            for episode_id in ids:
+                write_episode(make_episode(episode_id))
+
+            batch = read_episodes(list(reversed(ids)), use_processes=True)
+            assert [e.id for e in batch.episodes] == list(reversed(ids))
+
+
+class TestProjectedEpisodes:
+    def test_projection_loads_heavy_fields_lazily(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            write_episode(make_episode(
+                "ep_1", heuristics=["Check logs"],
+                actions=[{"tool": "Bash"}], embedding=[0.1, 0.2]
+            ))
+
+            episode = read_episode("ep_1", fields=["heuristics", "error_analysis"])
+            assert episode.id == "ep_1"
+            assert episode.heuristics == ["Check logs"]
+            assert episode.error_analysis is None
+            assert "actions" not in episode.loaded_fields
+
+            assert episode.actions == [{"tool": "Bash"}]
+            assert "embedding" in episode.loaded_fields
+
+    def test_projection_missing_and_unknown_fields(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            assert read_episode("ep_none", fields=["heuristics"]) is None
+            with pytest.raises(ValueError):
+                read_episode("ep_none", fields=["no_such_field"])
+
+    def test_projection_with_sqlite_backend(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"storage_backend": "sqlite"})
+            write_episode(make_episode("ep_1", keywords=["docker"]))
+
+            episode = read_episode("ep_1", fields=["keywords", "error_analysis"])
+            assert episode.keywords == ["docker"]
+            assert episode.session_id == "session"
+
+
+class TestEpisodeIndexLog:
+    def test_append_does_not_rewrite_snapshot(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ensure_sophia_dir()
+            index_path = tmp_path / "episodes" / "index.json"
+            before = index_path.read_text()
+
+            update_episode_index({"id": "ep_1"})
+            update_episode_index({"id": "ep_2"})
+
+            assert index_path.read_text() == before
+            assert [e["id"] for e in get_episode_index()["entries"]] == ["ep_2", "ep_1"]
+
+    def test_compaction_folds_log_and_caps(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path), \
+                patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 3}):
+            ensure_sophia_dir()
+            for i in range(5):
+                update_episode_index({"id": f"ep_{i}"})
+
+            assert compact_episode_index() == 5
+            assert (tmp_path / "episodes" / "index.log.jsonl").stat().st_size == 0
+
+            index = get_episode_index()
+            assert [e["id"] for e in index["entries"]] == ["ep_4", "ep_3", "ep_2"]
+            assert [e["id"] for e in iter_archived_entries()] == ["ep_1", "ep_0"]
+
+    def test_same_id_replaces_entry(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ensure_sophia_dir()
+            update_episode_index({"id": "ep_1", "consolidated": False})
+            update_episode_index({"id": "ep_2"})
+            compact_episode_index()
+            update_episode_index({"id": "ep_1", "consolidated": True})
+
+            entries = get_episode_index()["entries"]
+            assert [e["id"] for e in entries] == ["ep_2", "ep_1"]
+            assert entries[1]["consolidated"] is True
+
+    def test_background_compaction_past_threshold(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"index_log_compact_bytes": 1}):
+            ensure_sophia_dir()
+            update_episode_index({"id": "ep_1"})
+            storage._compaction_thread.join()
+
+            assert read_json(tmp_path / "episodes" / "index.json")["total_episodes"] == 1
+
+
+class TestSegmentedArchive:
+    def test_sealed_segments_are_never_rewritten(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path), \
+                patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 2}), \
+                patch.dict('lib.storage.STORAGE_CONFIG', {"archive_segment_size": 3}):
+            ensure_sophia_dir()
+            archive_dir = tmp_path / "episodes" / "archive"
+            for i in range(6):
+                update_episode_index({"id": f"ep_{i}"})
+            compact_episode_index()
+
+            segment = archive_dir / "seg_000001.json"
+            assert [e["id"] for e in read_json(segment)] == ["ep_2", "ep_1", "ep_0"]
+            sealed_mtime = segment.stat().st_mtime_ns
+
+            for i in range(6, 9):
+                update_episode_index({"id": f"ep_{i}"})
+            compact_episode_index()
+
+            assert segment.stat().st_mtime_ns == sealed_mtime
+            assert [e["id"] for e in iter_archived_entries()] == [
+                "ep_6", "ep_5", "ep_4", "ep_3", "ep_2", "ep_1", "ep_0"
+            ]
+
+    def test_imports_legacy_year_archives(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path), \
+                patch.dict('lib.storage.MEMORY_CONFIG', {"max_index_entries": 1}):
+            ensure_sophia_dir()
+            legacy = tmp_path / "episodes" / "index_archive_2024.json"
+            write_json(legacy, [{"id": "ep_a"}, {"id": "ep_b"}])
+            update_episode_index({"id": "ep_c"})
+            update_episode_index({"id": "ep_d"})
+            compact_episode_index()
+
+            assert not legacy.exists()
+            assert [e["id"] for e in iter_archived_entries()] == ["ep_c", "ep_b", "ep_a"]
+
+
+class TestReadCache:
+    def test_repeat_reads_hit_cache(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ensure_sophia_dir()
+            update_episode_index({"id": "ep_1"})
+            clear_read_cache()
+
+            get_episode_index()
+            misses = read_cache_stats()["misses"]
+            get_episode_index()
+
+            stats = read_cache_stats()
+            assert stats["misses"] == misses
+            assert stats["hits"] > 0
+
+    def test_external_write_invalidates(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_self_model(SelfModel(agent_id="first"))
+            assert get_self_model().agent_id == "first"
+
+            # Another process rewrites the file behind our back
+            path = tmp_path / "self_model.json"
+            data = read_json(path)
+            data["agent_id"] = "second-writer"
+            path.write_text(json.dumps(data))
+
+            assert get_self_model().agent_id == "second-writer"
+
+    def test_returned_objects_are_copies(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"custom": 1})
+            get_config()["custom"] = 2
+            get_self_model().knowledge_gaps.append("mutated")
+
+            assert get_config()["custom"] == 1
+            assert get_self_model().knowledge_gaps == []
+
+    def test_bypass(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            set_read_cache_enabled(False)
+            try:
+                get_config()
+                get_config()
+                assert read_cache_stats()["hits"] == 0
+            finally:
+                set_read_cache_enabled(True)
+
+
+class TestCompression:
+    @pytest.mark.parametrize("method", ["gzip", "zstd"])
+    def test_compressed_episodes_read_transparently(self, tmp_path, method):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"compression": method})
+            write_episode(make_episode("ep_1", keywords=["docker"], actions=[{"tool": "Bash"}]))
+
+            raw = (tmp_path / "episodes" / "ep_1.json").read_bytes()
+            assert compression.detect(raw) == compression.resolve_method(method)
+            assert read_episode("ep_1").actions == [{"tool": "Bash"}]
+            assert read_episode("ep_1", fields=["keywords"]).keywords == ["docker"]
+            assert [e.id for e in read_episodes(["ep_1"]).episodes] == ["ep_1"]
+
+    def test_uncompressed_types_stay_plain(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"compression": "gzip"})
+            add_semantic_rule(SemanticRule(trigger_concept="Git", rule_content="Pull first"))
+            json.loads((tmp_path / "semantic_rules.json").read_text())
+
+    def test_corrupt_compressed_file_reads_as_default(self, tmp_path):
+        path = tmp_path / "bad.json"
+        path.write_bytes(compression.GZIP_MAGIC + b"garbage")
+        assert read_json(path, "default") == "default"
+
+    def test_compress_existing_data_in_place(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ensure_sophia_dir()
+            write_episode(make_episode("ep_1", heuristics=["Check logs"] * 50))
+            archive_dir = tmp_path / "episodes" / "archive"
+            write_json(archive_dir / "open.json", [{"id": "ep_0"}], file_type="archive")
+            log_path = tmp_path / "logs" / "guardian_blocks.jsonl"
+            log_path.write_text('{"blocked": "rm -rf /"}\n')
+
+            counts = compress_existing_data("gzip")
+            assert counts["episodes"] == 1
+            assert counts["archives"] == 1
+            assert counts["logs"] == 1
+            assert counts["bytes_after"] < counts["bytes_before"]
+            assert get_config()["compression"] == "gzip"
+
+            assert read_episode("ep_1").heuristics == ["Check logs"] * 50
+            assert list(iter_archived_entries()) == [{"id": "ep_0"}]
+            assert not log_path.exists()
+            rotated = list((tmp_path / "logs").glob("guardian_blocks.*.jsonl.gz"))
+            assert compression.decompress(rotated[0].read_bytes()) == b'{"blocked": "rm -rf /"}\n'
+
+            # Already compressed files are skipped; "none" restores plain JSON
+            assert compress_existing_data()["episodes"] == 0
+            assert compress_existing_data("none")["episodes"] == 1
+            json.loads((tmp_path / "episodes" / "ep_1.json").read_text())
+
+
+class TestVectorSidecar:
+    def test_embedding_moves_to_sidecar(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            write_episode(make_episode("ep_1", embedding=[0.5, 0.25, 1.0]))
+
+            assert read_json(tmp_path / "episodes" / "ep_1.json")["embedding"] is None
+            assert get_vector_store().ids() == ["ep_1"]
+            assert read_episode("ep_1").embedding == [0.5, 0.25, 1.0]
+            assert read_episode("ep_1", fields=["embedding"]).embedding == [0.5, 0.25, 1.0]
+            assert read_episodes(["ep_1"]).episodes[0].embedding == [0.5, 0.25, 1.0]
+
+    def test_rewrite_and_dimension_mismatch(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            write_episode(make_episode("ep_1", embedding=[1.0, 0.0]))
+            write_episode(make_episode("ep_1", embedding=[0.0, 1.0]))
+            write_episode(make_episode("ep_2", embedding=[1.0, 0.0, 0.0]))
+
+            assert get_vector_store().ids() == ["ep_1"]
+            assert read_episode("ep_1").embedding == [0.0, 1.0]
+            # Kept inline when the sidecar can't take it
+            assert read_json(tmp_path / "episodes" / "ep_2.json")["embedding"] == [1.0, 0.0, 0.0]
+
+    @pytest.mark.parametrize("use_numpy", [True, False])
+    def test_search(self, tmp_path, use_numpy):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            write_episode(make_episode("ep_x", embedding=[1.0, 0.0]))
+            write_episode(make_episode("ep_y", embedding=[0.0, 1.0]))
+            write_episode(make_episode("ep_xy", embedding=[1.0, 1.0]))
+
+            numpy_module = vector_store._numpy() if use_numpy else None
+            with patch('lib.vector_store._numpy', return_value=numpy_module):
+                results = get_vector_store().search([1.0, 0.1], k=2)
+            assert [i for i, _ in results] == ["ep_x", "ep_xy"]
+            assert results[0][1] == pytest.approx(0.995, abs=1e-3)
+
+    @pytest.mark.skipif(np is None, reason="requires numpy")
+    def test_overwritten_row_rescored(self, tmp_path):
+        store = vector_store.VectorStore(tmp_path / "vectors")
+        store.add("a", [0.1, 0.0])
+        store.add("b", [0.0, 1.0])
+        store.search([1.0, 0.0], k=2)  # Caches the row norms
+        store.add("a", [10.0, 0.0])
+
+        for searcher in (store, vector_store.VectorStore(tmp_path / "vectors")):
+            results = searcher.search([1.0, 0.0], k=2)
+            assert results[0] == ("a", pytest.approx(1.0))
+            assert all(score <= 1.0 + 1e-6 for _, score in results)
+
+    def test_rebuild_from_episodes(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            episodes_dir = tmp_path / "episodes"
+            # Written before the sidecar existed
+            legacy = make_episode("ep_old", embedding=[0.0, 1.0]).model_dump(mode='json')
+            write_json(episodes_dir / "ep_old.json", legacy, file_type="episode")
+            write_episode(make_episode("ep_new", embedding=[1.0, 0.0]))
+            write_episode(make_episode("ep_gone", embedding=[1.0, 1.0]))
+            (episodes_dir / "ep_gone.json").unlink()
+
+            counts = rebuild_vector_store()
+            assert counts == {"vectors": 2, "episodes_stripped": 1}
+            assert sorted(get_vector_store().ids()) == ["ep_new", "ep_old"]
+            assert read_json(episodes_dir / "ep_old.json")["embedding"] is None
+            assert read_episode("ep_old").embedding == [0.0, 1.0]
+
+
+def clustered_vectors(rows: int, dim: int = 16, clusters: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    labels = rng.integers(0, clusters, rows)
+    return (centers[labels] + 0.1 * rng.standard_normal((rows, dim))).astype("float32")
+
+
+@pytest.mark.skipif(np is None, reason="requires numpy")
+class TestANNIndex:
+    @pytest.fixture
+    def store(self, tmp_path):
+        matrix = clustered_vectors(2000)
+        store = vector_store.VectorStore(tmp_path / "vectors")
+        store.rebuild((f"ep_{i}", row) for i, row in enumerate(matrix.tolist()))
+        return store, matrix
+
+    def test_recall_against_brute_force(self, store):
+        store, matrix = store
+        assert store.train_ann(nlist=20) == 20
+
+        hits = total = 0
+        with patch.dict('lib.vector_store.ANN_CONFIG', {"min_vectors": 1}):
+            for row in matrix[:50] + 0.05:
+                exact = {i for i, _ in store.search(row, k=10, exact=True)}
+                approx = store.search(row, k=10, nprobe=3)
+                hits += len(exact & {i for i, _ in approx})
+                total += 10
+        assert hits / total >= 0.9
+
+    def test_untrained_or_small_store_is_exact(self, store):
+        store, matrix = store
+        with patch('lib.ann_index.IVFIndex.search') as ivf_search:
+            store.search(matrix[0], k=5)
+            store.train_ann(nlist=20)
+            store.search(matrix[0], k=5)  # Below min_vectors
+        ivf_search.assert_not_called()
+
+    def test_inserts_are_assigned_incrementally(self, store):
+        store, matrix = store
+        store.train_ann(nlist=20)
+        new = matrix[5] * 1.01
+        store.add("ep_new", list(new))
+        # Overwritten rows move to their new cluster
+        store.add("ep_0", list(matrix[1]))
+
+        assignments = np.fromfile(store.ann.assign_path, dtype="<i4")
+        assert len(assignments) == 2001
+        assert assignments[2000] == assignments[5]
+        assert assignments[0] == assignments[1]
+
+        with patch.dict('lib.vector_store.ANN_CONFIG', {"min_vectors": 1}):
+            results = store.search(new, k=2, nprobe=1)
+        assert {i for i, _ in results} == {"ep_5", "ep_new"}
+
+    def test_fresh_store_drops_the_index(self, store):
+        store, matrix = store
+        store.train_ann(nlist=20)
+        # An unreadable store starts over with the next vector
+        store.meta_path.unlink()
+        store = vector_store.VectorStore(store.directory)
+        store.add("ep_new", list(matrix[0]))
+
+        assert not store.ann.trained
+        assert not store.ann.assign_path.exists()
+        assert not store.ann.centroids_path.exists()
+        assert store.ids() == ["ep_new"]
+
+    def test_build_ann_index_only_if_stale(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path), \
+                patch.dict('lib.storage.ANN_CONFIG', {"min_vectors": 10}):
+            matrix = clustered_vectors(40)
+            get_vector_store().rebuild((f"ep_{i}", row) for i, row in enumerate(matrix[:20].tolist()))
+
+            assert storage.build_ann_index(only_if_stale=True)["clusters"] > 0
+            assert storage.build_ann_index(only_if_stale=True)["clusters"] == 0
+            for i, row in enumerate(matrix[20:]):
+                get_vector_store().add(f"ep_{20 + i}", list(row))
+            assert storage.build_ann_index(only_if_stale=True) == {"clusters": 25, "vectors": 40}
+
+
+class TestSQLiteBackend:
+    def test_routes_public_functions(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            save_config({"storage_backend": "sqlite"})
+            assert get_store() is not None
+
+            write_episode(make_episode("ep_1", goal_summary="Deploy app"))
+            update_episode_index({"id": "ep_1", "goal_summary": "Deploy app"})
+            update_episode_index({"id": "ep_2", "goal_summary": "Fix tests"})
+            add_semantic_rule(SemanticRule(trigger_concept="Docker", rule_content="Check daemon"))
+            save_self_model(SelfModel(agent_id="sqlite-agent"))
+
+            assert read_episode("ep_1").goal_summary == "Deploy app"
+            assert read_episodes(["ep_1", "ep_x"]).missing == ["ep_x"]
+            assert [e["id"] for e in get_episode_index()["entries"]] == ["ep_2", "ep_1"]
+            assert get_semantic_rules()[0].trigger_concept == "Docker"
+            assert get_self_model().agent_id == "sqlite-agent"
+            assert not (tmp_path / "episodes" / "ep_1.json").exists()
+
+    def test_migrate_existing_tree(self, tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
+            ensure_sophia_dir()
+            write_episode(make_episode("ep_old"))
+            write_episode(make_episode("ep_new"))
+            update_episode_index({"id": "ep_old"})
+            update_episode_index({"id": "ep_new"})
+            add_semantic_rule(SemanticRule(trigger_concept="Git", rule_content="Pull first"))
+            save_self_model(SelfModel(agent_id="migrated"))
+
+            counts = migrate_to_sqlite()
+            assert counts["episodes"] == 2
+            assert get_config()["storage_backend"] == "sqlite"
+
+            # Re-running must not duplicate anything
+            migrate_to_sqlite()
+            assert [e["id"] for e in get_episode_index()["entries"]] == ["ep_new", "ep_old"]
+            assert len(get_semantic_rules()) == 1
+            assert get_self_model().agent_id == "migrated"
+            assert read_episode("ep_old") is not None
+
+
 class TestSophiaExists:
     def test_not_exists(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path / "nonexistent"):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path / "nonexistent"):
             assert sophia_exists() is False
 
     def test_exists(self, tmp_path):
-        with patch('storage.get_sophia_dir', return_value=tmp_path):
+        with patch('lib.storage.get_sophia_dir', return_value=tmp_path):
             tmp_path.mkdir(parents=True, exist_ok=True)
             (tmp_path / "self_model.json").write_text("{}")
 